@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+from aiohttp import web
+from bs4 import BeautifulSoup
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from parse import (
+    HTML_PARSER,
+    parse_document,
+    parse_links,
+    extract_keywords,
+    extract_category,
+    get_product_data
+)
+
+
+#Def load_saved_pages
+def load_saved_pages(pages_dir):
+    """Load saved HTML pages from a mirrored directory (e.g. `wget -x`).
+    The path relative to pages_dir is used as the page URL, so product URL patterns still match.
+    """
+    root = Path(pages_dir)
+    pages = []
+    for path in sorted(root.rglob("*.htm*")):
+        url = "https://" + path.relative_to(root).as_posix()
+        pages.append((url, path.read_text(encoding="utf-8", errors="replace")))
+    return pages
+
+#Def legacy_pipeline
+def legacy_pipeline(url, html):
+    """The page pipeline as it was before parse_document: every stage builds its own tree."""
+    def content_check(html):
+        soup = BeautifulSoup(html, "html.parser")
+        return len(' '.join(soup.stripped_strings)) > 100
+
+    # fetch_url and worker both checked the content
+    content_check(html)
+    content_check(html)
+
+    # parse_links
+    soup = BeautifulSoup(html, 'html.parser')
+    links = [a['href'] for a in soup.find_all('a', href=True)]
+
+    # process_page metadata
+    soup = BeautifulSoup(html, 'html.parser')
+    text = " ".join(BeautifulSoup(html, 'html.parser').stripped_strings).lower()
+    keywords = Counter(re.findall(r'\b[a-z]{3,}\b', text)).most_common(20)
+    category = extract_category(soup)
+    product_data = get_product_data(url, soup)
+    return links, keywords, category, product_data
+
+#Def single_parse_pipeline
+def single_parse_pipeline(url, html, parser=None):
+    """The current page pipeline: one parse, every stage reads the shared document."""
+    doc = parse_document(url, html, parser)
+    len(doc.text) > 100
+    links = parse_links(doc.soup, url)
+    keywords = extract_keywords(doc.text)
+    category = extract_category(doc.soup)
+    product_data = get_product_data(url, doc.soup)
+    return links, keywords, category, product_data
+
+#Def time_pipeline
+def time_pipeline(pipeline, pages, repeat):
+    """Run a pipeline over all pages `repeat` times and return milliseconds per page."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url, html in pages:
+            pipeline(url, html)
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000 / (len(pages) * repeat)
+
+#Def bench_parse
+def bench_parse(args):
+    """Compare the legacy multi-parse pipeline with the single-parse pipeline on saved pages."""
+    pages = load_saved_pages(args.pages)
+    if not pages:
+        print(f"No .html pages found under {args.pages}")
+        return
+
+    results = {
+        "legacy (html.parser x5)": time_pipeline(legacy_pipeline, pages, args.repeat),
+        "single parse (html.parser)": time_pipeline(lambda u, h: single_parse_pipeline(u, h, "html.parser"), pages, args.repeat),
+    }
+    if HTML_PARSER != "html.parser":
+        results[f"single parse ({HTML_PARSER})"] = time_pipeline(single_parse_pipeline, pages, args.repeat)
+
+    baseline = results["legacy (html.parser x5)"]
+    print(f"{len(pages)} pages x {args.repeat} runs")
+    for name, ms in results.items():
+        print(f"{name:<32} {ms:8.2f} ms/page  {baseline / ms:5.2f}x")
+
+
+#####################################
+#Synthetic site and crawl benchmark
+#####################################
+
+WORDS = "alpha beta gamma delta epsilon zeta theta kappa lambda sigma omega book novel story poem travel history".split()
+
+#Def page_path
+def page_path(i, options):
+    """Path of synthetic page i: the home page, a product page or a category listing."""
+    if i == 0:
+        return "/"
+    if i % 100 < options["product_ratio"] * 100:
+        return f"/catalogue/book_{i}/index.html"
+    return f"/catalogue/category/cat_{i}/index.html"
+
+#Def page_rng
+def page_rng(i, options):
+    """Deterministic random source of page i, so every run serves the same site."""
+    return random.Random(options["seed"] * 1_000_003 + i)
+
+#Def synthetic_page
+def synthetic_page(i, options):
+    """Return (status, body) of synthetic page i. Errors and oversized bodies are decided per page."""
+    rng = page_rng(i, options)
+    if i and rng.random() < options["error_rate"]:
+        return 500, "<html><body>Internal error</body></html>"
+
+    links = []
+    # A chain through every page keeps the whole site reachable, the rest is random fan-out
+    for j in [i + 1] + [rng.randrange(options["pages"]) for _ in range(options["fanout"])]:
+        if j >= options["pages"]:
+            continue
+        href = f"/go/{j}" if rng.random() < options["redirect_rate"] else page_path(j, options)
+        links.append(f'<a href="{href}">page {j}</a>')
+
+    text = " ".join(rng.choice(WORDS) for _ in range(200))
+    if i and rng.random() < options["oversized_rate"]:
+        text += " padding" * (options["oversized_bytes"] // 8)
+
+    path = page_path(i, options)
+    if path.startswith("/catalogue/book_"):
+        category = f"Category {i % 10}"
+        body = f"""<html><body>
+<ul class="breadcrumb"><li><a href="/">Home</a></li><li><a href="/catalogue/category/books_1/index.html">Books</a></li><li><a href="{page_path(0, options)}">{category}</a></li><li class="active">Book {i}</li></ul>
+<div class="item active"><img src="/media/{i}.jpg"/></div>
+<h1>Book {i}</h1><p class="price_color">£{rng.randint(5, 60)}.{rng.randint(0, 99):02d}</p>
+<p class="instock availability">In stock ({rng.randint(1, 30)} available)</p><p class="star-rating Three"></p>
+<p>{text}</p>{"".join(links)}</body></html>"""
+    else:
+        body = f"<html><body><h1>Listing {i}</h1><p>{text}</p>{''.join(links)}</body></html>"
+    return 200, body
+
+#Def build_synthetic_app
+def build_synthetic_app(options):
+    """aiohttp application serving the synthetic site with injected latency."""
+    async def delay(i):
+        if options["latency_ms"]:
+            await asyncio.sleep(options["latency_ms"] / 1000 * page_rng(-i - 1, options).uniform(0.5, 1.5))
+
+    async def page(request):
+        path = request.path
+        if path == "/":
+            i = 0
+        else:
+            match = re.search(r"_(\d+)/index\.html$", path)
+            if not match:
+                raise web.HTTPNotFound()
+            i = int(match.group(1))
+        if i >= options["pages"] or page_path(i, options) != path:
+            raise web.HTTPNotFound()
+        await delay(i)
+        status, body = synthetic_page(i, options)
+        return web.Response(status=status, text=body, content_type="text/html")
+
+    async def redirect(request):
+        i = int(request.match_info["i"])
+        raise web.HTTPMovedPermanently(page_path(i, options))
+
+    async def robots(request):
+        return web.Response(text="User-agent: *\nDisallow: /private/\n")
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots)
+    app.router.add_get("/go/{i}", redirect)
+    app.router.add_get("/{tail:.*}", page)
+    return app
+
+#Def serve_synthetic_site
+def serve_synthetic_site(port, options):
+    """Process target: serve the synthetic site until terminated."""
+    web.run_app(build_synthetic_app(options), host="127.0.0.1", port=port, print=None, access_log=None)
+
+#Def free_port
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+#Def wait_for_port
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Synthetic site did not start on port {port}")
+
+#Def git_revision
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#Def cpu_seconds
+def cpu_seconds():
+    """User + system CPU of this process and its reaped children (the parse pool)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+#Def run_crawl
+def run_crawl(config, workdir):
+    """Run main.main with `config` inside workdir and return its measurements."""
+    # The log files are opened in the working directory
+    os.chdir(workdir)
+    import main as crawler_main
+    from log_utils import setup_loggers
+
+    setup_loggers(config.get("logging_level", "INFO"), config.get("log_format", "text"))
+    ctx = crawler_main.build_context(config)
+
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    asyncio.run(crawler_main.main(ctx, resume=False))
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_before
+
+    pages = ctx.metrics.total("crawler_pages_total")
+    latency = ctx.metrics.stages.get("fetch_to_commit")
+    with sqlite3.connect(config["database_path"]) as conn:
+        products = conn.execute('SELECT COUNT(*) FROM Products').fetchone()[0]
+    return {
+        "pages": pages,
+        "fetches": ctx.fetches_finished,
+        "products": products,
+        "products_per_1000_fetches": round(products * 1000 / ctx.fetches_finished, 1) if ctx.fetches_finished else None,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        "fetch_to_commit_p50": round(latency.quantile(0.5), 4) if latency else None,
+        "fetch_to_commit_p99": round(latency.quantile(0.99), 4) if latency else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "cpu_ms_per_page": round(cpu * 1000 / pages, 3) if pages else None,
+        "bytes": ctx.metrics.total("crawler_bytes_total"),
+        "skipped": ctx.metrics.total("crawler_skipped_total"),
+        "retries": ctx.metrics.total("crawler_retries_total"),
+    }
+
+#Def bench_crawl
+def bench_crawl(args):
+    """Crawl a local synthetic site end to end and save the measurements as JSON."""
+    options = {
+        "pages": args.pages,
+        "fanout": args.fanout,
+        "product_ratio": args.product_ratio,
+        "latency_ms": args.latency_ms,
+        "error_rate": args.error_rate,
+        "redirect_rate": args.redirect_rate,
+        "oversized_rate": args.oversized_rate,
+        "oversized_bytes": args.oversized_bytes,
+        "seed": args.seed,
+    }
+    port = args.port or free_port()
+    output = os.path.abspath(args.output)
+
+    with open(args.config) as f:
+        config = json.load(f)
+    workdir = tempfile.mkdtemp(prefix="crawl-bench-")
+    config.update(
+        seed_url=f"http://127.0.0.1:{port}/",
+        database_path=os.path.join(workdir, "bench.sqlite"),
+        delay_range=[0, 0],
+        crawl_depth_limit=None,
+        output_format="sqlite",
+        use_playwright=False,
+        use_sitemaps=False,
+        metrics_port=None,
+        max_pages=args.max_pages,
+    )
+    # Baseline for the best-first frontier: every priority 0, plain FIFO
+    if args.fifo:
+        config.update(priority_weights={}, priority_aging=0)
+
+    server = multiprocessing.get_context("spawn").Process(target=serve_synthetic_site, args=(port, options), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        results = run_crawl(config, workdir)
+    finally:
+        server.terminate()
+        server.join()
+
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "site": options,
+        "config": {key: config.get(key) for key in ("batch_size", "parse_workers", "max_concurrent_per_domain", "db_batch_size", "seen_index",
+                                                     "max_pages", "priority_weights", "priority_aging")},
+        "results": results,
+    }
+
+    # Results accumulate in one JSON list, one entry per run
+    history = []
+    if os.path.exists(output):
+        with open(output) as f:
+            history = json.load(f)
+    history.append(entry)
+    with open(output, "w") as f:
+        json.dump(history, f, indent=2)
+
+    for key, value in results.items():
+        print(f"{key:<22} {value}")
+    print(f"Saved to {output} (work dir {workdir})")
+
+
+def cli_main():
+    """Parse benchmark CLI arguments and run the selected benchmark."""
+    parser = argparse.ArgumentParser(description='Crawler benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parse_parser = subparsers.add_parser('parse', help='Before/after benchmark of the page parsing pipeline')
+    parse_parser.add_argument('pages', type=str, help='Directory of saved HTML pages')
+    parse_parser.add_argument('--repeat', type=int, default=3, help='Number of passes over the pages')
+    parse_parser.set_defaults(func=bench_parse)
+
+    crawl_parser = subparsers.add_parser('crawl', help='End-to-end crawl of a local synthetic site')
+    crawl_parser.add_argument('--pages', type=int, default=2000, help='Number of pages on the synthetic site')
+    crawl_parser.add_argument('--fanout', type=int, default=10, help='Random links per page')
+    crawl_parser.add_argument('--product-ratio', type=float, default=0.8, help='Share of product pages')
+    crawl_parser.add_argument('--latency-ms', type=float, default=5.0, help='Mean injected response latency')
+    crawl_parser.add_argument('--error-rate', type=float, default=0.01, help='Share of pages answering HTTP 500')
+    crawl_parser.add_argument('--redirect-rate', type=float, default=0.02, help='Share of links going through a 301')
+    crawl_parser.add_argument('--oversized-rate', type=float, default=0.01, help='Share of pages with an oversized body')
+    crawl_parser.add_argument('--oversized-bytes', type=int, default=2_000_000, help='Size of an oversized body')
+    crawl_parser.add_argument('--seed', type=int, default=1, help='Site generator seed')
+    crawl_parser.add_argument('--max-pages', type=int, default=None, help='Page budget of the crawl (config max_pages)')
+    crawl_parser.add_argument('--fifo', action='store_true', help='Crawl in FIFO order instead of best first')
+    crawl_parser.add_argument('--port', type=int, default=0, help='Port of the synthetic site (0 picks a free one)')
+    crawl_parser.add_argument('--config', type=str, default='config.json', help='Crawler config to start from')
+    crawl_parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON file the results are appended to')
+    crawl_parser.set_defaults(func=bench_crawl)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,124 @@
+import asyncio
+
+from playwright.async_api import async_playwright
+
+
+# Resource types never downloaded while rendering: we only need the DOM
+DEFAULT_BLOCKED_RESOURCES = ("image", "font", "media", "stylesheet")
+
+
+class BrowserPool:
+    """
+    One headless Chromium with a fixed set of reusable contexts and pages for dynamic fetches.
+
+    `contexts` contexts hold `pages_per_context` pages each, so at most that many renders
+    run at once; up to `queue_size` more callers wait for a page and the rest are held
+    back before entering the queue. Blocked resource types are aborted by a route on
+    every context. A page is replaced after `recycle_after` renders (or an error),
+    which keeps the browser's memory bounded. The browser starts on first use.
+    """
+
+    def __init__(self, user_agent=None, contexts=2, pages_per_context=2, queue_size=8,
+                 blocked_resources=DEFAULT_BLOCKED_RESOURCES, wait_until="domcontentloaded",
+                 wait_selector=None, timeout=15000, recycle_after=100, logger=None):
+        self.user_agent = user_agent
+        self.context_count = contexts
+        self.pages_per_context = pages_per_context
+        self.blocked_resources = frozenset(blocked_resources)
+        self.wait_until = wait_until
+        self.wait_selector = wait_selector
+        self.timeout = timeout
+        self.recycle_after = recycle_after
+        self.logger = logger
+
+        self.size = contexts * pages_per_context
+        self._admission = asyncio.Semaphore(self.size + queue_size)
+        self._pages = asyncio.Queue()
+        self._start_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._contexts = []
+        self._closed = False
+
+    async def _start(self):
+        async with self._start_lock:
+            if self._browser is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            for _ in range(self.context_count):
+                context = await self._browser.new_context(user_agent=self.user_agent)
+                if self.blocked_resources:
+                    await context.route("**/*", self._route)
+                self._contexts.append(context)
+                for _ in range(self.pages_per_context):
+                    self._pages.put_nowait((context, await context.new_page(), 0))
+            if self.logger:
+                self.logger.info(f"Browser pool started: {self.context_count} contexts x {self.pages_per_context} pages")
+
+    async def _route(self, route):
+        if route.request.resource_type in self.blocked_resources:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def render(self, url):
+        """Return the rendered HTML of `url`, or None when rendering failed."""
+        if self._closed:
+            return None
+        async with self._admission:
+            if self._browser is None:
+                try:
+                    await self._start()
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"Could not start the browser pool: {e}")
+                    return None
+
+            context, page, uses = await self._pages.get()
+            healthy = True
+            try:
+                await page.goto(url, wait_until=self.wait_until, timeout=self.timeout)
+                if self.wait_selector:
+                    await page.wait_for_selector(self.wait_selector, timeout=self.timeout)
+                return await page.content()
+            except Exception as e:
+                healthy = False
+                if self.logger:
+                    self.logger.error(f"Playwright failed to fetch {url}: {e}")
+                return None
+            finally:
+                await self._release(context, page, uses + 1, healthy)
+
+    async def _release(self, context, page, uses, healthy):
+        """Give the page back to the pool, replacing it when it failed or was used too often."""
+        if self._closed:
+            return
+        if healthy and uses < self.recycle_after:
+            self._pages.put_nowait((context, page, uses))
+            return
+        try:
+            await page.close()
+        except Exception:
+            pass
+        try:
+            self._pages.put_nowait((context, await context.new_page(), 0))
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Could not replace browser page: {e}")
+
+    async def close(self):
+        """Close every page and context, then the browser and Playwright itself."""
+        self._closed = True
+        if self._browser is None:
+            return
+        for context in self._contexts:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        await self._browser.close()
+        await self._playwright.stop()
+        self._browser = None
+        if self.logger:
+            self.logger.info("Browser pool closed")
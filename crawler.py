@@ -1,163 +1,197 @@
 import asyncio
 import logging
 import random
+import time
 
 from urllib.parse import urlparse
 
-from db import (
-    insert_url_and_get_id,
-    insert_link_relationship,
-    insert_category,
-    insert_keywords,
-    insert_product,
-    get_url_id,
-    save_to_db
-)
+from db import save_alias, save_to_db, save_revisit
+from log_utils import SAMPLED
+from recrawl import revisit_fields
 
 from parse import (
-    normalize_url,
-    is_allowed_domain,
-    url_allowed,
-    parse_links,
-    extract_keywords,
-    compute_hash,
-    get_product_data,
-    extract_category,
     should_skip_url,
     process_page
 )
 
 from fetch_utility import (
-    fetch_static,
-    fetch_dynamic,
     fetch_url,
-    looks_like_content,
-    now
+    looks_like_content
 )
 
-def setup_loggers():
-    """Sets up a general logger, a skipped logger and an error logger, with corresponding handlers and levels."""
-    # General logger
-    logging.basicConfig(
-        filename='crawler.log',
-        filemode='a',
-        format='%(asctime)s %(levelname)s: %(message)s',
-        level=logging.INFO
-    )
-
-    # Error logger
-    error_logger = logging.getLogger('error_logger')
-    error_handler = logging.FileHandler('crawler_errors.log')
-    error_handler.setLevel(logging.ERROR)
-    error_logger.setLevel(logging.ERROR)
-    error_formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
-    error_handler.setFormatter(error_formatter)
-    error_logger.addHandler(error_handler)
-    error_logger.propagate = False
-
-    # Skipped pages logger
-    skipped_logger = logging.getLogger('skipped_logger')
-    skipped_handler = logging.FileHandler('skipped_pages.log')
-    skipped_handler.setLevel(logging.INFO)
-    skipped_formatter = logging.Formatter('%(asctime)s SKIPPED: %(message)s')
-    skipped_handler.setFormatter(skipped_formatter)
-    skipped_logger.addHandler(skipped_handler)
-    skipped_logger.propagate = False
-
-    # Return for use
-    logger = logging.getLogger() 
-    return logger, error_logger, skipped_logger
-
+log = logging.getLogger("crawler")
 
 ######################################################
 
 #Def enqueue_url
-async def enqueue_url(queue, url, depth):
+async def enqueue_url(queue, url, depth, priority=0.0):
     """
-    Add a URL with its crawl depth to the async queue for processing.
+    Add a URL with its crawl depth to the frontier for processing (highest priority first).
 
     """
-    print(f"Enqueueing URL: {url} at depth {depth}")
-    await queue.put((url, depth))
+    log.debug("Enqueueing URL: %s at depth %d", url, depth, extra=SAMPLED)
+    await queue.put((url, depth), priority=priority)
 
 #Def dequeue_url
 async def dequeue_url(queue):
     """
-    Retrieve a URL and its depth from the queue, with a timeout to avoid blocking indefinitely.
+    Retrieve a URL and its depth from the frontier, with a timeout to avoid blocking indefinitely.
 
     """
     try:
         url, depth = await asyncio.wait_for(queue.get(), timeout=3)
-        print(f"Dequeued URL from local queue: {url} at depth {depth}")
+        log.debug("Dequeued URL from frontier: %s at depth %d", url, depth, extra=SAMPLED)
         return url, depth
     except asyncio.TimeoutError:
         #print("Asyncio Error")
         return None, None
     
+#Def politeness_delay
+def politeness_delay(ctx, host):
+    """
+    Seconds to wait between two requests to the same host: a random pick in
+    delay_range, raised to the robots.txt Crawl-delay when there is one.
+    """
+    delay = 0.0
+    if ctx.rules["delay_min"] is not None and ctx.rules["delay_max"] is not None:
+        delay = random.uniform(ctx.rules["delay_min"], ctx.rules["delay_max"])
+
+    if ctx.robots is not None:
+        crawl_delay = ctx.robots.crawl_delay(host)
+        if crawl_delay:
+            # Each of the shards of a multi-process crawl takes its turn
+            delay = max(delay, crawl_delay * (ctx.shards.count if ctx.shards is not None else 1))
+
+    return delay
+
+#Def load_host_rules
+def load_host_rules(ctx, host, url):
+    """
+    Scheduler hook: the robots.txt fetch of a host whose rules aren't cached yet,
+    so its Crawl-delay applies from the first request on; None when nothing is missing.
+    """
+    if ctx.robots is None or ctx.robots.peek(host) is not None:
+        return None
+    return ctx.robots.get(url)
+
 # Worker coroutine
 async def worker(session, url_queue, ctx):
 
-    """Continuously fetch and process URLs from the queue."""
+    """Continuously fetch and process URLs handed out by the politeness scheduler."""
     
     while True:
 
-        currenturl, currentdepth = await dequeue_url(url_queue)
+        currenturl, currentdepth = await dequeue_url(ctx.scheduler)
 
         if currenturl is None:
             ctx.logger.info("Queue is empty, waiting for new URLs...")
             await asyncio.sleep(1)
             continue
 
+        # Page budget spent: stop here, the URLs still claimed go back to the queue when the frontier closes
+        if ctx.rules["max_pages"] and ctx.fetches_started >= ctx.rules["max_pages"]:
+            return
+        ctx.fetches_started += 1
+
         skip_reason = None
-        html = None
+        fetch = None
+        page = None
+        requeued = False
+        started = time.monotonic()
 
         try:
-            # Skip based on rules and DB date checking
+            # Skip based on include/exclude and robots rules
             skip, reason = await should_skip_url(currenturl, ctx)
             if skip:
+                ctx.scheduler.refund(urlparse(currenturl).netloc)
                 ctx.logger.info(f"Skipped {currenturl}: {reason}")
+                ctx.metrics.inc("crawler_skipped_total", reason=reason)
                 #print(f"Url skipped, {reason}")
                 continue
     
             # Fetch page
             else:
                 domain = urlparse(currenturl).netloc
-                semaphore = ctx.semaphores[domain]
-
-                async with semaphore:
-                    html = await fetch_url(ctx, session, currenturl)
-                    print("HTML fetched length:", len(html) if html else "None")
-
-                # Optional delay
-                if ctx.rules["delay_min"] is not None and ctx.rules["delay_max"] is not None:
-                    await asyncio.sleep(random.uniform(ctx.rules["delay_min"], ctx.rules["delay_max"]))
+                limiter = ctx.limiters[domain]
+
+                async with limiter:
+                    fetch, page = await fetch_url(ctx, session, currenturl)
+                    log.debug("HTML fetched length for %s: %s", currenturl, page.html_length if page else None, extra=SAMPLED)
+
+                # Throttled (429/503): the host is paused and the slot is free; the URL waits in the frontier
+                if fetch and fetch.retry_after is not None:
+                    attempts = ctx.throttled.get(currenturl, 0) + 1
+                    if attempts < ctx.rules["retries"]:
+                        ctx.throttled[currenturl] = attempts
+                        url_queue.defer(currenturl, time.time() + fetch.retry_after)
+                        requeued = True
+                        continue
+                    skip_reason = f"HTTP {fetch.status} after {attempts} attempts"
+
+                # Unchanged since the last crawl: refresh the revisit schedule only
+                if fetch and fetch.not_modified:
+                    ctx.logger.info(f"Not modified: {currenturl}")
+                    ctx.metrics.inc("crawler_not_modified_total")
+                    await save_revisit(ctx, currenturl, revisit_fields(ctx.rules, ctx.revisits.get(currenturl), fetch))
+                    continue
 
                 # Validate content using fetch utility
-                if not looks_like_content(html):
+                if not skip_reason and not looks_like_content(page):
                     skip_reason = "Fetch failed, empty, or too short content"
                     ctx.logger.info(f"Skipped {currenturl}, {skip_reason})")
 
             if skip_reason:
                 ctx.skipped_logger.info(f"Skipped {currenturl}: {skip_reason}")
                 ctx.logger.info(f"{currenturl} | Reason: {skip_reason}")
+                ctx.metrics.inc("crawler_skipped_total", reason=skip_reason)
                 await asyncio.sleep(0) 
                 continue
 
+            # Near-duplicate of a page already crawled: only record which one, nothing is extracted
+            if page.duplicate_of:
+                ctx.logger.info(f"Near-duplicate: {currenturl} of {page.duplicate_of}")
+                ctx.metrics.inc("crawler_near_duplicates_total")
+                await save_alias(ctx, currenturl, page.duplicate_of,
+                                 fetch=revisit_fields(ctx.rules, ctx.revisits.get(currenturl), fetch), started=started)
+                continue
+
             # Page is valid; process content:
             # Parse links: get links and metadata for valid URLs
-            to_enqueue, link_pairs, soup, keywords, category, product_data = process_page(ctx, currenturl, html, currentdepth)
+            with ctx.metrics.time("process"):
+                to_enqueue, link_pairs, keywords, category, product_data = process_page(ctx, page, currentdepth)
                         
-            # DB writes in a single lock
-            inserted_ids = await save_to_db(ctx, currenturl, to_enqueue, link_pairs, product_data, category, keywords)
-
-            # Enqueue outside lock (non-blocking db lock) 
+            # DB writes are batched by the writer task (this only waits when its queue is full)
+            with ctx.metrics.time("save"):
+                await save_to_db(ctx, currenturl, to_enqueue, link_pairs, product_data, category, keywords,
+                                 fetch=revisit_fields(ctx.rules, ctx.revisits.get(currenturl), fetch), started=started,
+                                 simhash=page.simhash, text=page.text)
+            ctx.metrics.inc("crawler_pages_total")
+
+            # Enqueue only links never enqueued or fetched before; another shard's links are sent to it.
+            # A link to a URL already queued here counts as an inlink and may raise its priority
             for normalized_link, next_depth in to_enqueue:
-                
-                print(f"Inserted URL {normalized_link} with id={inserted_ids.get(normalized_link)}")
-
-                await enqueue_url(url_queue, normalized_link, next_depth)
+                owned = ctx.shards is None or ctx.shards.owns(normalized_link)
+                if ctx.seen.add(normalized_link):
+                    priority = ctx.scorer.priority(normalized_link, next_depth)
+                    if owned:
+                        await enqueue_url(url_queue, normalized_link, next_depth, priority)
+                    else:
+                        ctx.shards.send(normalized_link, next_depth, priority)
+                elif owned:
+                    boost = ctx.scorer.add_inlink(normalized_link)
+                    if boost:
+                        url_queue.boost(normalized_link, boost)
 
      
         finally:
-            # Mark queue item as done
-            url_queue.task_done()
+            if requeued:
+                # Counted against the page budget when it is taken again
+                ctx.fetches_started -= 1
+            else:
+                # Mark queue item as done
+                ctx.throttled.pop(currenturl, None)
+                url_queue.task_done(currenturl)
+                ctx.fetches_finished += 1
+                if ctx.rules["max_pages"] and ctx.fetches_finished >= ctx.rules["max_pages"]:
+                    ctx.budget_spent.set()
+                ctx.metrics.observe("page", time.monotonic() - started)
@@ -1,50 +1,63 @@
 import sqlite3
 import asyncio
-from fetch_utility import now
+import heapq
+import math
+import time
 
-def db_initialization(path: str):
+from collections import Counter
+
+from neardup import to_signed
+from parse import term_counts
+
+def db_initialization(path: str, wal: bool = True):
     """Initializes DB connection, cursor, and sets up the corresponding tables."""
     conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    apply_pragmas(conn, wal)
     cur = conn.cursor()
-    db_lock = asyncio.Lock()
         
     db ={
         "conn": conn,
         "cur": cur,
-        "lock": db_lock,
+        "path": path,
+        "wal": wal,
     }
     
-# Create tables if not exist
-    db["cur"].executescript('''
-        CREATE TABLE IF NOT EXISTS Urls (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE,
-            date TEXT,
-            content_hash TEXT,
-            changer INTEGER DEFAULT 0
-        );
+# Create or upgrade the schema
+    migrate(db["conn"])
 
-        CREATE TABLE IF NOT EXISTS Links (
-            from_id INTEGER,
-            to_id INTEGER,
-            PRIMARY KEY (from_id, to_id)
-        );
-        
-        CREATE TABLE IF NOT EXISTS Category (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url_id INTEGER,
-            name TEXT,
-            UNIQUE(name, url_id)                 
-        );
-                        
-        CREATE TABLE IF NOT EXISTS PageKeywords (
-            url_id INTEGER,
-            keyword TEXT,
-            count INTEGER,
-            PRIMARY KEY (url_id, keyword)
-        );
-                        
-        CREATE TABLE IF NOT EXISTS Products (
+    return db
+
+# Version 1: the tables as they were before versioned migrations (IF NOT EXISTS, so older databases are brought up to it)
+SCHEMA_V1 = (
+    '''CREATE TABLE IF NOT EXISTS Urls (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE,
+        date TEXT,
+        content_hash TEXT,
+        changer INTEGER DEFAULT 0,
+        etag TEXT,
+        last_modified TEXT,
+        change_interval REAL,
+        next_visit REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS Links (
+        from_id INTEGER,
+        to_id INTEGER,
+        PRIMARY KEY (from_id, to_id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS Category (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url_id INTEGER,
+        name TEXT,
+        UNIQUE(name, url_id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS PageKeywords (
+        url_id INTEGER,
+        keyword TEXT,
+        count INTEGER,
+        PRIMARY KEY (url_id, keyword)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS Products (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         url_id INTEGER,
         title TEXT,
@@ -52,117 +65,485 @@ def db_initialization(path: str):
         stock INTEGER,
         rating TEXT,
         image_url TEXT,
-        UNIQUE(title, url_id) 
-        );                    
-    ''')
+        UNIQUE(title, url_id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS Frontier (
+        url TEXT PRIMARY KEY,
+        depth INTEGER NOT NULL DEFAULT 0,
+        priority REAL NOT NULL DEFAULT 0,
+        next_eligible REAL NOT NULL DEFAULT 0,
+        state INTEGER NOT NULL DEFAULT 0
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_frontier_ready ON Frontier (state, priority DESC)',
+    '''CREATE TABLE IF NOT EXISTS RenderRoutes (
+        host TEXT,
+        prefix TEXT,
+        static_ok INTEGER NOT NULL DEFAULT 0,
+        dynamic_needed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (host, prefix)
+    )''',
+)
 
-    db["conn"].commit()
+URL_REVISIT_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "change_interval": "REAL",
+    "next_visit": "REAL",
+}
 
-    return db
+def migrate_v1(cur):
+    """Base schema. Databases created before conditional re-crawl also lack the validator columns."""
+    for statement in SCHEMA_V1:
+        cur.execute(statement)
+    add_missing_columns(cur, "Urls", URL_REVISIT_COLUMNS)
 
-def insert_url_and_get_id(normalized_link, db):
-    """Insert a URL if it doesn't exist, and return its ID whether it's new or already in the database."""
-    db["cur"].execute('SELECT date, id FROM Urls WHERE name=?', (normalized_link,))
-    row = db["cur"].fetchone()
-    if row is None:
-        db["cur"].execute('INSERT OR IGNORE INTO Urls (name) VALUES (?)', (normalized_link,))
-        db["cur"].execute('SELECT id FROM Urls WHERE name=?', (normalized_link,))
-        new_row = db["cur"].fetchone()
-        id_of_url = new_row[0] if new_row else None
-    else:
-        id_of_url = row[1]  # id of existing URL
-
-    return id_of_url
-
-def insert_link_relationship(normalized_link, db, from_id):
-    """Insert link relationship into the database."""
-    if from_id is not None:
-        db["cur"].execute('SELECT id FROM Urls WHERE name=?', (normalized_link,))
-        to_row = db["cur"].fetchone()
-        if to_row:
-            to_id = to_row[0]
-            db["cur"].execute(
-                'INSERT OR IGNORE INTO Links (from_id, to_id) VALUES (?, ?)',
-                (from_id, to_id)
-            )
-
-def insert_category(db, category, from_id):
-    """Insert category into databse."""
-    # --- Save category and keywords ---
-    if category:
-        db["cur"].execute(
-            'INSERT OR IGNORE INTO Category (url_id, name) VALUES (?, ?)',
-            (from_id, category)
-        )
-
-def insert_keywords(db, keywords, from_id):
-    """Store extracted keywords for a given URL in the database.
-    """
-    for keyword, count in keywords:
-        db["cur"].execute(
-            'INSERT OR REPLACE INTO PageKeywords (url_id, keyword, count) VALUES (?, ?, ?)',
-            (from_id, keyword, count)
-        )
-
-def insert_product(from_id, db, product_data):
-    """Store product information related to a URL in the database.
-    """
-    if product_data and from_id:
-        
-        db["cur"].execute('''
-        INSERT OR IGNORE INTO Products (url_id, title, price, stock, rating, image_url)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (from_id, product_data["title"], product_data["price"], product_data["stock"], product_data["rating"], product_data["image_url"])
-        )
+def migrate_v2(cur):
+    """
+    Urls.date becomes an INTEGER Unix timestamp (was ISO-8601 text): 8 bytes instead of ~32
+    and plain integer comparisons. Links, PageKeywords and RenderRoutes are only ever
+    reached through their primary key, so they become WITHOUT ROWID tables and the
+    key index is the table itself.
+    """
+    rebuild_table(cur, "Urls", '''
+        CREATE TABLE Urls_new (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE,
+            date INTEGER,
+            content_hash TEXT,
+            changer INTEGER DEFAULT 0,
+            etag TEXT,
+            last_modified TEXT,
+            change_interval REAL,
+            next_visit REAL
+        )''', '''
+        SELECT id, name, CAST(strftime('%s', date) AS INTEGER), content_hash, changer,
+               etag, last_modified, change_interval, next_visit
+        FROM Urls''')
+    rebuild_table(cur, "Links", '''
+        CREATE TABLE Links_new (
+            from_id INTEGER NOT NULL,
+            to_id INTEGER NOT NULL,
+            PRIMARY KEY (from_id, to_id)
+        ) WITHOUT ROWID''', 'SELECT from_id, to_id FROM Links WHERE from_id IS NOT NULL AND to_id IS NOT NULL')
+    rebuild_table(cur, "PageKeywords", '''
+        CREATE TABLE PageKeywords_new (
+            url_id INTEGER NOT NULL,
+            keyword TEXT NOT NULL,
+            count INTEGER,
+            PRIMARY KEY (url_id, keyword)
+        ) WITHOUT ROWID''', 'SELECT url_id, keyword, count FROM PageKeywords WHERE url_id IS NOT NULL AND keyword IS NOT NULL')
+    rebuild_table(cur, "RenderRoutes", '''
+        CREATE TABLE RenderRoutes_new (
+            host TEXT NOT NULL,
+            prefix TEXT NOT NULL,
+            static_ok INTEGER NOT NULL DEFAULT 0,
+            dynamic_needed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (host, prefix)
+        ) WITHOUT ROWID''', 'SELECT host, prefix, static_ok, dynamic_needed FROM RenderRoutes WHERE host IS NOT NULL AND prefix IS NOT NULL')
+
+def migrate_v3(cur):
+    """Indexes for the hot queries: export joins, "who links here", resume and re-crawl scheduling."""
+    for statement in (
+        'CREATE INDEX IF NOT EXISTS idx_products_url_id ON Products (url_id)',
+        'CREATE INDEX IF NOT EXISTS idx_category_url_id ON Category (url_id)',
+        # Covering for reverse lookups: the WITHOUT ROWID key (from_id) rides along
+        'CREATE INDEX IF NOT EXISTS idx_links_to_id ON Links (to_id)',
+        # Resume reads the names of unfinished URLs: only those rows are indexed
+        'CREATE INDEX IF NOT EXISTS idx_urls_unfinished ON Urls (name) WHERE date IS NULL',
+        # Due re-crawls, by next visit time
+        'CREATE INDEX IF NOT EXISTS idx_urls_next_visit ON Urls (next_visit)',
+    ):
+        cur.execute(statement)
+
+def migrate_v4(cur):
+    """Near-duplicate detection: the SimHash of each original page, and the pages recorded as aliases of one."""
+    add_missing_columns(cur, "Urls", {"simhash": "INTEGER"})
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS Aliases (
+            url_id INTEGER PRIMARY KEY,
+            canonical_id INTEGER NOT NULL
+        )''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_aliases_canonical_id ON Aliases (canonical_id)')
+
+def migrate_v5(cur):
+    """Frontier leases, so several crawler instances can share a database: which instance
+    claimed a URL and until when (claimed rows are few, idx_frontier_ready finds them).
+    """
+    add_missing_columns(cur, "Frontier", {"owner": "TEXT", "lease_expires": "REAL"})
+
+def migrate_v6(cur):
+    """Link-graph scores of each URL, written by link_graph.analyze_links (python main.py --graph)."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS LinkStats (
+            url_id INTEGER PRIMARY KEY,
+            in_degree INTEGER NOT NULL,
+            out_degree INTEGER NOT NULL,
+            pagerank REAL NOT NULL,
+            depth INTEGER
+        )''')
+
+def migrate_v7(cur):
+    """Full-text search: the visible text of every parsed page in an FTS5 index (rowid = Urls.id),
+    the number of indexed pages containing each keyword term (TermStats, for TF-IDF), and the
+    TF-IDF score of each stored keyword.
+    """
+    cur.execute('CREATE VIRTUAL TABLE IF NOT EXISTS PageText USING fts5 (text)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS TermStats (
+            term TEXT PRIMARY KEY,
+            docs INTEGER NOT NULL
+        ) WITHOUT ROWID''')
+    add_missing_columns(cur, "PageKeywords", {"score": "REAL"})
+
+# Applied in order; PRAGMA user_version holds how many have run
+MIGRATIONS = (migrate_v1, migrate_v2, migrate_v3, migrate_v4, migrate_v5, migrate_v6, migrate_v7)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(conn):
+    """Bring the database schema up to SCHEMA_VERSION, one transaction per migration.
+    Returns the version the database was at before.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this crawler ({SCHEMA_VERSION})")
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        cur = conn.cursor()
+        cur.execute('BEGIN')
+        try:
+            MIGRATIONS[target - 1](cur)
+            cur.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if version < SCHEMA_VERSION:
+        # Let the planner see the new indexes' statistics
+        conn.execute('PRAGMA optimize')
+    return version
+
+def rebuild_table(cur, table, create_sql, select_sql):
+    """Recreate `table` with a new definition: create {table}_new, copy rows through select_sql, swap the names.
+    Indexes of the old table are dropped with it.
+    """
+    cur.execute(f'DROP TABLE IF EXISTS {table}_new')
+    cur.execute(create_sql)
+    cur.execute(f'INSERT INTO {table}_new {select_sql}')
+    cur.execute(f'DROP TABLE {table}')
+    cur.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
 
+def add_missing_columns(cur, table, columns):
+    """Add each {name: type} column that the existing table does not have yet."""
+    existing = {row[1] for row in cur.execute(f'PRAGMA table_info({table})')}
+    for name, col_type in columns.items():
+        if name not in existing:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {name} {col_type}')
 
-def get_url_id(db, normalized_link):
-    """Retrieve the database ID for a given URL if it exists.
+# Chunk size for multi-row statements, well under SQLite's bound-variable limit
+SQL_CHUNK = 500
+
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=30000",
+)
+
+def apply_pragmas(conn, wal=True):
+    """Switch the connection to WAL (readers never block the writer) and apply the tuned pragmas."""
+    if wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+
+def open_writer_connection(path, wal=True):
+    """Open the connection owned by the writer task. It is only used from one thread at a time."""
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    apply_pragmas(conn, wal)
+    return conn
+
+def chunked(items, size=SQL_CHUNK):
+    """Yield successive lists of at most `size` items."""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def upsert_url_ids(cur, names):
+    """Insert every missing URL and return a {name: id} map for all of them.
+    New rows come back through INSERT ... RETURNING, existing ones through a single IN lookup per chunk.
     """
-    db["cur"].execute('SELECT date, id FROM Urls WHERE name=?', (normalized_link,))
-    row = db["cur"].fetchone()
-    if row is None:
-        db["cur"].execute('INSERT OR IGNORE INTO Urls (name) VALUES (?)', (normalized_link,))
+    ids = {}
+    for chunk in chunked(names):
+        placeholders = ",".join("(?)" for _ in chunk)
+        rows = cur.execute(f'INSERT OR IGNORE INTO Urls (name) VALUES {placeholders} RETURNING id, name', chunk).fetchall()
+        ids.update((name, url_id) for url_id, name in rows)
+
+        missing = [name for name in chunk if name not in ids]
+        if missing:
+            placeholders = ",".join("?" for _ in missing)
+            rows = cur.execute(f'SELECT id, name FROM Urls WHERE name IN ({placeholders})', missing).fetchall()
+            ids.update((name, url_id) for url_id, name in rows)
+    return ids
+
+# Keywords stored per page, picked by TF-IDF among all its terms
+KEYWORDS_PER_PAGE = 20
+
+# TermStats row holding the number of indexed pages (no term is empty)
+DOCUMENT_COUNT_TERM = ''
+
+def index_texts(cur, texts):
+    """Add (url_id, text, terms) pages to the PageText index and count their distinct terms in TermStats.
+    A page indexed before is replaced, and the terms of its old text are counted out.
+    """
+    if not texts:
+        return
+    changes = Counter()
+    for chunk in chunked(url_id for url_id, _, _ in texts):
+        placeholders = ",".join("?" for _ in chunk)
+        for (old_text,) in cur.execute(f'SELECT text FROM PageText WHERE rowid IN ({placeholders})', chunk):
+            changes.subtract(term_counts(old_text).keys())
+            changes[DOCUMENT_COUNT_TERM] -= 1
+    for _, _, terms in texts:
+        changes.update(term for term, _ in terms)
+    changes[DOCUMENT_COUNT_TERM] += len(texts)
+
+    cur.executemany('INSERT OR REPLACE INTO PageText (rowid, text) VALUES (?, ?)', [(url_id, text) for url_id, text, _ in texts])
+    cur.executemany('''
+        INSERT INTO TermStats (term, docs) VALUES (?, ?)
+        ON CONFLICT (term) DO UPDATE SET docs = docs + excluded.docs
+        ''', [(term, change) for term, change in changes.items() if change])
+
+def tfidf_keywords(cur, pages, top_n=KEYWORDS_PER_PAGE):
+    """Pick the top_n keywords of each (url_id, terms) page by TF-IDF against the pages indexed so far.
+    idf is ln((1 + pages) / (1 + pages with the term)) + 1, so while the corpus is small the
+    ranking stays close to raw counts. Returns (url_id, keyword, count, score) rows.
+    """
+    wanted = {term for _, terms in pages for term, _ in terms}
+    wanted.add(DOCUMENT_COUNT_TERM)
+    docs = {}
+    for chunk in chunked(wanted):
+        placeholders = ",".join("?" for _ in chunk)
+        docs.update(cur.execute(f'SELECT term, docs FROM TermStats WHERE term IN ({placeholders})', chunk))
+    total = docs.get(DOCUMENT_COUNT_TERM, 0)
+
+    rows = []
+    for url_id, terms in pages:
+        scored = ((count * (math.log((1 + total) / (1 + docs.get(term, 0))) + 1), term, count) for term, count in terms)
+        rows.extend((url_id, term, count, score) for score, term, count in heapq.nlargest(top_n, scored))
+    return rows
+
+def write_pages(conn, pages):
+    """
+    Write a batch of page records in a single transaction, one set-based
+    statement per table instead of per-row SELECT/INSERT round-trips.
+    """
+    cur = conn.cursor()
 
+    # Revisits that came back unchanged only refresh validators and the schedule;
+    # near-duplicates only record which page they are an alias of
+    revisits = [page for page in pages if page.get("kind") == "revisit"]
+    aliases = [page for page in pages if page.get("kind") == "alias"]
+    pages = [page for page in pages if page.get("kind") is None]
 
-async def save_to_db(ctx, currenturl, to_enqueue, link_pairs, product_data, category, keywords):
+    names = set()
+    for page in pages:
+        names.add(page["url"])
+        names.update(name for name, _ in page["to_enqueue"])
+        names.update(page["link_pairs"])
+    for page in aliases:
+        names.update((page["url"], page["original"]))
+    ids = upsert_url_ids(cur, names)
+
+    links, products, categories, keyword_pages, texts, fetched, validators, fingerprints = [], [], [], [], [], [], [], []
+    stamp = int(time.time())
+    for page in aliases:
+        fetched.append((stamp, ids[page["url"]]))
+        fetch = page.get("fetch")
+        if fetch:
+            validators.append((fetch["content_hash"], fetch["etag"], fetch["last_modified"], fetch["change_interval"], fetch["next_visit"], fetch["changed"], ids[page["url"]]))
+    cur.executemany('INSERT OR REPLACE INTO Aliases (url_id, canonical_id) VALUES (?, ?)',
+                    [(ids[page["url"]], ids[page["original"]]) for page in aliases])
+    cur.executemany('UPDATE Urls SET simhash = NULL WHERE id = ?', [(ids[page["url"]],) for page in aliases])
+
+    for page in pages:
+        from_id = ids[page["url"]]
+        links.extend((from_id, ids[name]) for name in page["link_pairs"])
+
+        product_data = page["product_data"]
+        if product_data:
+            products.append((from_id, product_data["title"], product_data["price"], product_data["stock"], product_data["rating"], product_data["image_url"]))
+            if page["category"]:
+                categories.append((from_id, page["category"]))
+            keyword_pages.append((from_id, page["keywords"]))
+            #Stamp date in db
+            fetched.append((stamp, from_id))
+
+        fetch = page.get("fetch")
+        if fetch:
+            validators.append((fetch["content_hash"], fetch["etag"], fetch["last_modified"], fetch["change_interval"], fetch["next_visit"], fetch["changed"], from_id))
+
+        if page.get("simhash") is not None:
+            fingerprints.append((to_signed(page["simhash"]), from_id))
+
+        if page.get("text"):
+            texts.append((from_id, page["text"], page["keywords"]))
+
+    cur.executemany('INSERT OR IGNORE INTO Links (from_id, to_id) VALUES (?, ?)', links)
+    # A re-crawled product page refreshes its price, stock and rating
+    cur.executemany('''
+        INSERT INTO Products (url_id, title, price, stock, rating, image_url)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (title, url_id) DO UPDATE SET
+            price = excluded.price, stock = excluded.stock,
+            rating = excluded.rating, image_url = excluded.image_url
+        ''', products)
+    cur.executemany('INSERT OR IGNORE INTO Category (url_id, name) VALUES (?, ?)', categories)
+    # The batch's own pages count in the document frequencies its keywords are ranked with
+    index_texts(cur, texts)
+    cur.executemany('DELETE FROM PageKeywords WHERE url_id = ?', [(url_id,) for url_id, _ in keyword_pages])
+    cur.executemany('INSERT OR REPLACE INTO PageKeywords (url_id, keyword, count, score) VALUES (?, ?, ?, ?)',
+                    tfidf_keywords(cur, keyword_pages))
+    cur.executemany('UPDATE Urls SET date = ? WHERE id = ?', fetched)
+    cur.executemany('''
+        UPDATE Urls SET content_hash = ?, etag = ?, last_modified = ?,
+            change_interval = ?, next_visit = ?, changer = COALESCE(changer, 0) + ?
+        WHERE id = ?
+        ''', validators)
+    # An original page is no longer an alias (its content may have changed since)
+    cur.executemany('UPDATE Urls SET simhash = ? WHERE id = ?', fingerprints)
+    cur.executemany('DELETE FROM Aliases WHERE url_id = ?', [(url_id,) for _, url_id in fingerprints])
+
+    unchanged = []
+    for page in revisits:
+        fetch = page["fetch"]
+        unchanged.append((fetch["etag"], fetch["last_modified"], fetch["change_interval"], fetch["next_visit"], page["url"]))
+    cur.executemany('''
+        UPDATE Urls SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+            change_interval = ?, next_visit = ?
+        WHERE name = ?
+        ''', unchanged)
+
+    conn.commit()
+    return len(pages) + len(aliases)
+
+def write_batch(ctx, conn, batch):
+    """Commit a batch; if the transaction fails, retry page by page so one bad record doesn't drop the rest."""
+    try:
+        write_pages(conn, batch)
+        ctx.logger.info(f"DB batch committed: {len(batch)} pages")
+        return
+    except Exception as e:
+        conn.rollback()
+        ctx.error_logger.error(f"DB batch of {len(batch)} pages failed, retrying one by one: {e}")
+
+    for page in batch:
+        try:
+            write_pages(conn, [page])
+        except Exception as e:
+            conn.rollback()
+            ctx.error_logger.error(f"Product/category/keywords saving failed for {page['url']}: {e}", exc_info=True)
+
+class WriteQueue(asyncio.Queue):
     """
-    Perform batch insertion of a page’s URL, links, product data, category, and keywords
-    into the database in an atomic, non-blocking manner.
+    The writer task's queue of page records. It also counts the records put and the
+    ones the writer has committed: records are committed in order, so a record was
+    committed once `committed` reaches the value `queued` had right after it was put.
     """
 
-    # DB writes in a single lock
-    async with ctx.db["lock"]:
-        # get from_id
-        ctx.db["cur"].execute('SELECT id FROM Urls WHERE name=?', (currenturl,))
-        row = ctx.db["cur"].fetchone()
-        from_id = row[0] if row else None
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.queued = 0
+        self.committed = 0
 
-        # Insert all URLs (idempotent)
-        inserted_ids = {}
-        for normalized_link, _ in to_enqueue:
-            new_id = insert_url_and_get_id(normalized_link, ctx.db)
-            inserted_ids[normalized_link] = new_id
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        if item is not None:
+            self.queued += 1
 
-        # Insert link relationships (only if from_id exists)
-        if from_id is not None:
-            for normalized_link in link_pairs:
-                insert_link_relationship(normalized_link, ctx.db, from_id)
+async def db_writer(ctx, write_queue):
+    """
+    Single writer task: drain page records from write_queue and commit them in
+    batches, flushing when db_batch_size is reached or db_flush_interval has elapsed
+    since the oldest pending record. Disk work runs in a thread, never on the event loop.
+    A None record flushes what is pending and stops the writer. Committed records are
+    counted on write_queue (a WriteQueue), for the frontier.
+    """
+    batch_size = ctx.rules.get("db_batch_size", 200)
+    flush_interval = ctx.rules.get("db_flush_interval", 1.0)
+    conn = open_writer_connection(ctx.db["path"], ctx.db["wal"])
+    loop = asyncio.get_running_loop()
 
-        if product_data and from_id:
+    batch = []
+    deadline = None
+    running = True
+    try:
+        while running:
+            timeout = max(0, deadline - loop.time()) if batch else None
             try:
-                # insert product and commit                       
-                insert_product(from_id, ctx.db, product_data)
-                insert_category(ctx.db, category, from_id)
-                insert_keywords(ctx.db, keywords, from_id)
-                ctx.logger.info(f"Product/category/keywords saving succesfull for {currenturl}")
-                #Stamp date in db           
-                ctx.db["cur"].execute('UPDATE Urls SET date = ? WHERE name = ?', (now(), currenturl))
-                
-            except Exception as e:
+                record = await asyncio.wait_for(write_queue.get(), timeout=timeout)
+                write_queue.task_done()
+            except asyncio.TimeoutError:
+                # Flush interval elapsed
+                record = False
 
-                ctx.error_logger.error(f"Product/category/keywords saving failed for {currenturl}: {e}", exc_info=True)
+            if record is None:
+                running = False
+            elif record:
+                if not batch:
+                    deadline = loop.time() + flush_interval
+                batch.append(record)
+
+            if batch and (not running or record is False or len(batch) >= batch_size):
+                with ctx.metrics.time("db_commit"):
+                    await asyncio.to_thread(write_batch, ctx, conn, batch)
+                write_queue.committed += len(batch)
+                ctx.metrics.db_batches.observe(len(batch))
+                committed = time.monotonic()
+                for page in batch:
+                    if page.get("started"):
+                        ctx.metrics.observe("fetch_to_commit", committed - page["started"])
+                batch = []
+    finally:
+        conn.close()
+
+async def save_to_db(ctx, currenturl, to_enqueue, link_pairs, product_data, category, keywords, fetch=None, started=None, simhash=None, text=None):
+    """
+    Hand a page's URL, links, product data, category, keywords (all its terms with
+    their counts) and visible text to the writer task, which inserts them in batched
+    transactions, indexing the text for full-text search.
+    `fetch` carries the page's validators and revisit schedule (see save_revisit);
+    `started` (time.monotonic() when the fetch began) feeds the fetch-to-commit latency;
+    `simhash` is the page's near-duplicate fingerprint.
+    Waits only when the write queue is full (back-pressure on a slow disk).
+    """
+    await ctx.write_queue.put({
+        "url": currenturl,
+        "to_enqueue": to_enqueue,
+        "link_pairs": link_pairs,
+        "product_data": product_data,
+        "category": category,
+        "keywords": keywords,
+        "fetch": fetch,
+        "started": started,
+        "simhash": simhash,
+        "text": text,
+    })
 
-        ctx.db["conn"].commit()
+async def save_alias(ctx, currenturl, original, fetch=None, started=None):
+    """Queue the write for a near-duplicate page: it is recorded as an alias of `original`, nothing is extracted."""
+    await ctx.write_queue.put({
+        "kind": "alias",
+        "url": currenturl,
+        "original": original,
+        "fetch": fetch,
+        "started": started,
+    })
 
-    return inserted_ids
\ No newline at end of file
+async def save_revisit(ctx, currenturl, fetch):
+    """Queue the cheap write for a revisit that found the page unchanged (304 or same content hash)."""
+    await ctx.write_queue.put({
+        "kind": "revisit",
+        "url": currenturl,
+        "fetch": fetch,
+    })
@@ -1,77 +1,181 @@
 
+import csv
+import gzip
+import json
+
+from datetime import datetime, timezone
+
+# Parquet export is optional: it needs pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Only pages with product data are exported. Urls is scanned in id order, which serves the ORDER BY
+# without a sort; Products and Category are looked up through their url_id indexes
 QUERY_EXPORT = '''
-SELECT Urls.id, Urls.name, Urls.date, Category.name, Products.title, Products.rating, Products.price, Products.stock
+SELECT Urls.id, Urls.name, strftime('%Y-%m-%dT%H:%M:%SZ', Urls.date, 'unixepoch'), Category.name, Products.title, Products.rating, Products.price, Products.stock
 FROM Urls
+JOIN Products ON Urls.id = Products.url_id
 LEFT JOIN Category ON Urls.id = Category.url_id
-LEFT JOIN Products ON Urls.id = Products.url_id
+{where}
 ORDER BY Urls.id;
 '''
 
-#Def export JSON
-def export_to_json(db, filename='exported_data.json'):
-
-    """Export crawling results stored in databse to a json file."""
+# Incremental exports: Urls.date is a Unix timestamp
+SINCE_FILTER = 'WHERE Urls.date >= ?'
+
+EXPORT_COLUMNS = ['id', 'url_title', 'date', 'category', 'product_title', 'product_rating', 'product_price', 'product_stock']
+
+# Rows fetched from SQLite per round-trip
+EXPORT_CHUNK = 5000
+
+#Def iter_export_rows
+def iter_export_rows(db, since=None, chunk_size=EXPORT_CHUNK):
+    """Yield exported rows in chunks from a dedicated cursor, so memory stays constant.
+    With `since` (an ISO date or timestamp) only pages fetched at or after it are exported.
+    """
+    cur = db["conn"].cursor()
+    if since:
+        cur.execute(QUERY_EXPORT.format(where=SINCE_FILTER), (since_timestamp(since),))
+    else:
+        cur.execute(QUERY_EXPORT.format(where=''))
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
+
+#Def since_timestamp
+def since_timestamp(since):
+    """Unix timestamp of an ISO date or date-time (UTC unless it carries an offset). Raises ValueError."""
+    moment = datetime.fromisoformat(since)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+#Def open_export_file
+def open_export_file(filename, compress=False):
+    """Open a text file for writing, gzip-compressed when asked or when the name ends in .gz."""
+    if compress or filename.endswith('.gz'):
+        return gzip.open(filename, 'wt', encoding='utf-8', newline='')
+    return open(filename, 'w', encoding='utf-8', newline='')
+
+#Def row_object
+def row_object(row):
+    """The JSON shape of one exported row."""
+    return {
+        "id": row[0],
+        "url_title": row[1],
+        "category": row[3],
+        "product_title": row[4],
+        "product_rating": row[5],
+        "product_price": row[6],
+        "product_stock": row[7],
+    }
 
-    import json
-
-    rows = db["cur"].execute(QUERY_EXPORT)
-
-    list_of_url_objects = list()
+#Def export JSON
+def export_to_json(db, filename='exported_data.json', since=None, compress=False):
 
-    for row in rows:
+    """Export crawling results stored in databse to a json file.
+    The array is written one object at a time instead of being built in memory.
+    """
 
-        url_id = row[0]
-        url_title = row[1]
-        
-        if (row[4] == None):
-            continue
-        else:
-            category = row[3]
-            product_title = row[4]
-            product_rating = row[5]
-            product_price = row[6]
-            product_stock = row[7]
+    count = 0
+    with open_export_file(filename, compress) as f:
+        f.write('[')
+        for row in iter_export_rows(db, since):
+            f.write(',\n    ' if count else '\n    ')
+            json.dump(row_object(row), f, ensure_ascii=False)
+            count += 1
+        f.write('\n]\n' if count else ']\n')
 
-        temporary_dic_object = {}
+    print(f"Exported {count} crawl results to {filename}")
+    return count
 
-        temporary_dic_object["id"] = url_id
-        temporary_dic_object["url_title"] = url_title
-        temporary_dic_object["category"] = category
-        temporary_dic_object["product_title"] = product_title
-        temporary_dic_object["product_rating"] = product_rating
-        temporary_dic_object["product_price"] = product_price
-        temporary_dic_object["product_stock"] = product_stock
+#Def export JSON Lines
+def export_to_jsonl(db, filename='exported_data.jsonl', since=None, compress=False):
 
-        list_of_url_objects.append(temporary_dic_object)
+    """Export crawling results stored in databse to a JSON Lines file (one object per line)."""
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(list_of_url_objects, f, indent=4, ensure_ascii=False)
+    count = 0
+    with open_export_file(filename, compress) as f:
+        for row in iter_export_rows(db, since):
+            f.write(json.dumps(row_object(row), ensure_ascii=False))
+            f.write('\n')
+            count += 1
 
-    print(f"Exported crawl results to exported_data")
+    print(f"Exported {count} crawl results to {filename}")
+    return count
 
 #Def export CSV
-def export_to_csv(db, filename='exported_data.csv'):
+def export_to_csv(db, filename='exported_data.csv', since=None, compress=False):
 
     """Export crawling results stored in databse to a csv file."""
 
-    import csv
-        
-    rows = db["cur"].execute(QUERY_EXPORT)
-
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
+    count = 0
+    with open_export_file(filename, compress) as f:
         writer = csv.writer(f)
 
         #Headers
-        writer.writerow([
-            'id', 'url_title', 'date', 'category',
-            'product_title', 'product_rating', 'product_price', 'product_stock'
-        ])
+        writer.writerow(EXPORT_COLUMNS)
 
         # Write rows
-        for row in rows:
-            if row[4] is None:
-                continue
-            else:
-                writer.writerow(row)
-
-    print(f"Exported crawl results to {filename}")
\ No newline at end of file
+        for row in iter_export_rows(db, since):
+            writer.writerow(row)
+            count += 1
+
+    print(f"Exported {count} crawl results to {filename}")
+    return count
+
+#Def export Parquet
+def export_to_parquet(db, filename='exported_data.parquet', since=None, batch_rows=50_000):
+
+    """Export crawling results stored in databse to a Parquet file, one row group per batch (needs pyarrow)."""
+
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ('id', pa.int64()), ('url_title', pa.string()), ('date', pa.string()), ('category', pa.string()),
+        ('product_title', pa.string()), ('product_rating', pa.string()), ('product_price', pa.float64()),
+        ('product_stock', pa.int64()),
+    ])
+
+    count = 0
+    with pq.ParquetWriter(filename, schema, compression='zstd') as writer:
+        batch = []
+        for row in iter_export_rows(db, since):
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist([dict(zip(EXPORT_COLUMNS, r)) for r in batch], schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(EXPORT_COLUMNS, r)) for r in batch], schema=schema))
+            count += len(batch)
+
+    print(f"Exported {count} crawl results to {filename}")
+    return count
+
+# Exporters by format name, with their default file name
+EXPORTERS = {
+    'json': (export_to_json, 'exported_data.json'),
+    'jsonl': (export_to_jsonl, 'exported_data.jsonl'),
+    'csv': (export_to_csv, 'exported_data.csv'),
+    'parquet': (export_to_parquet, 'exported_data.parquet'),
+}
+
+#Def export_results
+def export_results(db, output_format, filename=None, since=None, compress=False):
+    """Run the exporter of `output_format`; gzip applies to the text formats."""
+    exporter, default_name = EXPORTERS[output_format]
+    if output_format == 'parquet':
+        return exporter(db, filename or default_name, since)
+    if compress and not filename:
+        default_name += '.gz'
+    return exporter(db, filename or default_name, since, compress)
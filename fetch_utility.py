@@ -2,31 +2,130 @@ import aiohttp
 import asyncio
 import logging
 import ssl
+import time
 
-from bs4 import BeautifulSoup
-from datetime import datetime, timezone
-from urllib.parse import urljoin
-from playwright.async_api import async_playwright
+from dataclasses import dataclass
+from urllib.parse import urljoin, urlparse
 
+from parse import analyze_html, compute_hash
+from recrawl import conditional_headers
+from render_router import RenderRouter
+from throttle import THROTTLE_STATUSES, parse_retry_after
 
-#Def Now
-def now():
-    """Return the actual date, hour and timezone."""
-    return datetime.now(timezone.utc).isoformat()
+
+# aiohttp only decodes brotli when a brotli package is installed, so only advertise it then
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+
+#Def build_ssl_context
+def build_ssl_context(verify_ssl=False):
+    """Build the one SSL context shared by every connection (certificate checks off unless verify_ssl)."""
+    ssl_context = ssl.create_default_context()
+    if not verify_ssl:
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+#Def create_session
+def create_session(rules):
+    """
+    Build the shared aiohttp session: one SSL context, one TCPConnector with
+    per-host limits, DNS caching and keep-alive tuning, plus default headers and timeout,
+    so requests reuse pooled TLS connections instead of rebuilding them.
+    """
+    connector = aiohttp.TCPConnector(
+        ssl=build_ssl_context(rules.get("verify_ssl", False)),
+        limit=rules.get("connection_limit", 100),
+        limit_per_host=rules.get("connection_limit_per_host", 16),
+        ttl_dns_cache=rules.get("dns_cache_ttl", 300),
+        keepalive_timeout=rules.get("keepalive_timeout", 30),
+        enable_cleanup_closed=True,
+    )
+    headers = {
+        "User-Agent": rules.get("user_agent", "Mozilla/5.0"),
+        "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+        "Accept-Encoding": ACCEPT_ENCODING,
+    }
+    timeout = aiohttp.ClientTimeout(total=rules.get("timeout_seconds", 10))
+    return aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout)
+
+# Content types worth downloading and parsing
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+#Def read_html_body
+async def read_html_body(ctx, response, url, chunk_size=65536):
+    """
+    Read an HTML body in chunks, at most max_content_length bytes.
+    Non-HTML types and bodies announced (or found) to be too large are
+    abandoned before the rest is downloaded; returns the decoded text or None.
+    """
+    max_bytes = ctx.rules.get("max_content_length") or None
+
+    # response.content_type reads application/octet-stream when the header is missing: only a type actually sent counts
+    content_type = response.content_type if response.headers.get("Content-Type") else None
+    if content_type and content_type not in HTML_CONTENT_TYPES:
+        ctx.logger.info(f"Skipped body of {url}: content type {content_type}")
+        ctx.metrics.inc("crawler_body_rejected_total", reason="content type")
+        return None
+
+    if max_bytes and response.content_length and response.content_length > max_bytes:
+        ctx.logger.info(f"Skipped body of {url}: Content-Length {response.content_length} > {max_bytes}")
+        ctx.metrics.inc("crawler_body_rejected_total", reason="too large")
+        return None
+
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(chunk_size):
+        body.extend(chunk)
+        if max_bytes and len(body) > max_bytes:
+            ctx.logger.info(f"Aborted download of {url}: body exceeds {max_bytes} bytes")
+            ctx.metrics.inc("crawler_body_rejected_total", reason="too large")
+            return None
+
+    ctx.metrics.inc("crawler_bytes_total", len(body))
+    try:
+        return body.decode(response.charset or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+@dataclass
+class FetchResult:
+    """Outcome of a fetch: the body plus the validators needed to re-crawl it conditionally."""
+    url: str
+    status: int
+    html: str = None
+    etag: str = None
+    last_modified: str = None
+    content_hash: str = None
+    not_modified: bool = False
+    redirected: bool = False
+    retry_after: float = None
 
 #Def fetch_static
 async def fetch_static(ctx, session, url, backoff=1):
 
-    """Fetch a static HTML page using aiohttp with retries, backoff and redirect handling."""
+    """Fetch a static HTML page using aiohttp with retries, backoff and redirect handling.
+    Every response and failure feeds the host's adaptive concurrency limiter.
+    429/503 pause the host for Retry-After (capped by max_retry_after) and return at once
+    with FetchResult.retry_after set: the caller requeues the URL instead of sleeping while
+    it holds one of the host's concurrency slots.
+    Known pages are requested conditionally (If-None-Match / If-Modified-Since), so an
+    unchanged page costs a 304 and no body. Returns a FetchResult or None.
+    """
 
-    timeout_seconds = ctx.rules.get("timeout_seconds", 10)
     retries = ctx.rules.get("retries", 3)
     max_redirects = int(ctx.rules.get("max_redirects", 5))
-
-    # Ignore SSL certificate errors globally for aiohttp
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+    max_retry_after = ctx.rules.get("max_retry_after", 60)
+    host = urlparse(url).netloc
+    limiter = ctx.limiters[host]
+    headers = conditional_headers(ctx.revisits.get(url))
 
     for attempt in range(retries):
         try:
@@ -40,18 +139,40 @@ async def fetch_static(ctx, session, url, backoff=1):
                     return None
                 visited.add(current_url)
 
-                timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-
-                async with session.get(current_url, ssl=ssl_context, headers={"User-Agent": ctx.rules["user_agent"]}, timeout=timeout) as response:
+                # SSL context, headers and timeout come from the shared session (create_session)
+                started = time.monotonic()
+                async with session.get(current_url, headers=headers if current_url == url else None) as response:
+                    latency = time.monotonic() - started
+                    limiter.record(latency=latency, status=response.status)
+                    ctx.metrics.observe("fetch", latency)
+                    ctx.metrics.inc("crawler_responses_total", status=response.status)
 
-                    if response.status in (301, 302, 303, 307, 308):
+                    if response.status in THROTTLE_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        # Without Retry-After, back off by the times this URL was throttled already
+                        throttled = ctx.throttled.get(url, 0)
+                        retry_in = min(retry_after if retry_after is not None else backoff * (2 ** throttled), max_retry_after)
+                        ctx.metrics.inc("crawler_retries_total", reason=f"HTTP {response.status}")
+                        if ctx.scheduler:
+                            ctx.scheduler.pause(host, retry_in)
+                        ctx.logger.info(f"HTTP {response.status} at {current_url}, host paused for {retry_in:.1f}s")
+                        return FetchResult(url, response.status, retry_after=retry_in)
+                    elif response.status in (301, 302, 303, 307, 308):
                         location = response.headers.get('Location')
                         if not location:
                             break
                         current_url = urljoin(current_url, location)
                         redirects += 1
+                    elif response.status == 304:
+                        return FetchResult(url, 304, etag=response.headers.get('ETag'),
+                                           last_modified=response.headers.get('Last-Modified'), not_modified=True)
                     elif response.status == 200:
-                        return await response.text()
+                        html = await read_html_body(ctx, response, current_url)
+                        if html is None:
+                            return None
+                        return FetchResult(url, 200, html, etag=response.headers.get('ETag'),
+                                           last_modified=response.headers.get('Last-Modified'),
+                                           redirected=current_url != url or bool(response.history))
                     else:
                         ctx.logger.info(f"HTTP error {response.status} at {current_url}")
                         return None
@@ -61,9 +182,13 @@ async def fetch_static(ctx, session, url, backoff=1):
             return None
 
         except aiohttp.ClientError as e:
+            limiter.record(error=e)
+            ctx.metrics.inc("crawler_retries_total", reason=type(e).__name__)
             ctx.logger.info(f"Attempt {attempt+1} failed for {url}: {e}")
             await asyncio.sleep(backoff * (2 ** attempt))
         except Exception as e:
+            limiter.record(error=e)
+            ctx.metrics.inc("crawler_retries_total", reason=type(e).__name__)
             ctx.logger.info(f"Attempt {attempt+1} unknown error for {url}: {e}")
             await asyncio.sleep(backoff * (2 ** attempt))
     ctx.logger.info(f"Failed to fetch {url} after {retries} attempts.")
@@ -71,55 +196,76 @@ async def fetch_static(ctx, session, url, backoff=1):
     return None
 
 #Optional Playwright fetch:
-async def fetch_dynamic(ctx, url, timeout=15000):
+async def fetch_dynamic(ctx, url):
     """
     Fetch HTML content of a page rendered with JavaScript using Playwright.
+    Renders go through the shared browser pool (reused pages, bounded queue).
     """
-    # Use Playwright to load JS content fully
-    try:
-        page = await ctx.browser.new_page()
-        await page.goto(url, timeout=timeout)
-        content = await page.content()
-        await page.close()
-        return content
-    except Exception as e:
-        ctx.logger.error(f"Playwright failed to fetch {url}: {e}")
-        return None
+    return await ctx.browser_pool.render(url)
 
     
-def looks_like_content(html):
-    """Check if fetched HTML content contains meaningful visible text."""
-    if not html:
+def looks_like_content(page):
+    """Check if an analyzed page contains meaningful visible text."""
+    if page is None or not page.html_length:
         logging.info("Empty HTML content")
         return False
-    soup = BeautifulSoup(html, "html.parser")
-    texts = soup.stripped_strings
-    combined = ' '.join(texts)
-    if len(combined) <= 100:
+    if page.text_length <= 100:
         logging.info("Fetched content is too short to be meaningful")
         return False
     return True
 
 #Def fetch existing session
 async def fetch_url(ctx, session, url):
-    """Fetch a URL using static fetch first, and optionally dynamic fetch via Playwright if enabled."""
+    """Fetch a URL using static fetch first, and optionally dynamic fetch via Playwright if enabled.
+    Returns (FetchResult or None, analyzed PageResult or None), so callers never parse the HTML again.
+    A page that is not modified since the last crawl (304 or same content hash) is not parsed.
+    URLs under a path the render router learned needs JavaScript go straight to the browser.
+    A throttled fetch (429/503) comes back at once with retry_after set and no page.
+    """
+    dynamic = ctx.use_playwright and ctx.browser_pool is not None
+    route = ctx.render_router.decide(url) if dynamic and ctx.render_router else None
+    if route == RenderRouter.DYNAMIC:
+        return await fetch_rendered(ctx, url)
 
     # Try static fetch first
     #print(f"Fetching {url} with UA: {ctx.user_agent}")
-    html = await fetch_static(ctx, session, url)
+    fetch = await fetch_static(ctx, session, url)
     #print(f"fetch_static returned: {len(html) if html else 'None'}")
-    if html and looks_like_content(html):
-        return html
+    if fetch and fetch.retry_after is not None:
+        return fetch, None
+    if fetch and fetch.html:
+        fetch.content_hash = compute_hash(fetch.html)
+        revisit = ctx.revisits.get(url)
+        if revisit and revisit.content_hash == fetch.content_hash:
+            fetch.not_modified = True
+    if fetch and fetch.not_modified:
+        return fetch, None
+
+    page = await analyze_html(ctx, url, fetch.html, redirected=fetch.redirected) if fetch and fetch.html else None
+    if looks_like_content(page):
+        if dynamic and ctx.render_router:
+            ctx.render_router.record(url, needed_browser=False)
+        return fetch, page
     
-    # 2. If dynamic disabled → return whatever static got
-    if not ctx.use_playwright:
-        return html
+    # 2. If dynamic disabled (or static always worked here) → return whatever static got
+    if not dynamic or route == RenderRouter.STATIC:
+        return fetch, page
 
-    # 3. Initialize Playwright only once
-    if not hasattr(ctx, "browser"):
-        ctx.playwright = await async_playwright().start()
-        ctx.browser = await ctx.playwright.chromium.launch(headless=True)
+    # 3. Use dynamic fetch (the pool launches the browser on first use); static just failed, so this one teaches the router
+    rendered, rendered_page = await fetch_rendered(ctx, url, static_failed=True)
+    return (rendered, rendered_page) if rendered else (fetch, None)
 
-    # 4. Use dynamic fetch properly
+#Def fetch_rendered
+async def fetch_rendered(ctx, url, static_failed=False):
+    """Render a URL in the browser pool and analyze it. When static was tried and failed in the same
+    fetch and the render worked, the render router learns that the page needed the browser; URLs routed
+    straight to the browser teach it nothing (they would only confirm the route).
+    """
     dyn_html = await fetch_dynamic(ctx, url)
-    return dyn_html
+    if not dyn_html:
+        return None, None
+    fetch = FetchResult(url, 200, dyn_html, content_hash=compute_hash(dyn_html))
+    page = await analyze_html(ctx, url, dyn_html)
+    if static_failed and ctx.render_router and looks_like_content(page):
+        ctx.render_router.record(url, needed_browser=True)
+    return fetch, page
@@ -0,0 +1,323 @@
+import asyncio
+import collections
+import heapq
+import os
+import socket
+import time
+import uuid
+
+from db import open_writer_connection
+
+# Max seconds new or finished URLs stay unpersisted
+FLUSH_INTERVAL = 1.0
+
+# Seconds a claimed URL stays reserved to its instance without a heartbeat;
+# leases are renewed every third of it
+LEASE_SECONDS = 60.0
+
+# Seconds between two looks at the table while only other instances hold work
+IDLE_POLL = 1.0
+
+# Seconds between two checks for committed pages once this instance has nothing in flight
+COMMIT_POLL = 0.05
+
+
+#Def default_owner
+def default_owner():
+    """Owner id of a crawler instance: host, pid and a random suffix (pids get reused)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Frontier:
+    """
+    Crawl frontier persisted in the Frontier table (url, depth, priority, next_eligible).
+
+    Only a small hot window of URLs lives in RAM; a background task refills it in bulk
+    from SQLite (highest priority first, FIFO within a priority) and flushes new and
+    finished URLs back in batches. The hot window is a heap, so get() also hands out
+    the best URL loaded so far, and boost() raises the priority of a queued URL.
+    Drop-in for the asyncio.Queue the workers used: put / get / task_done / join /
+    qsize, except task_done takes the finished URL.
+
+    Several crawler instances can share one database. Row states are 0 (queued),
+    1 (claimed) and 2 (fetched). A refill claims its rows for this instance (owner,
+    lease_expires) in a single UPDATE ... RETURNING, the refill task renews the leases
+    while the URLs are held, and expired leases (a crashed instance) go back to the
+    queue. Fetched URLs stay in the table, so no instance queues them again; the crawl
+    is finished once no row is queued or claimed. With a write_queue (db.WriteQueue), a
+    URL is only marked fetched once the page records queued before it are committed, so
+    a crash never leaves a fetched URL without its page.
+    """
+
+    def __init__(self, db, hot_size=1000, batch_size=500, logger=None, owner=None, lease_seconds=LEASE_SECONDS, write_queue=None):
+        self.conn = open_writer_connection(db["path"], db["wal"])
+        self.hot_size = hot_size
+        self.low_water = max(1, hot_size // 2)
+        self.batch_size = batch_size
+        self.logger = logger
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.write_queue = write_queue
+
+        self._hot = []             # heap of (-priority, rowid, url, depth)
+        self._pending = []
+        self._done = []
+        self._finishing = collections.deque()   # (page records queued by then, url) waiting for the writer
+        self._deferred = []
+        self._boosts = []
+        self._unfinished = 0
+        self._claimed = 0          # URLs claimed by this instance and not finished (hot window + in flight)
+        self._next_heartbeat = 0.0
+        self._wake = asyncio.Event()
+        self._not_empty = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._refill_task = None
+
+    def open(self, resume=True):
+        """Load the persisted frontier. URLs claimed by an earlier run under the same owner id, or
+        whose lease has expired, go back to the queue; live leases of other instances are kept.
+        Without resume the persisted frontier is discarded.
+        """
+        if resume:
+            self.conn.execute('''
+                UPDATE Frontier SET state = 0, owner = NULL, lease_expires = NULL
+                WHERE state = 1 AND (owner = ? OR lease_expires IS NULL OR lease_expires < ?)
+                ''', (self.owner, time.time()))
+        else:
+            self.conn.execute('DELETE FROM Frontier')
+        self.conn.commit()
+
+        self._unfinished = self.conn.execute('SELECT COUNT(*) FROM Frontier WHERE state < 2').fetchone()[0]
+        if self._unfinished:
+            self._finished.clear()
+        return self._unfinished
+
+    def start(self):
+        """Start the background refill task (needs a running loop)."""
+        self._refill_task = asyncio.create_task(self._refill_loop())
+        self._wake.set()
+
+    async def close(self):
+        """Stop the refill task, persist pending changes, release this instance's leases and close the connection."""
+        if self._refill_task:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+        await self._flush(0)
+        await asyncio.to_thread(self._release)
+        self.conn.close()
+
+    def _release(self):
+        """URLs still claimed (hot window, interrupted fetches, pages never committed) are free for
+        other instances right away.
+        """
+        self.conn.execute('''
+            UPDATE Frontier SET state = 0, owner = NULL, lease_expires = NULL
+            WHERE owner = ? AND state = 1
+            ''', (self.owner,))
+        self.conn.commit()
+
+    def qsize(self):
+        """Number of URLs queued, in the hot window or in flight."""
+        return self._unfinished
+
+    async def put(self, item, priority=0.0, next_eligible=0.0, reopen=False):
+        """Queue a (url, depth) item. It reaches the disk with the next batch flush.
+        A URL already fetched is ignored, unless `reopen` (a due revisit).
+        """
+        url, depth = item
+        self._pending.append((url, depth, priority, next_eligible, reopen))
+        self._unfinished += 1
+        self._finished.clear()
+        if len(self._pending) >= self.batch_size or len(self._hot) < self.low_water:
+            self._wake.set()
+
+    async def get(self):
+        """Return the next (url, depth) from the hot window, waiting for a refill when it is empty."""
+        _, url, depth = await self.get_scored()
+        return url, depth
+
+    async def get_scored(self):
+        """Like get(), with the URL's priority first: (priority, url, depth)."""
+        while not self._hot:
+            self._not_empty.clear()
+            self._wake.set()
+            await self._not_empty.wait()
+        negated, _, url, depth = heapq.heappop(self._hot)
+        if len(self._hot) < self.low_water:
+            self._wake.set()
+        return -negated, url, depth
+
+    def task_done(self, url):
+        """Mark a URL as finished; its frontier row is marked fetched with the first flush after its page is committed."""
+        if self.write_queue is None:
+            self._done.append((url,))
+        else:
+            self._finishing.append((self.write_queue.queued, url))
+        self._unfinished = max(0, self._unfinished - 1)
+        self._claimed -= 1
+        # After the last URL of this instance, flush at once and check whether the crawl is over
+        if len(self._done) >= self.batch_size or self._claimed <= 0:
+            self._wake.set()
+
+    def defer(self, url, next_eligible):
+        """Send a URL taken from RAM back to the queue on disk, not eligible before next_eligible."""
+        self._deferred.append((next_eligible, url))
+        self._claimed -= 1
+        if len(self._deferred) >= self.batch_size:
+            self._wake.set()
+
+    def boost(self, url, delta):
+        """Raise the priority of a URL by delta if it is still waiting on disk (not in a hot window)."""
+        self._boosts.append((delta, url))
+        if len(self._boosts) >= self.batch_size:
+            self._wake.set()
+
+    async def join(self):
+        """Wait until every queued URL has been marked done, by this instance or another one."""
+        await self._finished.wait()
+
+    def _idle(self):
+        """Nothing of this instance is buffered, in the hot window or in flight."""
+        return not (self._pending or self._done or self._finishing or self._deferred or self._hot) and self._claimed <= 0
+
+    def _commit_poll(self):
+        """Poll interval while the last finished URLs only wait for the writer (the end of the crawl is near), else None."""
+        return COMMIT_POLL if self._finishing and self._claimed <= 0 else None
+
+    def _committed(self):
+        """Move finished URLs whose page records the writer has committed to the done buffer."""
+        committed = self.write_queue.committed if self.write_queue is not None else 0
+        while self._finishing and self._finishing[0][0] <= committed:
+            self._done.append((self._finishing.popleft()[1],))
+
+    async def _flush(self, load_limit, heartbeat=False):
+        """Hand the pending buffers to a thread for writing and loading; see _sync."""
+        self._committed()
+        pending, self._pending = self._pending, []
+        done, self._done = self._done, []
+        deferred, self._deferred = self._deferred, []
+        boosts, self._boosts = self._boosts, []
+        return await asyncio.to_thread(self._sync, pending, done, deferred, boosts, load_limit, heartbeat)
+
+    def _sync(self, pending, done, deferred, boosts, load_limit, heartbeat=False):
+        """Persist pending puts, finished and deferred URLs and priority boosts, then claim up to load_limit ready URLs into RAM.
+        With heartbeat, this instance's leases are renewed and expired ones reclaimed first.
+        Runs in a thread. Returns (loaded (priority, rowid, url, depth) rows, ignored duplicate puts, next eligible time or None,
+        whether unfinished rows are left, their count when heartbeat else None).
+        """
+        cur = self.conn.cursor()
+        now = time.time()
+
+        ignored = 0
+        if pending:
+            fresh = [row[:4] for row in pending if not row[4]]
+            reopened = [row[:4] for row in pending if row[4]]
+            cur.executemany('''
+                INSERT OR IGNORE INTO Frontier (url, depth, priority, next_eligible)
+                VALUES (?, ?, ?, ?)
+                ''', fresh)
+            ignored = len(fresh) - cur.rowcount
+            if reopened:
+                cur.executemany('''
+                    INSERT INTO Frontier (url, depth, priority, next_eligible) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (url) DO UPDATE SET
+                        state = 0, depth = excluded.depth, priority = excluded.priority, next_eligible = excluded.next_eligible
+                    WHERE state = 2
+                    ''', reopened)
+                ignored += len(reopened) - cur.rowcount
+        if done:
+            cur.executemany('UPDATE Frontier SET state = 2, owner = NULL, lease_expires = NULL WHERE url = ?', done)
+        if deferred:
+            cur.executemany('UPDATE Frontier SET state = 0, owner = NULL, lease_expires = NULL, next_eligible = ? WHERE url = ?', deferred)
+        if boosts:
+            cur.executemany('UPDATE Frontier SET priority = priority + ? WHERE url = ? AND state = 0', boosts)
+
+        if heartbeat:
+            cur.execute('UPDATE Frontier SET lease_expires = ? WHERE owner = ? AND state = 1', (now + self.lease_seconds, self.owner))
+            cur.execute('''
+                UPDATE Frontier SET state = 0, owner = NULL, lease_expires = NULL
+                WHERE state = 1 AND lease_expires < ?
+                ''', (now,))
+            if cur.rowcount and self.logger:
+                self.logger.warning(f"Frontier: {cur.rowcount} expired leases reclaimed")
+
+        rows = []
+        next_eligible = None
+        if load_limit:
+            # Selected and claimed in one statement, so two instances never claim the same row
+            rows = cur.execute('''
+                UPDATE Frontier SET state = 1, owner = ?, lease_expires = ?
+                WHERE rowid IN (
+                    SELECT rowid FROM Frontier
+                    WHERE state = 0 AND next_eligible <= ?
+                    ORDER BY priority DESC, rowid
+                    LIMIT ?)
+                RETURNING priority, rowid, url, depth
+                ''', (self.owner, now + self.lease_seconds, now, load_limit)).fetchall()
+            if len(rows) < load_limit:
+                next_eligible = cur.execute('SELECT MIN(next_eligible) FROM Frontier WHERE state = 0').fetchone()[0]
+
+        self.conn.commit()
+
+        unfinished = bool(rows) or bool(cur.execute('SELECT EXISTS (SELECT 1 FROM Frontier WHERE state < 2)').fetchone()[0])
+        count = cur.execute('SELECT COUNT(*) FROM Frontier WHERE state < 2').fetchone()[0] if heartbeat else None
+        return rows, ignored, next_eligible, unfinished, count
+
+    async def _refill_loop(self):
+        """Keep the hot window above its low-water mark, the pending buffers flushed and the leases renewed."""
+        timeout = None
+        while True:
+            # Not asyncio.wait_for: before Python 3.12 it swallows a cancel that lands as the event
+            # is set, and close() would then wait for a wake-up that never comes
+            waiter = asyncio.ensure_future(self._wake.wait())
+            try:
+                await asyncio.wait((waiter,), timeout=timeout)
+            finally:
+                waiter.cancel()
+            self._wake.clear()
+
+            load_limit = self.hot_size - len(self._hot) if len(self._hot) < self.low_water else 0
+            self._committed()
+            unflushed = self._pending or self._done or self._deferred or self._boosts
+            heartbeat = time.monotonic() >= self._next_heartbeat
+            if not (load_limit or unflushed or heartbeat):
+                timeout = self._commit_poll()
+                continue
+
+            if heartbeat:
+                self._next_heartbeat = time.monotonic() + self.lease_seconds / 3
+            rows, ignored, next_eligible, unfinished, count = await self._flush(load_limit, heartbeat)
+
+            # Duplicate puts (already persisted or fetched) are not real work
+            if ignored:
+                self._unfinished = max(0, self._unfinished - ignored)
+            # Other instances' progress only shows in the table: recount on heartbeats
+            if count is not None:
+                self._unfinished = max(0, count + len(self._pending) - len(self._done) - len(self._finishing))
+
+            if rows:
+                self._claimed += len(rows)
+                for priority, rowid, url, depth in rows:
+                    heapq.heappush(self._hot, (-priority, rowid, url, depth))
+                self._not_empty.set()
+                if self.logger:
+                    self.logger.info(f"Frontier refill: {len(rows)} URLs loaded, {self._unfinished} unfinished")
+
+            if not unfinished and self._idle():
+                self._unfinished = 0
+                self._finished.set()
+
+            # Wake up again when delayed URLs become eligible
+            timeout = max(0.05, next_eligible - time.time()) if next_eligible else None
+
+            # Don't keep new or finished URLs only in RAM for long (crash safety), and keep
+            # looking while only other instances hold work (they may add links, or crash)
+            if self._pending or self._done or self._finishing or self._deferred or (unfinished and self._idle()):
+                timeout = min(timeout or FLUSH_INTERVAL, FLUSH_INTERVAL, IDLE_POLL)
+            if self._commit_poll():
+                timeout = min(timeout or COMMIT_POLL, COMMIT_POLL)
+
+            # Renew the leases before they run out
+            if self._claimed > 0:
+                timeout = min(timeout or self.lease_seconds, max(0.05, self._next_heartbeat - time.monotonic()))
@@ -0,0 +1,261 @@
+import itertools
+import math
+import time
+
+# Link-graph analytics need numpy
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# PageRank: damping factor; iterations stop once the ranks move less than TOLERANCE in total (L1)
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-6
+
+# A link travels from SQLite as one integer: from_id * PAIR_BASE + to_id
+PAIR_BASE = 1 << 32
+
+# Rows (or links) read from SQLite per round-trip, and links per vectorized step: both bound the temporary arrays
+FETCH_CHUNK = 500_000
+EDGE_BLOCK = 4_000_000
+
+
+#Def fetch_ids
+def fetch_ids(cur, query, chunk_size=FETCH_CHUNK):
+    """Run a single-column integer query into an int64 array, chunk by chunk."""
+    cur.execute(query)
+    parts = []
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        parts.append(np.fromiter(itertools.chain.from_iterable(rows), np.int64, count=len(rows)))
+    return np.concatenate(parts) if parts else np.empty(0, np.int64)
+
+#Def node_numbers
+def node_numbers(ids, values):
+    """Positions of URL ids in the sorted `ids`, and a mask of the ids that are there.
+    Ids without gaps (the usual case) are numbered by subtraction instead of a binary search.
+    """
+    if not len(ids):
+        return np.zeros(len(values), np.int64), np.zeros(len(values), bool)
+    if ids[-1] - ids[0] + 1 == len(ids):
+        positions = values - ids[0]
+        return positions, (positions >= 0) & (positions < len(ids))
+    positions = np.searchsorted(ids, values)
+    known = positions < len(ids)
+    known[known] = ids[positions[known]] == values[known]
+    return positions, known
+
+
+class LinkGraph:
+    """
+    The Links table as a CSR adjacency.
+
+    Node i is the URL whose id is ids[i] (ids sorted); its out-links are
+    targets[offsets[i]:offsets[i + 1]]. Targets are int32 node numbers, so the
+    graph takes 4 bytes per link plus 16 per URL, and every computation below is
+    a handful of numpy passes over these arrays, done EDGE_BLOCK links at a time.
+    """
+
+    def __init__(self, ids, offsets, targets):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+
+    @property
+    def nodes(self):
+        return len(self.ids)
+
+    @property
+    def edges(self):
+        return len(self.targets)
+
+    @classmethod
+    def load(cls, conn, chunk_size=FETCH_CHUNK):
+        """Read Urls and Links in one snapshot, into the CSR directly (no edge list in memory).
+
+        Links are read by ranges of source ids of about chunk_size links each, every range
+        as one comma-separated string of packed (from_id, to_id) integers parsed by numpy:
+        a Python object per link would cost more than the whole computation. Links to or
+        from ids missing from Urls are dropped. Raises RuntimeError without numpy.
+        """
+        if np is None:
+            raise RuntimeError("Link-graph analytics need numpy: pip install numpy")
+
+        cur = conn.cursor()
+        cur.execute('BEGIN')
+        try:
+            ids = fetch_ids(cur, 'SELECT id FROM Urls ORDER BY id', chunk_size)
+            if len(ids) and (ids[0] < 0 or ids[-1] >= 2 ** 31):
+                raise RuntimeError("URL ids out of the 0..2^31 range")
+            count = cur.execute('SELECT COUNT(*) FROM Links').fetchone()[0]
+            targets = np.empty(count, np.int32)
+            out_degree = np.zeros(len(ids), np.int64)
+            filled = 0
+
+            # Only sources that are URLs count; step so that a range holds about chunk_size links
+            first, last = (int(ids[0]), int(ids[-1])) if len(ids) else (0, -1)
+            step = max(1, math.ceil((last - first + 1) * chunk_size / count)) if count else 1
+            for low in range(first, last + 1, step):
+                # Unary + keeps the planner on the primary key: the to_id index would read every link per range
+                text = cur.execute('''
+                    SELECT group_concat(from_id * ? + to_id) FROM Links
+                    WHERE from_id >= ? AND from_id < ? AND +to_id >= 0 AND +to_id < ?
+                    ''', (PAIR_BASE, low, low + step, PAIR_BASE)).fetchone()[0]
+                if not text:
+                    continue
+                packed = np.fromstring(text, dtype=np.int64, sep=',')
+                # Primary key order in practice; grouped by source either way
+                if len(packed) > 1 and not (packed[1:] >= packed[:-1]).all():
+                    packed.sort()
+
+                sources, known_sources = node_numbers(ids, packed // PAIR_BASE)
+                dests, known_dests = node_numbers(ids, packed % PAIR_BASE)
+                known = known_sources & known_dests
+                sources, dests = sources[known], dests[known]
+
+                targets[filled:filled + len(dests)] = dests
+                filled += len(dests)
+                if len(sources):
+                    out_degree[sources[0]:sources[-1] + 1] += np.bincount(sources - sources[0])
+        finally:
+            conn.rollback()
+
+        offsets = np.zeros(len(ids) + 1, np.int64)
+        np.cumsum(out_degree, out=offsets[1:])
+        return cls(ids, offsets, targets[:filled])
+
+    def out_degree(self):
+        return np.diff(self.offsets)
+
+    def in_degree(self):
+        return np.bincount(self.targets, minlength=self.nodes)
+
+    def _blocks(self, size=EDGE_BLOCK):
+        """Node ranges whose out-links add up to about `size` links each."""
+        inner = np.searchsorted(self.offsets, np.arange(size, self.edges, size), side='right') - 1
+        bounds = np.unique(np.concatenate(([0], inner, [self.nodes])))
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def pagerank(self, damping=DAMPING, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+        """PageRank by power iteration. The rank of pages without out-links is spread over
+        every page. Returns (ranks summing to 1, iterations run).
+        """
+        n = self.nodes
+        if not n:
+            return np.empty(0), 0
+        out_degree = self.out_degree()
+        dangling = out_degree == 0
+        inverse = np.zeros(n)
+        np.divide(1.0, out_degree, out=inverse, where=~dangling)
+        blocks = self._blocks()
+
+        rank = np.full(n, 1.0 / n)
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            share = rank * inverse
+            pulled = np.zeros(n)
+            for start, stop in blocks:
+                links = self.targets[self.offsets[start]:self.offsets[stop]]
+                pulled += np.bincount(links, weights=np.repeat(share[start:stop], out_degree[start:stop]), minlength=n)
+
+            updated = damping * (pulled + rank[dangling].sum() / n) + (1.0 - damping) / n
+            change = np.abs(updated - rank).sum()
+            rank = updated
+            if change < tolerance:
+                break
+        return rank, iteration
+
+    def depths(self, source):
+        """Links followed from node `source` to each node (breadth first, one vectorized step
+        per level); -1 where it can't be reached.
+        """
+        depth = np.full(self.nodes, -1, np.int32)
+        depth[source] = 0
+        level_nodes = np.array([source], np.int64)
+        level = 0
+        while level_nodes.size:
+            level += 1
+            starts = self.offsets[level_nodes]
+            counts = self.offsets[level_nodes + 1] - starts
+            total = int(counts.sum())
+            if not total:
+                break
+            # Positions of every out-link of this level in targets, without a Python loop
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            reached = self.targets[positions]
+            level_nodes = np.unique(reached[depth[reached] < 0])
+            depth[level_nodes] = level
+        return depth
+
+    def node_of(self, url_id):
+        """Node number of a URL id, or None."""
+        position = int(np.searchsorted(self.ids, url_id))
+        if position < self.nodes and self.ids[position] == url_id:
+            return position
+        return None
+
+
+#Def write_link_stats
+def write_link_stats(conn, graph, in_degree, out_degree, rank, depth, chunk_size=FETCH_CHUNK):
+    """Replace the LinkStats table with the scores just computed, in one transaction."""
+    cur = conn.cursor()
+    cur.execute('BEGIN')
+    try:
+        cur.execute('DELETE FROM LinkStats')
+        for start in range(0, graph.nodes, chunk_size):
+            stop = start + chunk_size
+            depths = [value if value >= 0 else None for value in depth[start:stop].tolist()]
+            cur.executemany(
+                'INSERT INTO LinkStats (url_id, in_degree, out_degree, pagerank, depth) VALUES (?, ?, ?, ?, ?)',
+                zip(graph.ids[start:stop].tolist(), in_degree[start:stop].tolist(), out_degree[start:stop].tolist(),
+                    rank[start:stop].tolist(), depths))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+#Def analyze_links
+def analyze_links(db, seed_url=None, top=10):
+    """Compute in/out degree, PageRank and depth from the seed over the Links table and store them
+    in LinkStats. Returns a summary dict, with the `top` pages by PageRank as (url, rank, in-degree).
+    """
+    conn = db["conn"]
+    started = time.perf_counter()
+    graph = LinkGraph.load(conn)
+    loaded = time.perf_counter()
+
+    in_degree = graph.in_degree()
+    out_degree = graph.out_degree()
+    rank, iterations = graph.pagerank()
+
+    seed = None
+    if seed_url:
+        row = conn.execute('SELECT id FROM Urls WHERE name = ?', (seed_url,)).fetchone()
+        seed = graph.node_of(row[0]) if row else None
+    depth = graph.depths(seed) if seed is not None else np.full(graph.nodes, -1, np.int32)
+    computed = time.perf_counter()
+
+    write_link_stats(conn, graph, in_degree, out_degree, rank, depth)
+    written = time.perf_counter()
+
+    best = np.empty(0, np.int64)
+    if top and graph.nodes:
+        best = np.argpartition(rank, -min(top, graph.nodes))[-top:]
+        best = best[np.argsort(rank[best])[::-1]]
+    names = dict(conn.execute(
+        f'SELECT id, name FROM Urls WHERE id IN ({",".join("?" * len(best))})', graph.ids[best].tolist()).fetchall())
+    return {
+        "pages": graph.nodes,
+        "links": graph.edges,
+        "iterations": iterations,
+        "reached_from_seed": int((depth >= 0).sum()),
+        "max_depth": int(depth.max()) if graph.nodes else 0,
+        "load_seconds": loaded - started,
+        "compute_seconds": computed - loaded,
+        "write_seconds": written - computed,
+        "top": [(names.get(int(graph.ids[i])), float(rank[i]), int(in_degree[i])) for i in best],
+    }
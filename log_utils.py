@@ -0,0 +1,127 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+
+
+# Pass as `extra=SAMPLED` on per-URL / per-link debug events: only one in log_sample_every is kept
+SAMPLED = {"sampled": True}
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+SKIPPED_FORMAT = '%(asctime)s SKIPPED: %(message)s'
+
+_listener = None
+
+
+class SampleFilter(logging.Filter):
+    """Keep one in `every` records flagged with SAMPLED; everything else passes."""
+
+    def __init__(self, every=100):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        return next(self._counter) % self.every == 0
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus the `fields` dict passed via extra."""
+
+    def format(self, record):
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _only(name):
+    return lambda record: record.name == name
+
+def _general(record):
+    return record.name not in ('error_logger', 'skipped_logger')
+
+#Def setup_loggers
+def setup_loggers(level="INFO", log_format="text", sample_every=100):
+    """Sets up a general logger, a skipped logger and an error logger, with corresponding handlers and levels.
+    Records are handed to a QueueHandler on the calling thread and written to the log files by a
+    QueueListener thread, so the event loop never blocks on disk. log_format "json" writes JSON lines.
+    Calling it again (e.g. once the config is read) replaces the previous setup.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+
+    def formatter(text_format):
+        return JsonLinesFormatter() if log_format == "json" else logging.Formatter(text_format)
+
+    # General log
+    general_handler = logging.FileHandler('crawler.log')
+    general_handler.setFormatter(formatter(TEXT_FORMAT))
+    general_handler.addFilter(_general)
+
+    # Error log
+    error_handler = logging.FileHandler('crawler_errors.log')
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(formatter(TEXT_FORMAT))
+    error_handler.addFilter(_only('error_logger'))
+
+    # Skipped pages log
+    skipped_handler = logging.FileHandler('skipped_pages.log')
+    skipped_handler.setFormatter(formatter(SKIPPED_FORMAT))
+    skipped_handler.addFilter(_only('skipped_logger'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(sample_every))
+
+    _listener = logging.handlers.QueueListener(log_queue, general_handler, error_handler, skipped_handler, respect_handler_level=True)
+    _listener.start()
+
+    # General logger
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    # Error and skipped loggers
+    error_logger = logging.getLogger('error_logger')
+    skipped_logger = logging.getLogger('skipped_logger')
+    for named_logger, named_level in ((error_logger, logging.ERROR), (skipped_logger, logging.INFO)):
+        for handler in list(named_logger.handlers):
+            named_logger.removeHandler(handler)
+        named_logger.addHandler(queue_handler)
+        named_logger.setLevel(named_level)
+        named_logger.propagate = False
+
+    # Return for use
+    return logger, error_logger, skipped_logger
+
+#Def get_loggers
+def get_loggers():
+    """The general, error and skipped loggers, as set up by setup_loggers."""
+    return logging.getLogger(), logging.getLogger('error_logger'), logging.getLogger('skipped_logger')
+
+#Def stop_logging
+@atexit.register
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,25 +1,43 @@
-import aiohttp
 import argparse
 import asyncio
-import collections
 import json
 import logging
+import multiprocessing
 import re
+import time
 
-from crawler import setup_loggers, worker, enqueue_url, normalize_url
-from dataclasses import dataclass
-from db import db_initialization
-from export_utilities import export_to_csv, export_to_json
-from typing import Dict
+from browser_pool import BrowserPool
+from concurrent.futures import Executor, ProcessPoolExecutor
+from crawler import worker, enqueue_url, load_host_rules, politeness_delay
+from dataclasses import dataclass, field
+from db import WriteQueue, db_initialization, db_writer
+from export_utilities import EXPORTERS, export_results
+from fetch_utility import create_session
+from frontier import Frontier
+from link_graph import analyze_links
+from log_utils import get_loggers, setup_loggers
+from metrics import Metrics, report_metrics, start_metrics_server
+from neardup import SimHashIndex
+from parse import normalize_url
+from priority import DEFAULT_AGING, UrlScorer
+from recrawl import load_revisits
+from render_router import RenderRouter
+from robots import RobotsCache
+from scheduler import PolitenessScheduler
+from search import rebuild_term_stats, search_pages
+from shards import ShardRouter, merge_shard, shard_config, shard_db_path, wait_for_completion
+from sitemap import seed_from_sitemaps
+from throttle import MIN_LATENCY_GAP, HostLimiters
+from typing import Optional
+from url_index import SeenIndex
 from urllib.parse import urlparse
-from urllib.robotparser import RobotFileParser
 
 @dataclass
 class CrawlerContext:
     base_domain: str                
     rules: dict                       
     db: dict                           
-    semaphores: Dict[str, asyncio.Semaphore] 
+    limiters: HostLimiters
     logger: logging.Logger
     error_logger: logging.Logger
     skipped_logger: logging.Logger
@@ -27,23 +45,62 @@ class CrawlerContext:
     batch_size: int                
     output_format: str
     user_agent: str
+    use_playwright: bool = False
+    parse_workers: int = 0
+    parse_pool: Optional[Executor] = None
+    write_queue: Optional[WriteQueue] = None
+    seen: Optional[SeenIndex] = None
+    scheduler: Optional[PolitenessScheduler] = None
+    robots: Optional[RobotsCache] = None
+    browser_pool: Optional[BrowserPool] = None
+    render_router: Optional[RenderRouter] = None
+    frontier: Optional[Frontier] = None
+    near_duplicates: Optional[SimHashIndex] = None
+    shards: Optional[ShardRouter] = None
+    scorer: UrlScorer = field(default_factory=UrlScorer)
+    metrics: Metrics = field(default_factory=Metrics)
+    revisits: dict = field(default_factory=dict)
+    throttled: dict = field(default_factory=dict)   # url -> 429/503 answers so far
+    fetches_started: int = 0
+    fetches_finished: int = 0
+    budget_spent: asyncio.Event = field(default_factory=asyncio.Event)
 
-logger, error_logger, skipped_logger = setup_loggers()
 
 #Def main()
-async def main(ctx: CrawlerContext, resume=False):
+async def main(ctx: CrawlerContext, resume=False, recrawl=False):
     """Main crawling loop that sets up the URL queue, starts worker tasks,
     manages asynchronous fetching, processes pages, and handles exporting results.
     Supports resuming unfinished crawls or starting fresh, with optional delays
     and concurrency limits per domain. Logs progress, skipped pages, and errors.
+    With recrawl, already fetched pages whose revisit is due are fetched again conditionally.
+    As one shard of a multi-process crawl (ctx.shards), it only fetches the URLs it owns and
+    runs until the coordinator sees every shard finished.
     """
     logging.info("main started")
 
-    # Setup queue (local)
-    url_queue = asyncio.Queue()
+    # In a multi-process crawl the seed (and the sitemaps) are handled by the shard owning the seed URL
+    owns_seed = ctx.shards is None or ctx.shards.owns(ctx.seed_url)
+
+    # Page records for the single DB writer task (started below), through a bounded queue
+    ctx.write_queue = WriteQueue(maxsize=ctx.rules["db_batch_size"] * 4)
+
+    # Setup the persistent frontier: a small hot window in RAM, the rest in SQLite.
+    # A URL is marked fetched there once the writer has committed its page
+    url_queue = Frontier(ctx.db, hot_size=ctx.rules["frontier_hot_size"], batch_size=ctx.rules["frontier_batch_size"], logger=ctx.logger,
+                         owner=ctx.rules["instance_id"], lease_seconds=ctx.rules["frontier_lease_seconds"], write_queue=ctx.write_queue)
+    persisted = url_queue.open(resume)
+    ctx.frontier = url_queue
+
+    # Already fetched or already queued URLs are never enqueued again
+    fetched_count = ctx.seen.load(ctx.db["cur"], 'SELECT name FROM Urls WHERE date IS NOT NULL')
+    ctx.seen.load(ctx.db["cur"], 'SELECT url FROM Frontier')
+    ctx.logger.info(f"Seen index ({ctx.seen.mode}) loaded with {fetched_count} fetched and {persisted} queued URLs.")
 
     # Load URLs into queue according to resume flag
-    if resume:
+    if resume and persisted:
+        ctx.logger.info(f"Resume mode: {persisted} URLs restored from the frontier with their depth.")
+
+    elif resume:
 
         ctx.logger.info("Resume mode: checking for unfinished URLs...")
         ctx.db["cur"].execute('SELECT name FROM Urls WHERE date IS NULL')
@@ -51,68 +108,220 @@ async def main(ctx: CrawlerContext, resume=False):
         ctx.logger.info(f"Found {len(unfinished_urls)} unfinished URLs.")
 
         if unfinished_urls:
+            # Database from before the frontier existed: depth is unknown
             for (url,) in unfinished_urls:
-                await enqueue_url(url_queue, url, 0)
-                print("Queue size after enqueue:", url_queue.qsize())
-        else:
+                ctx.seen.add(url)
+                if ctx.shards is not None and not ctx.shards.owns(url):
+                    ctx.shards.send(url, 0, ctx.scorer.priority(url, 0))
+                else:
+                    await enqueue_url(url_queue, url, 0, ctx.scorer.priority(url, 0))
+            ctx.logger.info(f"Queue size after enqueue: {url_queue.qsize()}")
+        elif owns_seed:
             # If none unfinished, enqueue ctx.seed_url
             ctx.db["cur"].execute('INSERT OR IGNORE INTO Urls (name) VALUES (?)', (ctx.seed_url,))
             ctx.db["cur"].execute('UPDATE Urls SET date=NULL WHERE name=?', (ctx.seed_url,))
             ctx.db["conn"].commit()
-            await enqueue_url(url_queue, ctx.seed_url, 0)
+            ctx.seen.add(ctx.seed_url)
+            await enqueue_url(url_queue, ctx.seed_url, 0, ctx.scorer.priority(ctx.seed_url, 0))
             #print("it has reached this else")
-            print("Queue size after enqueue:", url_queue.qsize())
-    else:
+            ctx.logger.info(f"Queue size after enqueue: {url_queue.qsize()}")
+    elif owns_seed:
         # Fresh start
         ctx.db["cur"].execute('INSERT OR IGNORE INTO Urls (name) VALUES (?)', (ctx.seed_url,))
         ctx.db["conn"].commit()
-        await enqueue_url(url_queue, ctx.seed_url, 0)
+        if ctx.seen.add(ctx.seed_url):
+            await enqueue_url(url_queue, ctx.seed_url, 0, ctx.scorer.priority(ctx.seed_url, 0))
         #print("it has reached this fresh start")
 
+    # Re-crawl: due pages bypass the seen index and are queued again although fetched; the frontier ignores ones already queued
+    if recrawl:
+        ctx.revisits = load_revisits(ctx.db["cur"])
+        ctx.logger.info(f"Recrawl mode: {len(ctx.revisits)} pages due for a revisit.")
+        for url in ctx.revisits:
+            await url_queue.put((url, 0), priority=ctx.scorer.priority(url, 0), reopen=True)
+
+    url_queue.start()
+
+    # Politeness: per-host next-allowed times decide which URL a worker gets next
+    # and robots.txt is loaded before a host's first URL is handed out, so its Crawl-delay counts from the start
+    ctx.scheduler = PolitenessScheduler(url_queue, lambda host: politeness_delay(ctx, host), per_host_limit=ctx.rules["scheduler_per_host_limit"],
+                                        logger=ctx.logger, prepare_fn=lambda host, url: load_host_rules(ctx, host, url))
+    ctx.scheduler.start()
+
     workers_count = ctx.batch_size or 1
 
-    # Create the aiohttp session here
-    async with aiohttp.ClientSession() as session:
+    # Parse pool: raw HTML goes to worker processes, compact PageResults come back
+    if ctx.parse_workers:
+        ctx.parse_pool = ProcessPoolExecutor(max_workers=ctx.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        ctx.logger.info(f"Parsing pages in {ctx.parse_workers} worker processes")
+
+    # Dynamic fetches share one browser with a fixed number of pages
+    if ctx.use_playwright:
+        ctx.browser_pool = BrowserPool(
+            user_agent=ctx.user_agent,
+            contexts=ctx.rules["playwright_contexts"],
+            pages_per_context=ctx.rules["playwright_pages_per_context"],
+            queue_size=ctx.rules["playwright_queue_size"],
+            blocked_resources=ctx.rules["playwright_block_resources"],
+            wait_until=ctx.rules["playwright_wait_until"],
+            wait_selector=ctx.rules["playwright_wait_selector"],
+            timeout=ctx.rules["playwright_timeout"],
+            recycle_after=ctx.rules["playwright_recycle_after"],
+            logger=ctx.logger,
+        )
+        ctx.render_router = RenderRouter(
+            prefix_depth=ctx.rules["render_prefix_depth"],
+            min_samples=ctx.rules["render_min_samples"],
+            threshold=ctx.rules["render_threshold"],
+        )
+        learned = ctx.render_router.load(ctx.db["cur"])
+        ctx.logger.info(f"Render router loaded {learned} learned path prefixes.")
+
+    # Near-duplicate pages (same visible text under another URL) are recorded as aliases, not parsed.
+    # A shard only indexes the pages it fetched: copies whose URLs belong to different shards are not matched
+    if ctx.rules["detect_near_duplicates"]:
+        ctx.near_duplicates = SimHashIndex(max_distance=ctx.rules["near_duplicate_distance"])
+        indexed = ctx.near_duplicates.load(ctx.db["cur"])
+        ctx.logger.info(f"Near-duplicate index loaded with {indexed} page fingerprints.")
+
+    # Single DB writer task, fed by the workers through the bounded queue
+    writer_task = asyncio.create_task(db_writer(ctx, ctx.write_queue))
+
+    # Live metrics: Prometheus-style endpoint and a periodic summary line
+    metrics_runner = None
+    if ctx.rules["metrics_port"]:
+        metrics_runner = await start_metrics_server(ctx, ctx.rules["metrics_host"], ctx.rules["metrics_port"])
+    report_task = asyncio.create_task(report_metrics(ctx, ctx.rules["metrics_interval"])) if ctx.rules["metrics_interval"] else None
+
+    # Create the shared aiohttp session here (pooled connections, one SSL context)
+    async with create_session(ctx.rules) as session:
+
+        # robots.txt of every host is fetched on first use through the same session
+        if ctx.rules["respect_robots_txt"]:
+            ctx.robots = RobotsCache(session, ctx.user_agent, ttl=ctx.rules["robots_cache_ttl"], max_hosts=ctx.rules["robots_cache_size"], logger=ctx.logger)
+
+        # Bulk-seed the frontier from sitemaps while the workers already crawl
+        seed_task = asyncio.create_task(seed_from_sitemaps(ctx, session, url_queue)) if ctx.rules["use_sitemaps"] and owns_seed else None
 
         # Start workers with session argument
         worker_tasks = [asyncio.create_task(worker(session, url_queue, ctx)) for _ in range(workers_count)]
 
-        # Wait until local queue is empty
-        await url_queue.join()
+        if seed_task is not None:
+            seeded = await seed_task
+            ctx.logger.info(f"Sitemap seeding done: {seeded} URLs queued.")
+
+        # Wait until local queue is empty (every shard's queue, in a multi-process crawl) or the page budget is spent
+        if ctx.shards is not None:
+            await ctx.shards.run(ctx, url_queue)
+        else:
+            waits = [asyncio.create_task(url_queue.join()), asyncio.create_task(ctx.budget_spent.wait())]
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            for wait in waits:
+                wait.cancel()
+            if ctx.budget_spent.is_set():
+                ctx.logger.info(f"Page budget of {ctx.rules['max_pages']} spent, {url_queue.qsize()} URLs left queued for a later run.")
 
         # Cancel workers
         for w in worker_tasks:
             w.cancel()
         await asyncio.gather(*worker_tasks, return_exceptions=True)
 
+    if ctx.browser_pool is not None:
+        await ctx.browser_pool.close()
+    if ctx.render_router is not None:
+        ctx.render_router.save(ctx.db["conn"])
+
+    if report_task is not None:
+        report_task.cancel()
+    ctx.logger.info(f"Final metrics: {ctx.metrics.summary_line(ctx)}")
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+    for host, state in ctx.limiters.snapshot().items():
+        ctx.logger.info(f"Final concurrency for {host}: {state['limit']} ({state['reason']})")
+
+    # Flush pending page records and stop the writer
+    await ctx.write_queue.put(None)
+    await writer_task
+    await ctx.scheduler.close()
+    await url_queue.close()
+
+    if ctx.parse_pool is not None:
+        ctx.parse_pool.shutdown(cancel_futures=True)
+        ctx.parse_pool = None
+    if ctx.shards is not None:
+        ctx.shards.close()
+
 # Export results
-    if ctx.output_format == 'json':
-        export_to_json(ctx)
-    elif ctx.output_format == 'csv':
-        export_to_csv(ctx)
+    if ctx.output_format in EXPORTERS:
+        export_results(ctx.db, ctx.output_format)
     else:
         ctx.logger.info("Output stored in SQLite database")
 
     ctx.db["conn"].close()
 
-#####################################
-#Command line interface section
-#####################################
+#Def run_shard
+def run_shard(index, count, config, overrides, recrawl, inboxes, status_queue, done):
+    """Entry point of one shard process of a multi-process crawl (see run_sharded)."""
+    setup_loggers(config.get("logging_level", "INFO"), config.get("log_format", "text"), config.get("log_sample_every", 100))
+    ctx = build_context(shard_config(config, index, count), output='sqlite', **overrides)
+    ctx.shards = ShardRouter(index, count, inboxes, status_queue, done)
+    asyncio.run(main(ctx, resume=True, recrawl=recrawl))
 
-def cli_main():
-    """Parse configuration and CLI arguments, initialize database and context,
-    set up loggers and semaphores, and run the main crawling coroutine.
-    Handles overrides from CLI such as domain, depth, output format, resume flag,
-    and optional Playwright usage.
+#Def run_sharded
+def run_sharded(config, count, overrides, output=None, recrawl=False):
     """
-    logging.info("cli_main started")
+    Multi-process crawl: `count` shard processes, each with its own event loop, workers,
+    parse pool and database, every URL owned by exactly one shard. Links to URLs owned by
+    another shard travel through that shard's inbox queue. This process coordinates: it
+    stops the shards once all of them are idle with no URL in flight, then merges the
+    shard databases into the main one and exports as a single-process crawl would.
+    """
+    logger, error_logger, _ = get_loggers()
+    mp = multiprocessing.get_context("spawn")
+    inboxes = [mp.Queue() for _ in range(count)]
+    status_queue = mp.Queue()
+    done = mp.Event()
 
-    #Config setup
-    with open('config.json') as f:
-        config = json.load(f)
+    processes = [
+        mp.Process(target=run_shard, name=f"crawl-shard-{index}",
+                   args=(index, count, config, overrides, recrawl, inboxes, status_queue, done))
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Multi-process crawl: {count} shards started")
+
+    finished = wait_for_completion(status_queue, processes, count, logger=error_logger)
+    logger.info("All shards idle, stopping the crawl" if finished else "Crawl stopped after a shard failure")
+    done.set()
+    for process in processes:
+        process.join()
+    status_queue.cancel_join_thread()
 
+    # Merge every shard database into the main one
+    db = db_initialization(config.get("database_path", "mini.sqlite"), config.get("sqlite_wal", True))
+    for index in range(count):
+        path = shard_db_path(config.get("database_path", "mini.sqlite"), index)
+        merged = merge_shard(db["conn"], path)
+        logger.info(f"Merged shard {index} ({path}): {merged} URLs")
+    terms = rebuild_term_stats(db["conn"])
+    logger.info(f"Document frequencies recounted for {terms} terms")
+
+    output_format = output or config.get("output_format", "sqlite")
+    if output_format in EXPORTERS:
+        export_results(db, output_format)
+    db["conn"].close()
+
+#Def build_context
+def build_context(config, domain=None, depth=None, output=None, playwright=False):
+    """Open the database and build the CrawlerContext (rules, limiters, seen index, URL scorer) from a config dict.
+    domain, depth, output and playwright are the CLI overrides. Logs go to the loggers set up by setup_loggers.
+    """
+    logger, error_logger, skipped_logger = get_loggers()
     db_path = config.get("database_path", "mini.sqlite")
-    db = db_initialization(db_path)
+    sqlite_wal = config.get("sqlite_wal", True)
+    db = db_initialization(db_path, sqlite_wal)
     seed_url = config['seed_url']
     delay_min, delay_max = config['delay_range']
     batch_size = config['batch_size']
@@ -126,61 +335,41 @@ def cli_main():
     compiled_exclude_regexes = [re.compile(p) for p in exclude_patterns]
     min_content_length = config.get('min_content_length', 0)
     max_content_length = config.get('max_content_length', 10_000_000)
+    parse_workers = config.get('parse_workers', 0)
+    seen_index = SeenIndex(
+        mode=config.get('seen_index', 'exact'),
+        capacity=config.get('seen_index_capacity', 10_000_000),
+        error_rate=config.get('seen_index_error_rate', 0.001)
+    )
 
-    #Argparser setup
-    parser = argparse.ArgumentParser(description='Async Web Crawler with Playwright')
-    parser.add_argument('--domain', type=str, default=None, help='Domain to crawl (overrides config)')
-    parser.add_argument('--depth', type=int, default=None, help='Crawl depth limit')
-    parser.add_argument('--output', type=str, choices=['sqlite', 'json', 'csv'], default=None, help='Output format')
-    parser.add_argument('--resume', action='store_true', help='Resume crawling from unfinished URLs')
-    parser.add_argument('--playwright', action='store_true', help='Use Playwright for dynamic content fetching')
-    # Subarguments for on demand export
-    parser.add_argument('--export', choices=['json', 'csv'], help='Export existing database to JSON or CSV (no crawling)')
-    parser.add_argument('--export-file', type=str, help='Optional filename for export output')
-
-    args = parser.parse_args()
-
-    # Handle on-demand export mode
-    if args.export:
-        db = db_initialization(db_path)
-        if args.export == 'json':
-            export_to_json(db, args.export_file or 'exported_data.json')
-        else:
-            export_to_csv(db, args.export_file or 'exported_data.csv')
-        #print(f"Exported crawl results to {args.export_file or f'exported_data.{args.export}'}")
-        return
-
-    # Initialize semaphores after reading config
-    domain_semaphores = collections.defaultdict(lambda: asyncio.Semaphore(max_concurrent_per_domain))
-    semaphores = domain_semaphores
+    # Initialize per-host concurrency limiters after reading config (fixed limit when adaptive is off)
+    adaptive = config.get('adaptive_concurrency', True)
+    limiters = HostLimiters(
+        initial=max_concurrent_per_domain,
+        min_limit=config.get('min_concurrent_per_domain', 1) if adaptive else max_concurrent_per_domain,
+        max_limit=config.get('max_concurrent_per_domain_ceiling', 16) if adaptive else max_concurrent_per_domain,
+        latency_factor=config.get('latency_slowdown_factor', 2.0),
+        min_latency_gap=config.get('latency_slowdown_min_gap', MIN_LATENCY_GAP),
+        logger=logger
+    )
 
     # Override ctx.seed_url with CLI domain if provided
-    if args.domain:
-        seed_url = args.domain
+    if domain:
+        seed_url = domain
 
     # Normalize ctx.seed_url and get base_domain after override
     seed_url = normalize_url(seed_url)
     base_domain = urlparse(seed_url).netloc
-    crawl_depth_limit = args.depth or crawl_depth_limit
-    output_format = args.output or output_format
-    #use_playwright = args.playwright or use_playwright
-
-    # Setup robots.txt
-    parsed_seed = urlparse(seed_url)
-    robots_url = f"{parsed_seed.scheme}://{parsed_seed.netloc}/robots.txt"
-    rp = RobotFileParser()
-    rp.set_url(robots_url)
-    try:
-        rp.read()
-    except Exception as e:
-        logger.error(f"Could not read robots.txt: {e}")
+    crawl_depth_limit = depth or crawl_depth_limit
+    output_format = output or output_format
+    use_playwright = playwright or use_playwright
 
     # Context rules
     rules = {
-        "rp": rp,
         "base_domain": base_domain,
         "include_paths": include_paths,
         "exclude_regexes": compiled_exclude_regexes,
+        "file_type_filters": tuple(f.lower() for f in file_type_filters),
         "min_content_length": min_content_length,
         "max_content_length": max_content_length,
         "crawl_depth_limit": crawl_depth_limit,
@@ -193,6 +382,44 @@ def cli_main():
         "max_redirects": config.get("max_redirects", 5),
         "timeout_seconds": config.get("timeout_seconds", 10),
         "respect_robots_txt": config.get("respect_robots_txt", True),
+        "robots_cache_ttl": config.get("robots_cache_ttl", 86400),
+        "robots_cache_size": config.get("robots_cache_size", 1000),
+        "use_sitemaps": config.get("use_sitemaps", True),
+        "playwright_contexts": config.get("playwright_contexts", 2),
+        "playwright_pages_per_context": config.get("playwright_pages_per_context", 2),
+        "playwright_queue_size": config.get("playwright_queue_size", 8),
+        "playwright_block_resources": config.get("playwright_block_resources", ["image", "font", "media", "stylesheet"]),
+        "playwright_wait_until": config.get("playwright_wait_until", "domcontentloaded"),
+        "playwright_wait_selector": config.get("playwright_wait_selector"),
+        "playwright_timeout": config.get("playwright_timeout", 15000),
+        "playwright_recycle_after": config.get("playwright_recycle_after", 100),
+        "render_prefix_depth": config.get("render_prefix_depth", 1),
+        "render_min_samples": config.get("render_min_samples", 3),
+        "render_threshold": config.get("render_threshold", 0.8),
+        "detect_near_duplicates": config.get("detect_near_duplicates", True),
+        "near_duplicate_distance": config.get("near_duplicate_distance", 3),
+        "metrics_host": config.get("metrics_host", "127.0.0.1"),
+        "metrics_port": config.get("metrics_port"),
+        "metrics_interval": config.get("metrics_interval", 10),
+        "sitemap_urls": config.get("sitemap_urls", []),
+        "sitemap_max_urls": config.get("sitemap_max_urls", 100000),
+        "max_retry_after": config.get("max_retry_after", 60),
+        "verify_ssl": config.get("verify_ssl", False),
+        "connection_limit": config.get("connection_limit", 100),
+        "connection_limit_per_host": config.get("connection_limit_per_host", config.get("max_concurrent_per_domain_ceiling", 16)),
+        "dns_cache_ttl": config.get("dns_cache_ttl", 300),
+        "keepalive_timeout": config.get("keepalive_timeout", 30),
+        "db_batch_size": config.get("db_batch_size", 200),
+        "db_flush_interval": config.get("db_flush_interval", 1.0),
+        "frontier_hot_size": config.get("frontier_hot_size", 200),
+        "frontier_batch_size": config.get("frontier_batch_size", 500),
+        "frontier_lease_seconds": config.get("frontier_lease_seconds", 60),
+        "instance_id": config.get("instance_id"),
+        "scheduler_per_host_limit": config.get("scheduler_per_host_limit", 100),
+        "recrawl_interval": config.get("recrawl_interval", 86400),
+        "recrawl_min_interval": config.get("recrawl_min_interval", 3600),
+        "recrawl_max_interval": config.get("recrawl_max_interval", 2592000),
+        "max_pages": config.get("max_pages"),
     }
 
     # Dataclass creation
@@ -200,17 +427,117 @@ def cli_main():
         base_domain=base_domain,
         rules=rules,
         db=db,
-        semaphores=semaphores,
+        limiters=limiters,
         logger=logger,
         error_logger=error_logger,
         skipped_logger=skipped_logger,
         seed_url=seed_url,
         batch_size=batch_size,
         output_format=output_format,
-        user_agent=rules.get("user_agent")
+        user_agent=rules.get("user_agent"),
+        use_playwright=use_playwright,
+        parse_workers=parse_workers,
+        seen=seen_index,
+        scorer=UrlScorer(weights=config.get("priority_weights"), aging=config.get("priority_aging", DEFAULT_AGING))
     )
+    return ctx
+
+#####################################
+#Command line interface section
+#####################################
+
+def cli_main():
+    """Parse configuration and CLI arguments, initialize database and context,
+    set up loggers and per-host limiters, and run the main crawling coroutine.
+    Handles overrides from CLI such as domain, depth, output format, resume flag,
+    and optional Playwright usage.
+    """
+    #Config setup
+    with open('config.json') as f:
+        config = json.load(f)
+
+    # Logging level and format come from the config. Not at import time: spawned parse workers re-import this module
+    setup_loggers(config.get("logging_level", "INFO"), config.get("log_format", "text"), config.get("log_sample_every", 100))
+    logging.info("cli_main started")
+
+    #Argparser setup
+    parser = argparse.ArgumentParser(description='Async Web Crawler with Playwright')
+    parser.add_argument('--domain', type=str, default=None, help='Domain to crawl (overrides config)')
+    parser.add_argument('--depth', type=int, default=None, help='Crawl depth limit')
+    parser.add_argument('--output', type=str, choices=['sqlite', *EXPORTERS], default=None, help='Output format')
+    parser.add_argument('--resume', action='store_true', help='Resume crawling from unfinished URLs')
+    parser.add_argument('--playwright', action='store_true', help='Use Playwright for dynamic content fetching')
+    parser.add_argument('--recrawl', action='store_true', help='Revisit already crawled pages that are due, conditionally (ETag/Last-Modified)')
+    parser.add_argument('--processes', type=int, default=None, help='Crawl with N shard processes (overrides config)')
+    parser.add_argument('--max-pages', type=int, default=None, help='Stop after N pages taken from the frontier; the rest stays queued (overrides config)')
+    # Subarguments for on demand export
+    parser.add_argument('--export', choices=list(EXPORTERS), help='Export existing database to JSON, JSON Lines, CSV or Parquet (no crawling)')
+    parser.add_argument('--export-file', type=str, help='Optional filename for export output')
+    parser.add_argument('--since', type=str, default=None, help='Only export pages fetched at or after this ISO date/time (e.g. 2024-05-01)')
+    parser.add_argument('--gzip', action='store_true', help='Gzip the JSON, JSON Lines or CSV export (also implied by a .gz filename)')
+    parser.add_argument('--search', type=str, default=None, help='Full-text search the crawled pages, best BM25 match first (no crawling)')
+    parser.add_argument('--search-limit', type=int, default=10, help='Number of search results')
+    parser.add_argument('--graph', action='store_true', help='Compute in/out degree, PageRank and depth from the seed over the stored links into LinkStats (no crawling, needs numpy)')
+
+    args = parser.parse_args()
+
+    # Handle on-demand export mode
+    if args.export:
+        db = db_initialization(config.get("database_path", "mini.sqlite"), config.get("sqlite_wal", True))
+        try:
+            export_results(db, args.export, args.export_file, since=args.since, compress=args.gzip)
+        except (RuntimeError, ValueError) as e:
+            parser.error(str(e))
+        finally:
+            db["conn"].close()
+        return
+
+    # Handle on-demand full-text search
+    if args.search is not None:
+        if not args.search.strip():
+            parser.error("--search needs a non-empty query")
+        db = db_initialization(config.get("database_path", "mini.sqlite"), config.get("sqlite_wal", True))
+        started = time.perf_counter()
+        try:
+            results = search_pages(db, args.search, args.search_limit)
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            db["conn"].close()
+        for url, score, snippet in results:
+            print(f"{score:10.4g}  {url}\n            {snippet}")
+        print(f"{len(results)} results in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return
+
+    # Handle on-demand link-graph analytics
+    if args.graph:
+        db = db_initialization(config.get("database_path", "mini.sqlite"), config.get("sqlite_wal", True))
+        try:
+            summary = analyze_links(db, normalize_url(args.domain or config["seed_url"]))
+        except RuntimeError as e:
+            parser.error(str(e))
+        finally:
+            db["conn"].close()
+        print(f"Link graph: {summary['pages']} pages, {summary['links']} links, PageRank in {summary['iterations']} iterations, "
+              f"{summary['reached_from_seed']} pages reachable from the seed (max depth {summary['max_depth']})")
+        print(f"Loaded in {summary['load_seconds']:.2f}s, computed in {summary['compute_seconds']:.2f}s, "
+              f"stored in LinkStats in {summary['write_seconds']:.2f}s")
+        for url, rank, in_degree in summary["top"]:
+            print(f"{rank:.6f}  {in_degree:>8} inlinks  {url}")
+        return
+
+    if args.max_pages:
+        config["max_pages"] = args.max_pages
+
+    processes = args.processes or config.get("processes", 1)
+    if processes > 1:
+        overrides = {"domain": args.domain, "depth": args.depth, "playwright": args.playwright}
+        run_sharded(config, processes, overrides, output=args.output, recrawl=args.recrawl)
+        return
+
+    ctx = build_context(config, domain=args.domain, depth=args.depth, output=args.output, playwright=args.playwright)
 
-    asyncio.run(main(ctx, resume=True))
+    asyncio.run(main(ctx, resume=True, recrawl=args.recrawl))
 
 if __name__ == "__main__":
     cli_main()
\ No newline at end of file
@@ -0,0 +1,174 @@
+import asyncio
+import bisect
+import collections
+import time
+
+from contextlib import contextmanager
+
+from aiohttp import web
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500, 1000)
+
+
+# Raw samples kept per histogram for exact recent percentiles
+RECENT_SAMPLES = 4096
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (Prometheus style): per-bucket counts, sum and count,
+    plus the last RECENT_SAMPLES raw values for exact percentiles.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q):
+        """q-quantile of the recent samples (None when empty)."""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Metrics:
+    """
+    In-process crawl metrics: counters with labels, per-stage latency histograms and
+    DB batch sizes. Updating one is a dict lookup and an addition, cheap enough for
+    the hot path. Gauges (queue depths, per-host in-flight) are read from the crawl
+    context when metrics are rendered.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = collections.Counter()      # (name, labels) -> value
+        self.stages = collections.defaultdict(Histogram)
+        self.db_batches = Histogram(BATCH_BUCKETS)
+        self._last_summary = (self.started, 0, 0)
+
+    def inc(self, name, amount=1, **labels):
+        self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Measure the wall time of a block (await included) into a stage histogram."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[stage].observe(time.monotonic() - started)
+
+    def total(self, name):
+        """Sum of a counter over all its labels."""
+        return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def gauges(self, ctx):
+        """Current queue depths and per-host concurrency, read from the crawl context."""
+        gauges = []
+        if ctx.frontier is not None:
+            gauges.append(("crawler_frontier_unfinished", (), ctx.frontier.qsize()))
+        if ctx.scheduler is not None:
+            gauges.append(("crawler_scheduler_pending", (), ctx.scheduler.pending()))
+        if ctx.write_queue is not None:
+            gauges.append(("crawler_write_queue_depth", (), ctx.write_queue.qsize()))
+        for host, state in ctx.limiters.snapshot().items():
+            gauges.append(("crawler_host_in_flight", (("host", host),), state["in_flight"]))
+            gauges.append(("crawler_host_concurrency_limit", (("host", host),), state["limit"]))
+        return gauges
+
+    def render_prometheus(self, ctx):
+        """All metrics in the Prometheus text exposition format."""
+        lines = [f"crawler_uptime_seconds {time.time() - self.started:.3f}"]
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for name, labels, value in self.gauges(ctx):
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for stage, histogram in sorted(self.stages.items()):
+            lines.extend(histogram_lines("crawler_stage_seconds", histogram, (("stage", stage),)))
+        lines.extend(histogram_lines("crawler_db_batch_pages", self.db_batches, ()))
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self, ctx):
+        """One-line progress summary; rates are since the previous summary."""
+        now = time.time()
+        pages, fetched_bytes = self.total("crawler_pages_total"), self.total("crawler_bytes_total")
+        last_time, last_pages, last_bytes = self._last_summary
+        self._last_summary = (now, pages, fetched_bytes)
+        elapsed = max(now - last_time, 1e-9)
+
+        fetch = self.stages.get("fetch") or Histogram()
+        p50 = fetch.quantile(0.5) or 0.0
+        p99 = fetch.quantile(0.99) or 0.0
+        queued = ctx.frontier.qsize() if ctx.frontier is not None else 0
+        in_flight = sum(state["in_flight"] for state in ctx.limiters.snapshot().values())
+        return (f"{pages} pages | {(pages - last_pages) / elapsed:.1f} pages/s | "
+                f"{(fetched_bytes - last_bytes) / elapsed / 1024:.1f} KiB/s | "
+                f"queue {queued} | in flight {in_flight} | "
+                f"fetch p50 {p50:.3f}s p99 {p99:.3f}s | "
+                f"skipped {self.total('crawler_skipped_total')} | retries {self.total('crawler_retries_total')}")
+
+
+#Def format_labels
+def format_labels(labels):
+    """Render ((key, value), ...) as a Prometheus label set."""
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+#Def histogram_lines
+def histogram_lines(name, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+    return lines
+
+#Def start_metrics_server
+async def start_metrics_server(ctx, host, port):
+    """Serve /metrics on host:port. Returns the runner to clean up at crawl end, or None when the
+    address can't be bound (e.g. another instance has the port): the crawl goes on without the endpoint.
+    """
+    async def handle(request):
+        return web.Response(text=ctx.metrics.render_prometheus(ctx), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        await runner.cleanup()
+        ctx.error_logger.error(f"Metrics endpoint not started, {host}:{port} unavailable: {e}")
+        return None
+    ctx.logger.info(f"Metrics served on http://{host}:{port}/metrics")
+    return runner
+
+#Def report_metrics
+async def report_metrics(ctx, interval):
+    """Log a summary line every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        ctx.logger.info(f"Metrics: {ctx.metrics.summary_line(ctx)}")
@@ -0,0 +1,154 @@
+import hashlib
+import html as html_lib
+import operator
+import re
+
+from array import array
+
+
+# Markup whose content is never visible
+HIDDEN_RE = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->", re.S | re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+WORD_RE = re.compile(r"\w+")
+
+# Pages with fewer words than this are not fingerprinted: too little text to compare
+MIN_WORDS = 30
+
+# BIT_TABLES[b] maps a byte to its bit b, so a column of digest bytes becomes a 0/1 string
+BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+
+# Word digests are memoized per process: a site reuses the same vocabulary on every page
+DIGEST_CACHE_SIZE = 200_000
+_digests = {}   # word -> (hash as first word of a pair, hash as second word)
+
+
+#Def visible_text
+def visible_text(html):
+    """Cheap visible text of an HTML page (scripts, styles and comments dropped, tags stripped).
+    Good enough to fingerprint a page without building a tree.
+    """
+    return html_lib.unescape(TAG_RE.sub(" ", HIDDEN_RE.sub(" ", html)))
+
+#Def word_digests
+def word_digests(word):
+    digests = _digests.get(word)
+    if digests is None:
+        if len(_digests) >= DIGEST_CACHE_SIZE:
+            _digests.clear()
+        raw = hashlib.blake2b(word.encode(), digest_size=16).digest()
+        digests = _digests[word] = (int.from_bytes(raw[:8], "little"), int.from_bytes(raw[8:], "little"))
+    return digests
+
+#Def simhash
+def simhash(text):
+    """64-bit SimHash of a text over its word pairs (so word order counts). None for too short texts.
+
+    A pair's hash is the XOR of its words' memoized hashes, so no string is built or hashed
+    per pair. Bit i of the result is set when most pair hashes have bit i set. The hashes
+    are laid out as one byte string, so each bit is counted at C speed: every 8th byte is
+    one hash position, translated to 0/1 bytes and popcounted.
+    """
+    words = WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+
+    digests = list(map(word_digests, words))
+    pairs = array("Q", map(operator.xor, (first for first, _ in digests), (second for _, second in digests[1:])))
+    blob = pairs.tobytes()
+    half = len(pairs) / 2
+    fingerprint = 0
+    for position in range(8):
+        column = blob[position::8]
+        for bit in range(8):
+            if int.from_bytes(column.translate(BIT_TABLES[bit]), "little").bit_count() > half:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+#Def page_fingerprint
+def page_fingerprint(html):
+    """Return (simhash or None, visible text length) of a page. Runs in a parse worker process when there is one."""
+    text = visible_text(html)
+    return simhash(text), len(text.strip())
+
+#Def to_signed
+def to_signed(fingerprint):
+    """SQLite integers are signed 64-bit: store fingerprints as two's complement."""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+#Def from_signed
+def from_signed(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class SimHashIndex:
+    """
+    Near-duplicate lookup over page fingerprints (banded LSH).
+
+    Two pages are near-duplicates when their 64-bit SimHashes differ in at most
+    `max_distance` bits. The fingerprint is cut into max_distance + 1 bands, so by
+    pigeonhole a near-duplicate matches at least one band exactly: a lookup is one
+    dict probe per band plus a popcount per candidate, well under a millisecond.
+    """
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self._mask = (1 << self.band_bits) - 1
+        self._tables = [{} for _ in range(self.bands)]   # band value -> [url, ...]
+        self._fingerprints = {}                          # url -> fingerprint
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def _keys(self, fingerprint):
+        # The last band takes the bits left over when 64 does not divide evenly
+        for band in range(self.bands):
+            shifted = fingerprint >> (band * self.band_bits)
+            yield band, shifted if band == self.bands - 1 else shifted & self._mask
+
+    def load(self, cur):
+        """Load the fingerprints of pages stored in earlier runs (aliases are not indexed)."""
+        for name, value in cur.execute('SELECT name, simhash FROM Urls WHERE simhash IS NOT NULL'):
+            self.add(name, from_signed(value))
+        return len(self._fingerprints)
+
+    def add(self, url, fingerprint):
+        """Index `url` under `fingerprint` (replacing its previous one)."""
+        if url in self._fingerprints:
+            self.remove(url)
+        self._fingerprints[url] = fingerprint
+        for band, key in self._keys(fingerprint):
+            self._tables[band].setdefault(key, []).append(url)
+
+    def remove(self, url):
+        fingerprint = self._fingerprints.pop(url, None)
+        if fingerprint is None:
+            return
+        for band, key in self._keys(fingerprint):
+            urls = self._tables[band].get(key)
+            if urls and url in urls:
+                urls.remove(url)
+                if not urls:
+                    del self._tables[band][key]
+
+    def find(self, url, fingerprint):
+        """Return the indexed page closest to `fingerprint` within max_distance (never `url` itself), or None."""
+        best, best_distance = None, self.max_distance + 1
+        for band, key in self._keys(fingerprint):
+            for candidate in self._tables[band].get(key, ()):
+                if candidate == url:
+                    continue
+                distance = (self._fingerprints[candidate] ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return best
+
+    def check(self, url, fingerprint, index=True):
+        """Return the page `url` duplicates, or None after indexing it as an original (when `index`).
+        Checking and indexing happen in one step, so two copies fetched at once can't both be originals.
+        """
+        original = self.find(url, fingerprint)
+        if original is None and index:
+            self.add(url, fingerprint)
+        return original
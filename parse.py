@@ -1,3 +1,4 @@
+import asyncio
 import re
 import hashlib
 import logging
@@ -5,6 +6,114 @@ import logging
 from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode, urldefrag
 from bs4 import BeautifulSoup
 from collections import Counter
+from dataclasses import dataclass
+
+from log_utils import SAMPLED
+from neardup import page_fingerprint
+
+# Prefer the lxml tree builder when it is installed, it is several times faster than html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Path of a product page (books catalogue): one level under /catalogue/, so category listings don't match
+PRODUCT_PATH_RE = re.compile(r'/catalogue/[^/]+(/index\.html)?$')
+
+# Keyword terms: lowercase words of 3+ letters, minus the stopwords
+KEYWORD_RE = re.compile(r'\b[a-z]{3,}\b')
+STOPWORDS = frozenset([
+    'the','and','for','are','this','that','with',
+    'from','was','were',
+    'will','would','shall','should','can','could','have','has','had',
+    'you','your','yours','his','her','hers','its','our','ours','their',
+    'theirs','a','an','in','on','of','to','is','it','as','by','at'
+])
+
+
+@dataclass
+class PageDocument:
+    url: str
+    html: str
+    soup: BeautifulSoup
+    text: str
+
+#Def parse_document
+def parse_document(url, html, parser=None):
+    """Parse a page's HTML once and keep the tree and its visible text for every later extraction step.
+    """
+    soup = BeautifulSoup(html, parser or HTML_PARSER)
+    text = " ".join(soup.stripped_strings)
+    return PageDocument(url=url, html=html, soup=soup, text=text)
+
+
+@dataclass
+class PageResult:
+    url: str
+    html_length: int
+    text_length: int
+    links: list
+    keywords: list
+    category: str = None
+    product_data: dict = None
+    simhash: int = None
+    duplicate_of: str = None
+    text: str = None
+
+#Def analyze_page
+def analyze_page(url, html, fingerprint=False):
+    """Parse a page once and return a compact, picklable PageResult.
+    Runs in a parse worker process when parse_workers is set, so it must not touch ctx.
+    The result carries every keyword term with its count (the writer ranks them by TF-IDF)
+    and the visible text for the full-text index. With `fingerprint`, the page's SimHash is
+    computed in the same call, so the HTML goes to the parse pool only once.
+    """
+    simhash = page_fingerprint(html)[0] if fingerprint else None
+    doc = parse_document(url, html)
+    links = {normalize_url(link) for link in parse_links(doc.soup, url)}
+
+    return PageResult(
+        url=url,
+        html_length=len(html),
+        text_length=len(doc.text),
+        links=sorted(links),
+        keywords=term_counts(doc.text).most_common(),
+        category=extract_category(doc.soup),
+        product_data=get_product_data(url, doc.soup),
+        simhash=simhash,
+        text=doc.text
+    )
+
+#Def run_parse
+async def run_parse(ctx, func, *args):
+    """Run a parsing function inline, or in the parse process pool so the event loop stays free."""
+    if ctx.parse_pool is None:
+        return func(*args)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ctx.parse_pool, func, *args)
+
+#Def analyze_html
+async def analyze_html(ctx, url, html, redirected=False):
+    """Analyze a page and, with near-duplicate detection on, fingerprint it in the same parse call.
+    A near-duplicate of a page already crawled comes back as a PageResult naming the original
+    (its links, keywords and product are dropped).
+    A page reached through a redirect is stored under the URL that redirected, so it never becomes
+    the original others are aliases of: the redirect target is crawled in its own right.
+    """
+    with ctx.metrics.time("parse"):
+        page = await run_parse(ctx, analyze_page, url, html, ctx.near_duplicates is not None)
+        if page.simhash is None:
+            return page
+
+        original = ctx.near_duplicates.check(url, page.simhash, index=not redirected)
+        if original is not None:
+            return PageResult(url=url, html_length=page.html_length, text_length=page.text_length, links=[], keywords=[],
+                              simhash=page.simhash, duplicate_of=original)
+        if redirected:
+            page.simhash = None
+        return page
 
 #Def URL normalization
 def normalize_url(url):
@@ -63,36 +172,29 @@ def url_allowed(url, include_paths, compiled_exclude_regexes):
 
 #Def should skip URL
 async def should_skip_url(currenturl, ctx):
-    """Determine if a URL should be skipped based on previous visits, database status,
-    robots.txt, and configured rules.
+    """Determine if a URL should be skipped based on robots.txt and configured rules.
+    Previously fetched URLs never reach this point: ctx.seen keeps them out of the queue.
     """
     # 1. Check URL patterns
     if not url_allowed(currenturl, ctx.rules["include_paths"], ctx.rules["exclude_regexes"]):
         return True, "URL not allowed by include/exclude rules"
+
+    # Ignored file types are never requested
+    if urlparse(currenturl).path.lower().endswith(ctx.rules.get("file_type_filters", ())):
+        return True, "Ignored file type"
     
-    # 2. Check robots.txt (if enabled)
-    if ctx.rules.get("respect_robots_txt", True):
-        rp = ctx.rules.get("rp")
-        user_agent = ctx.rules.get("user_agent", "*")
-        if rp and not rp.can_fetch(user_agent, currenturl):
-            return True, "Blocked by robots.txt"
-
-    # 3. Check DB for already fetched
-    async with ctx.db["lock"]:
-        ctx.db["cur"].execute('SELECT date FROM Urls WHERE name=?', (currenturl,))
-        row = ctx.db["cur"].fetchone()
-        if row and row[0] is not None:
-            return True, "Already fetched"
+    # 2. Check robots.txt (if enabled); the host's rules are fetched once and cached
+    if ctx.robots is not None and not await ctx.robots.can_fetch(currenturl):
+        return True, "Blocked by robots.txt"
 
     # Not skipped
     return False, None
 
 #Def parse_links
-def parse_links(html, base_url):
-    """Extract all links from the given HTML content and convert them into absolute URLs.
+def parse_links(soup, base_url):
+    """Extract all links from the parsed page and convert them into absolute URLs.
     Returns URLs to potentially enqueue for further crawling.
     """
-    soup = BeautifulSoup(html, 'html.parser')
     links = set()
     for a_tag in soup.find_all('a', href=True):
         href = a_tag['href']
@@ -106,22 +208,14 @@ def parse_links(html, base_url):
     return links
 
 #Def EXTRACT_KEYWORDS and HASH
-def extract_keywords(html, top_n=20):
-    """Analyze HTML content to extract meaningful keywords for indexing or storage.
+def term_counts(text):
+    """Count the keyword terms of a text (see KEYWORD_RE and STOPWORDS)."""
+    return Counter(w for w in KEYWORD_RE.findall(text.lower()) if w not in STOPWORDS)
+
+def extract_keywords(text, top_n=20):
+    """Analyze the visible text of a page to extract meaningful keywords for indexing or storage.
     """
-    #Set up keywords
-    STOPWORDS = set([
-        'the','and','for','are','this','that','with',
-        'from','was','were',
-        'will','would','shall','should','can','could','have','has','had',
-        'you','your','yours','his','her','hers','its','our','ours','their',
-        'theirs','a','an','in','on','of','to','is','it','as','by','at'
-])
-    soup = BeautifulSoup(html, 'html.parser')
-    text = " ".join(soup.stripped_strings).lower()
-    words = re.findall(r'\b[a-z]{3,}\b', text)
-    filtered = [w for w in words if w not in STOPWORDS]
-    return Counter(filtered).most_common(top_n)
+    return term_counts(text).most_common(top_n)
 
 #Def Compute_hash
 def compute_hash(html):
@@ -137,14 +231,12 @@ def get_product_data(current_url, soup):
     Only processes actual product pages; skips category pages.
     """
 
-    logging.info(f"save_product_data called for: {current_url}")
     parsed = urlparse(current_url)
-    logging.info(f"  parsed.path = {repr(parsed.path)}")
 
     # --- 1. URL pattern check ---
     path = parsed.path.strip()
-    logging.info(f"save_product_data reached: {current_url} | path={path}")
-    if not re.search(r'/catalogue/[^/]+(/index\.html)?$', path):
+    logging.debug("save_product_data reached: %s | path=%s", current_url, path, extra=SAMPLED)
+    if not PRODUCT_PATH_RE.search(path):
         #logging.info(f"Skipping {current_url} (did not match product pattern)")
         return  # Not a product page
 
@@ -220,47 +312,32 @@ def extract_category(soup):
 
     return category
 
-def process_page(ctx, currenturl, html, currentdepth):
+def process_page(ctx, page, currentdepth):
     """
-    Process the HTML of a page: parse links, extract metadata, normalize links,
-    and decide which links should be enqueued.
+    Process an analyzed page: apply domain and depth rules to its already
+    normalized links and decide which links should be enqueued.
 
     Returns:
         to_enqueue: list of (normalized_link, next_depth) tuples
         link_pairs: list of normalized links (for DB relationships)
-        soup: BeautifulSoup object (or None)
-        keywords: list
+        keywords: list of (term, count), most frequent first
         category: string or None
         product_data: dict or None
     """
         
+    currenturl = page.url
     ctx.logger.info(f"Processing page: {currenturl}")
-
-    # Parse links
-    links = parse_links(html, currenturl)
-    print(f"Found {len(links)} links on {currenturl}:")
-
-    # Parse metadata outside lock
-    if html:
-        soup = BeautifulSoup(html, 'html.parser')
-        keywords = extract_keywords(html)
-        category = extract_category(soup) if soup else None
-        product_data = get_product_data(currenturl, soup) if soup else None
-    
-    else:
-        soup = None
-        keywords = []
+    ctx.logger.debug("Found %d links on %s", len(page.links), currenturl, extra=SAMPLED)
 
     # Prepare normalized links and depth decisions
     to_enqueue = []
     link_pairs = [] 
 
     #Parse all the links from the page
-    for link in links:
-        normalized_link = normalize_url(link)
+    for normalized_link in page.links:
         #ctx.logger.info(f"Normalized URL: {normalized_link}")
         if not is_allowed_domain(normalized_link, ctx.rules["base_domain"]):
-            print('Domain not allowed')
+            ctx.logger.debug("Domain not allowed: %s", normalized_link, extra=SAMPLED)
             continue
 
         next_depth = currentdepth + 1
@@ -271,4 +348,4 @@ def process_page(ctx, currenturl, html, currentdepth):
                 # Insert relationship for all links (even if depth prevented enqueue)
                 link_pairs.append(normalized_link)
 
-    return to_enqueue, link_pairs, soup, keywords, category, product_data
+    return to_enqueue, link_pairs, page.keywords, page.category, page.product_data
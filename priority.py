@@ -0,0 +1,96 @@
+import re
+import time
+
+from urllib.parse import urlparse
+
+from sitemap import lastmod_priority
+
+
+# Default weights of the scoring signals (config "priority_weights")
+DEFAULT_WEIGHTS = {"depth": 0.5, "product_url": 3.0, "inlinks": 1.0, "lastmod": 1.0}
+
+# Default anti-starvation aging: priority a queued URL gains per minute of waiting (config "priority_aging")
+DEFAULT_AGING = 0.1
+
+# Product page URLs for the product_url signal: one path segment under /catalogue/, then /index.html.
+# Stricter than parse.PRODUCT_PATH_RE, which also lets pagination pages (/catalogue/page-2.html) through
+PRODUCT_URL_RE = re.compile(r'/catalogue/[^/]+/index\.html$')
+
+# Inlink counts are kept for this many URLs at most, then started over
+INLINK_CACHE_SIZE = 1_000_000
+
+
+#Def depth_signal
+def depth_signal(url, depth, lastmod, inlinks):
+    """Shallow pages first: minus the crawl depth."""
+    return -depth
+
+#Def product_url_signal
+def product_url_signal(url, depth, lastmod, inlinks):
+    """1 for URLs shaped like a product page (/catalogue/<book>/index.html, not pagination), else 0."""
+    return 1.0 if PRODUCT_URL_RE.search(urlparse(url).path) else 0.0
+
+#Def inlinks_signal
+def inlinks_signal(url, depth, lastmod, inlinks):
+    """Times the inlink count seen so far has doubled: 0 for one link, 1 for two, 2 for four..."""
+    return inlinks.bit_length() - 1
+
+#Def lastmod_signal
+def lastmod_signal(url, depth, lastmod, inlinks):
+    """Sitemap lastmod: recently changed pages first, in [0, 1]."""
+    return lastmod_priority(lastmod)
+
+# Scoring signals by name, function(url, depth, lastmod, inlinks) -> score; config "priority_weights" picks and weighs them
+SIGNALS = {
+    "depth": depth_signal,
+    "product_url": product_url_signal,
+    "inlinks": inlinks_signal,
+    "lastmod": lastmod_signal,
+}
+
+
+class UrlScorer:
+    """
+    Frontier priority of a URL for a best-first crawl: the weighted sum of its SIGNALS.
+
+    Aging keeps low-score URLs from waiting forever. A URL queued t minutes ago ranks
+    as if its score were `aging * t` higher, which is the same order as storing
+    score - aging * (minutes since the epoch) once, at enqueue time. So the stored
+    priorities never need updating. With no weights and no aging, every priority is
+    0 and the frontier is FIFO.
+
+    Links to URLs already queued raise their priority in the frontier. This happens
+    only when the inlinks signal changes, i.e. each time the count doubles, so a
+    popular URL costs a few updates rather than one per link.
+    """
+
+    def __init__(self, weights=None, aging=DEFAULT_AGING):
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        unknown = set(weights) - set(SIGNALS)
+        if unknown:
+            raise ValueError(f"Unknown priority signals: {', '.join(sorted(unknown))}")
+        self.weights = {name: weight for name, weight in weights.items() if weight}
+        self.aging = aging
+        self._signals = [(SIGNALS[name], weight) for name, weight in self.weights.items()]
+        self._inlinks = {}   # hash(url) -> links seen to it
+
+    def score(self, url, depth, lastmod=None, inlinks=1):
+        return sum(weight * signal(url, depth, lastmod, inlinks) for signal, weight in self._signals)
+
+    def priority(self, url, depth, lastmod=None):
+        """Priority to queue `url` with now."""
+        priority = self.score(url, depth, lastmod, self._inlinks.get(hash(url), 1))
+        return priority - self.aging * time.time() / 60 if self.aging else priority
+
+    def add_inlink(self, url):
+        """Count one more link to an already seen URL. Returns how much its priority rises (0.0 most of the time)."""
+        key = hash(url)
+        if key not in self._inlinks and len(self._inlinks) >= INLINK_CACHE_SIZE:
+            self._inlinks.clear()
+        count = self._inlinks[key] = self._inlinks.get(key, 1) + 1
+
+        weight = self.weights.get("inlinks")
+        if not weight:
+            return 0.0
+        signal = SIGNALS["inlinks"]
+        return weight * (signal(url, 0, None, count) - signal(url, 0, None, count - 1))
@@ -0,0 +1,70 @@
+import time
+
+from collections import namedtuple
+
+
+# What we know about a previously fetched URL that is due for a revisit
+Revisit = namedtuple('Revisit', 'etag last_modified content_hash change_interval')
+
+QUERY_DUE = '''
+SELECT name, etag, last_modified, content_hash, change_interval
+FROM Urls
+WHERE (next_visit IS NOT NULL AND next_visit <= ?)
+   OR (next_visit IS NULL AND date IS NOT NULL)
+'''
+
+#Def load_revisits
+def load_revisits(cur, now=None):
+    """Return {url: Revisit} for every fetched URL whose next visit is due."""
+    cur.execute(QUERY_DUE, (now or time.time(),))
+    revisits = {}
+    while True:
+        rows = cur.fetchmany(10_000)
+        if not rows:
+            break
+        for name, etag, last_modified, content_hash, change_interval in rows:
+            revisits[name] = Revisit(etag, last_modified, content_hash, change_interval)
+    return revisits
+
+#Def conditional_headers
+def conditional_headers(revisit):
+    """Build If-None-Match / If-Modified-Since headers from stored validators."""
+    headers = {}
+    if revisit and revisit.etag:
+        headers["If-None-Match"] = revisit.etag
+    if revisit and revisit.last_modified:
+        headers["If-Modified-Since"] = revisit.last_modified
+    return headers
+
+#Def schedule_revisit
+def schedule_revisit(rules, revisit, content_hash):
+    """
+    Decide when to come back to a page: the interval halves each time the content
+    changed and doubles each time it did not, within the configured bounds.
+    Returns (changed, change_interval, next_visit).
+    """
+    min_interval = rules["recrawl_min_interval"]
+    max_interval = rules["recrawl_max_interval"]
+    previous = revisit.change_interval if revisit and revisit.change_interval else rules["recrawl_interval"]
+
+    if revisit is None or revisit.content_hash is None:
+        changed, interval = 0, previous
+    elif content_hash is not None and revisit.content_hash != content_hash:
+        changed, interval = 1, max(min_interval, previous / 2)
+    else:
+        changed, interval = 0, min(max_interval, previous * 2)
+
+    return changed, interval, time.time() + interval
+
+#Def revisit_fields
+def revisit_fields(rules, revisit, fetch):
+    """Validators and revisit schedule of a fetched page, as stored on its Urls row."""
+    changed, interval, next_visit = schedule_revisit(rules, revisit, None if fetch.not_modified else fetch.content_hash)
+    return {
+        "content_hash": fetch.content_hash,
+        "etag": fetch.etag,
+        "last_modified": fetch.last_modified,
+        "changed": changed,
+        "change_interval": interval,
+        "next_visit": next_visit,
+    }
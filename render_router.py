@@ -0,0 +1,87 @@
+from urllib.parse import urlparse
+
+
+#Def path_prefix
+def path_prefix(url, depth=1):
+    """Return (host, first `depth` path segments) - the pattern a routing decision applies to."""
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    # The last segment is the page itself, not part of its section
+    segments = segments[:-1] if segments and "." in segments[-1] else segments
+    return parsed.netloc, "/" + "/".join(segments[:depth])
+
+
+class RenderRouter:
+    """
+    Learns, per host and path prefix, whether pages need the browser.
+
+    Every fetch that tried static HTML and produced content records whether static was
+    enough. Once a prefix has `min_samples` outcomes, a `threshold` share of browser
+    renders sends its URLs straight to the browser pool (skipping the wasted static
+    round-trip), and the same share of static successes keeps them away from the browser.
+    Every `probe_every`th URL of a browser-only prefix still tries static first, so a site
+    that stopped needing JavaScript is noticed: each probe that works statically halves the
+    prefix's browser count, and a few of them send it back to static. Counts are kept in
+    the RenderRoutes table across runs.
+    """
+
+    STATIC = "static"
+    DYNAMIC = "dynamic"
+
+    def __init__(self, prefix_depth=1, min_samples=3, threshold=0.8, probe_every=50):
+        self.prefix_depth = prefix_depth
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self.probe_every = probe_every
+        self._stats = {}      # (host, prefix) -> [static_ok, dynamic_needed]
+        self._probes = {}
+        self._dirty = set()
+
+    def load(self, cur):
+        """Load the counts learned in earlier runs."""
+        for host, prefix, static_ok, dynamic_needed in cur.execute(
+                'SELECT host, prefix, static_ok, dynamic_needed FROM RenderRoutes'):
+            self._stats[(host, prefix)] = [static_ok, dynamic_needed]
+        return len(self._stats)
+
+    def save(self, conn):
+        """Persist the counts that changed since the last save."""
+        rows = [(host, prefix, *self._stats[(host, prefix)]) for host, prefix in self._dirty]
+        conn.executemany('''
+            INSERT INTO RenderRoutes (host, prefix, static_ok, dynamic_needed) VALUES (?, ?, ?, ?)
+            ON CONFLICT (host, prefix) DO UPDATE SET
+                static_ok = excluded.static_ok, dynamic_needed = excluded.dynamic_needed
+            ''', rows)
+        conn.commit()
+        self._dirty.clear()
+        return len(rows)
+
+    def _needs_browser(self, static_ok, dynamic_needed):
+        total = static_ok + dynamic_needed
+        return total >= self.min_samples and dynamic_needed >= total * self.threshold
+
+    def decide(self, url):
+        """Return DYNAMIC, STATIC, or None while the prefix is still unknown."""
+        key = path_prefix(url, self.prefix_depth)
+        static_ok, dynamic_needed = self._stats.get(key, (0, 0))
+        total = static_ok + dynamic_needed
+        if total < self.min_samples:
+            return None
+
+        if self._needs_browser(static_ok, dynamic_needed):
+            probes = self._probes.get(key, 0) + 1
+            self._probes[key] = probes
+            return None if probes % self.probe_every == 0 else self.DYNAMIC
+        if static_ok >= total * self.threshold:
+            return self.STATIC
+        return None
+
+    def record(self, url, needed_browser):
+        """Record whether static HTML was enough for a page that produced content."""
+        key = path_prefix(url, self.prefix_depth)
+        stats = self._stats.setdefault(key, [0, 0])
+        if not needed_browser and self._needs_browser(*stats):
+            # A probe of a browser-only prefix worked statically
+            stats[1] //= 2
+        stats[1 if needed_browser else 0] += 1
+        self._dirty.add(key)
@@ -0,0 +1,243 @@
+import asyncio
+import collections
+import re
+import time
+
+from urllib.parse import quote, unquote, urlparse
+
+
+# Bytes of robots.txt that are parsed (Google stops at 500 KiB as well)
+MAX_ROBOTS_BYTES = 500 * 1024
+
+# Characters kept as they are when normalizing rule and URL paths
+_SAFE_PATH_CHARS = "/?=&;:@$,!*'()+~-._%"
+
+
+#Def normalize_robots_path
+def normalize_robots_path(path):
+    """Percent-encode a path the same way for rules and URLs, so they compare byte for byte."""
+    return quote(unquote(path), safe=_SAFE_PATH_CHARS) or "/"
+
+
+class RobotsRules:
+    """
+    The robots.txt group that applies to our user agent, compiled for fast checks.
+
+    Plain prefix rules live in a character trie, so a check walks the path once;
+    the few rules with `*` or `$` are compiled to regexes. The longest matching rule
+    wins and Allow wins a tie. Results are memoized per path.
+    """
+
+    def __init__(self, rules=(), crawl_delay=None, sitemaps=(), memo_size=4096):
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+        self.memo_size = memo_size
+        self._trie = {}
+        self._patterns = []
+        self._memo = collections.OrderedDict()
+
+        for allow, path in rules:
+            if "*" in path or path.endswith("$"):
+                anchored = path.endswith("$")
+                body = path[:-1] if anchored else path
+                regex = ".*".join(re.escape(part) for part in body.split("*")) + (r"\Z" if anchored else "")
+                self._patterns.append((re.compile(regex), len(path), allow))
+            else:
+                node = self._trie
+                for ch in path:
+                    node = node.setdefault(ch, {})
+                # Same path listed twice: Allow wins
+                node[None] = max(node.get(None, (len(path), allow)), (len(path), allow))
+
+    @classmethod
+    def allow_all(cls):
+        return cls()
+
+    @classmethod
+    def disallow_all(cls):
+        return cls([(False, "/")])
+
+    def can_fetch(self, url):
+        """Return True if our user agent may fetch `url`."""
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        if path == "/robots.txt":
+            return True
+
+        allowed = self._memo.get(path)
+        if allowed is not None:
+            self._memo.move_to_end(path)
+            return allowed
+
+        allowed = self._match(normalize_robots_path(path))
+        self._memo[path] = allowed
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return allowed
+
+    def _match(self, path):
+        best = None
+        node = self._trie
+        for ch in path:
+            if None in node and (best is None or node[None] > best):
+                best = node[None]
+            node = node.get(ch)
+            if node is None:
+                break
+        else:
+            if None in node and (best is None or node[None] > best):
+                best = node[None]
+
+        for regex, length, allow in self._patterns:
+            if (best is None or (length, allow) > best) and regex.match(path):
+                best = (length, allow)
+
+        return True if best is None else best[1]
+
+
+#Def parse_robots
+def parse_robots(text, user_agent, memo_size=4096):
+    """
+    Parse robots.txt text into the RobotsRules for `user_agent`: the group with the
+    longest user-agent token found in our user agent, else the `*` group.
+    """
+    agent = user_agent.lower()
+    groups = []          # [tokens, rules, crawl_delay]
+    sitemaps = []
+    current = None
+    in_agents = False
+
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        key, value = (part.strip() for part in line.split(":", 1))
+        key = key.lower()
+
+        if key == "user-agent":
+            if not in_agents:
+                current = [[], [], None]
+                groups.append(current)
+                in_agents = True
+            current[0].append(value.lower())
+            continue
+
+        if key == "sitemap":
+            if value:
+                sitemaps.append(value)
+            continue
+
+        in_agents = False
+        if current is None:
+            continue
+        if key in ("allow", "disallow") and value:
+            current[1].append((key == "allow", normalize_robots_path(value)))
+        elif key == "crawl-delay":
+            try:
+                current[2] = float(value)
+            except ValueError:
+                pass
+
+    best, best_len = None, -1
+    for tokens, rules, crawl_delay in groups:
+        for token in tokens:
+            if token == "*":
+                length = 0
+            elif token and token.split("/")[0] in agent:
+                length = len(token)
+            else:
+                continue
+            if length > best_len:
+                best, best_len = (rules, crawl_delay), length
+
+    if best is None:
+        return RobotsRules(sitemaps=sitemaps, memo_size=memo_size)
+    rules, crawl_delay = best
+    return RobotsRules(rules, crawl_delay, sitemaps, memo_size)
+
+
+class RobotsCache:
+    """
+    Per-host robots.txt, fetched lazily through the shared aiohttp session.
+
+    Entries expire after `ttl` seconds and the least recently used host is evicted
+    past `max_hosts`. Concurrent lookups for one host share a single request.
+    A missing robots.txt (4xx) allows everything, 401/403 disallow everything,
+    and server or network errors allow everything until `error_ttl` expires.
+    """
+
+    def __init__(self, session, user_agent, ttl=86400, error_ttl=300, max_hosts=1000, logger=None):
+        self.session = session
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_hosts = max_hosts
+        self.logger = logger
+
+        self._entries = collections.OrderedDict()   # host -> (expires_at, RobotsRules)
+        self._inflight = {}
+
+    def peek(self, host):
+        """Cached rules for a host, or None when they are not loaded (never fetches)."""
+        entry = self._entries.get(host)
+        return entry[1] if entry else None
+
+    def crawl_delay(self, host):
+        """Crawl-delay of a host's robots.txt if it is already cached."""
+        rules = self.peek(host)
+        return rules.crawl_delay if rules else None
+
+    async def get(self, url):
+        """Return the RobotsRules of the URL's host, fetching robots.txt when needed."""
+        parsed = urlparse(url)
+        host = parsed.netloc
+        entry = self._entries.get(host)
+        if entry and entry[0] > time.time():
+            self._entries.move_to_end(host)
+            return entry[1]
+
+        task = self._inflight.get(host)
+        if task is None:
+            task = asyncio.ensure_future(self._load(parsed.scheme, host))
+            self._inflight[host] = task
+            task.add_done_callback(lambda _: self._inflight.pop(host, None))
+        return await asyncio.shield(task)
+
+    async def can_fetch(self, url):
+        rules = await self.get(url)
+        return rules.can_fetch(url)
+
+    async def _load(self, scheme, host):
+        robots_url = f"{scheme}://{host}/robots.txt"
+        ttl = self.ttl
+        try:
+            async with self.session.get(robots_url) as response:
+                if 200 <= response.status < 300:
+                    # content.read(n) stops at what is buffered: read chunks until EOF or the cap
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        body.extend(chunk)
+                        if len(body) >= MAX_ROBOTS_BYTES:
+                            del body[MAX_ROBOTS_BYTES:]
+                            break
+                    rules = parse_robots(body.decode(response.charset or "utf-8", errors="replace"), self.user_agent)
+                elif response.status in (401, 403):
+                    rules = RobotsRules.disallow_all()
+                elif response.status < 500:
+                    rules = RobotsRules.allow_all()
+                else:
+                    rules, ttl = RobotsRules.allow_all(), self.error_ttl
+                    if self.logger:
+                        self.logger.error(f"Could not read {robots_url}: HTTP {response.status}")
+        except Exception as e:
+            rules, ttl = RobotsRules.allow_all(), self.error_ttl
+            if self.logger:
+                self.logger.error(f"Could not read {robots_url}: {e}")
+
+        self._entries[host] = (time.time() + ttl, rules)
+        self._entries.move_to_end(host)
+        while len(self._entries) > self.max_hosts:
+            self._entries.popitem(last=False)
+        return rules
@@ -0,0 +1,148 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import time
+
+from urllib.parse import urlparse
+
+
+class PolitenessScheduler:
+    """
+    Per-host politeness scheduler between the frontier and the workers.
+
+    URLs pulled from the frontier are kept in one queue per host (highest frontier
+    priority first, FIFO within a priority), and a heap keyed by each host's
+    next-allowed fetch time hands workers only URLs whose host is ready.
+    Workers never sleep for politeness: they wait only when no host is ready.
+    When a host's queue is full while other hosts have work, its extra URLs go back
+    to the frontier with a next-eligible time, so one slow host never starves the others.
+
+    `prepare_fn(host, url)`, when given, runs before a host's URL is handed out and
+    returns an awaitable when something must be loaded first (its robots.txt, so the
+    Crawl-delay is known before the first request), else None. The host waits out of
+    the ready heap until it completes; other hosts keep being served.
+    """
+
+    def __init__(self, frontier, delay_fn, per_host_limit=100, logger=None, prepare_fn=None):
+        self.frontier = frontier
+        self.delay_fn = delay_fn
+        self.prepare_fn = prepare_fn
+        self.per_host_limit = per_host_limit
+        self.logger = logger
+
+        self._hosts = collections.defaultdict(list)   # host -> heap of (-priority, sequence, url, depth)
+        self._sequence = itertools.count()
+        self._heap = []
+        self._next_allowed = {}
+        self._last_delay = {}
+        self._preparing = {}   # host -> task loading what prepare_fn asked for
+        self._changed = asyncio.Event()
+        self._space = asyncio.Event()
+        self._feeder_task = None
+
+    def start(self):
+        """Start pulling URLs from the frontier (needs a running loop)."""
+        self._feeder_task = asyncio.create_task(self._feed())
+
+    async def close(self):
+        """Stop the feeder task and pending host preparations."""
+        tasks = [task for task in (self._feeder_task, *self._preparing.values()) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def pending(self):
+        """Number of URLs waiting in the per-host queues."""
+        return sum(len(queue) for queue in self._hosts.values())
+
+    def _ready_at(self, host):
+        return self._next_allowed.get(host, 0.0)
+
+    def _add(self, host, url, depth, priority=0.0):
+        queue = self._hosts[host]
+        if not queue:
+            heapq.heappush(self._heap, (self._ready_at(host), host))
+        heapq.heappush(queue, (-priority, next(self._sequence), url, depth))
+        self._changed.set()
+
+    async def _feed(self):
+        """Move URLs from the frontier into the per-host queues."""
+        while True:
+            priority, url, depth = await self.frontier.get_scored()
+            host = urlparse(url).netloc
+            queue = self._hosts[host]
+
+            while len(queue) >= self.per_host_limit:
+                # Other hosts have work: park this URL until its host could actually take it
+                if len(self._heap) > 1 or (self._heap and self._heap[0][1] != host):
+                    backlog = len(queue) * self._last_delay.get(host, 0.0)
+                    self.frontier.defer(url, max(time.time(), self._ready_at(host)) + max(1.0, backlog))
+                    break
+                self._space.clear()
+                await self._space.wait()
+            else:
+                self._add(host, url, depth, priority)
+
+    async def get(self):
+        """Return the next (url, depth) whose host is allowed to be fetched now."""
+        while True:
+            wait = None
+            if self._heap:
+                ready_at, host = self._heap[0]
+                wait = ready_at - time.time()
+                if wait <= 0:
+                    heapq.heappop(self._heap)
+                    queue = self._hosts[host]
+                    pending = self.prepare_fn(host, queue[0][2]) if self.prepare_fn else None
+                    if pending is not None:
+                        self._preparing[host] = asyncio.ensure_future(self._prepare(host, pending))
+                        continue
+                    _, _, url, depth = heapq.heappop(queue)
+
+                    delay = self.delay_fn(host)
+                    self._last_delay[host] = delay
+                    self._next_allowed[host] = time.time() + delay
+                    if queue:
+                        heapq.heappush(self._heap, (self._next_allowed[host], host))
+                    else:
+                        del self._hosts[host]
+
+                    self._space.set()
+                    return url, depth
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def refund(self, host):
+        """Give back a host's politeness slot when its URL was skipped without a request."""
+        self._next_allowed[host] = time.time()
+        self._reschedule(host)
+
+    def pause(self, host, seconds):
+        """Keep a host idle for at least `seconds` (e.g. Retry-After)."""
+        self._next_allowed[host] = max(self._ready_at(host), time.time() + seconds)
+        self._reschedule(host)
+
+    async def _prepare(self, host, pending):
+        """Wait for a host's preparation, then put the host back in the ready heap."""
+        try:
+            await pending
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Preparing host {host} failed: {e}")
+        finally:
+            self._preparing.pop(host, None)
+        self._reschedule(host)
+
+    def _reschedule(self, host):
+        if self._hosts.get(host) and host not in self._preparing:
+            self._heap = [(ready_at, h) for ready_at, h in self._heap if h != host]
+            self._heap.append((self._ready_at(host), host))
+            heapq.heapify(self._heap)
+            self._changed.set()
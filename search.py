@@ -0,0 +1,56 @@
+import sqlite3
+
+from db import DOCUMENT_COUNT_TERM
+
+
+# Words of context around the matches in a result snippet
+SNIPPET_WORDS = 16
+
+# FTS5 picks the best matches itself when asked for ORDER BY rank (BM25) with a LIMIT,
+# so only the page URLs of the returned rows are looked up
+QUERY_SEARCH = f'''
+SELECT Urls.name, -hits.rank, hits.snippet
+FROM (
+    SELECT rowid, rank, snippet(PageText, 0, '[', ']', '...', {SNIPPET_WORDS}) AS snippet
+    FROM PageText WHERE PageText MATCH ? ORDER BY rank LIMIT ?
+) AS hits
+JOIN Urls ON Urls.id = hits.rowid
+ORDER BY hits.rank;
+'''
+
+#Def search_pages
+def search_pages(db, query, limit=10):
+    """Full-text search over the crawled pages, best BM25 score first: [(url, score, snippet)].
+    `query` is an FTS5 query (words, "phrases", AND / OR / NOT, prefix*). Raises ValueError when it is malformed.
+    Every matching page is scored, so the time grows with the matches, not the index: selective words take
+    milliseconds on millions of pages, a word found on every page doesn't (and ranks nothing anyway).
+    """
+    try:
+        return db["conn"].execute(QUERY_SEARCH, (query, limit)).fetchall()
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Bad search query {query!r}: {e}") from e
+
+#Def rebuild_term_stats
+def rebuild_term_stats(conn):
+    """Recount TermStats from the PageText index itself, in one transaction (after shard databases were merged:
+    their document frequencies can't just be added up, a shard may be merged again). Returns the number of terms.
+    """
+    cur = conn.cursor()
+    cur.execute('BEGIN')
+    try:
+        cur.execute("CREATE VIRTUAL TABLE temp.PageTextTerms USING fts5vocab(main, PageText, 'row')")
+        cur.execute('DELETE FROM TermStats')
+        # Keyword-shaped terms only (see parse.KEYWORD_RE): the index also holds numbers and short words
+        cur.execute('''
+            INSERT INTO TermStats (term, docs)
+            SELECT term, doc FROM temp.PageTextTerms
+            WHERE length(term) >= 3 AND term NOT GLOB '*[^a-z]*'
+            ''')
+        terms = cur.rowcount
+        cur.execute('INSERT INTO TermStats (term, docs) SELECT ?, COUNT(*) FROM PageText', (DOCUMENT_COUNT_TERM,))
+        cur.execute('DROP TABLE temp.PageTextTerms')
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return terms
@@ -0,0 +1,253 @@
+import asyncio
+import copy
+import os
+import queue
+import sqlite3
+import time
+
+from url_index import url_fingerprint
+
+
+# Seconds between two status reports of a shard, and between two inbox polls
+REPORT_INTERVAL = 0.5
+POLL_INTERVAL = 0.05
+
+# URLs buffered per destination shard before they are sent
+SEND_BATCH = 200
+
+
+#Def shard_of
+def shard_of(url, count):
+    """Index of the shard that owns a (normalized) URL.
+
+    The crawl never leaves base_domain, so hashing the host would put every URL in
+    one shard: URLs are partitioned by their own fingerprint instead, and each shard
+    gets 1/count of the host's politeness budget (see shard_config).
+    """
+    return url_fingerprint(url) % count
+
+#Def shard_db_path
+def shard_db_path(path, index):
+    """mini.sqlite -> mini.shard0.sqlite: each shard has its own database (and frontier)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext or '.sqlite'}"
+
+#Def shard_config
+def shard_config(config, index, count):
+    """Config of one shard: its own database, and its share of the per-host politeness budget and of the page budget."""
+    config = copy.deepcopy(config)
+    config["database_path"] = shard_db_path(config.get("database_path", "mini.sqlite"), index)
+
+    # count shards hit the same host: together they keep the single-process delays and concurrency
+    delay_min, delay_max = config.get("delay_range", [0, 0])
+    config["delay_range"] = [delay_min * count, delay_max * count]
+    for key in ("max_concurrent_per_domain", "max_concurrent_per_domain_ceiling", "connection_limit_per_host"):
+        if config.get(key):
+            config[key] = max(1, config[key] // count)
+
+    if config.get("max_pages"):
+        config["max_pages"] = max(1, config["max_pages"] // count)
+    if config.get("metrics_port"):
+        config["metrics_port"] += index
+    return config
+
+
+class ShardRouter:
+    """
+    The side of a crawl shard that talks to the other processes.
+
+    Links owned by another shard are buffered per destination and sent in batches
+    over that shard's inbox (a multiprocessing queue); URLs arriving in this shard's
+    inbox go to its frontier. Every REPORT_INTERVAL the shard tells the coordinator
+    whether it is idle (empty frontier, nothing buffered) and how many URLs it has
+    sent and received in total, which is what global completion is decided on.
+    """
+
+    def __init__(self, index, count, inboxes, status_queue, done):
+        self.index = index
+        self.count = count
+        self.inboxes = inboxes
+        self.status_queue = status_queue
+        self.done = done
+        self.sent = 0
+        self.received = 0
+        self._outbox = [[] for _ in range(count)]
+        self._seq = 0
+
+    def owns(self, url):
+        return shard_of(url, self.count) == self.index
+
+    def send(self, url, depth, priority=0.0):
+        """Queue a URL for the shard that owns it."""
+        target = shard_of(url, self.count)
+        batch = self._outbox[target]
+        batch.append((url, depth, priority))
+        if len(batch) >= SEND_BATCH:
+            self._flush(target)
+
+    def _flush(self, target):
+        batch, self._outbox[target] = self._outbox[target], []
+        if batch:
+            self.inboxes[target].put(batch)
+            self.sent += len(batch)
+
+    def _report(self, ctx, url_queue):
+        # A shard whose page budget is spent only keeps the URLs it receives for a later run
+        idle = ctx.budget_spent.is_set() or (url_queue.qsize() == 0 and not any(self._outbox))
+        self._seq += 1
+        self.status_queue.put((self.index, self._seq, time.time(), idle, self.sent, self.received))
+
+    async def run(self, ctx, url_queue):
+        """Exchange URLs with the other shards until the coordinator signals the end of the crawl."""
+        inbox = self.inboxes[self.index]
+        next_report = 0.0
+        while not self.done.is_set():
+            while True:
+                try:
+                    batch = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                for url, depth, priority in batch:
+                    if ctx.seen.add(url):
+                        await url_queue.put((url, depth), priority=priority)
+                self.received += len(batch)
+
+            for target in range(self.count):
+                self._flush(target)
+
+            now = time.monotonic()
+            if now >= next_report:
+                self._report(ctx, url_queue)
+                next_report = now + REPORT_INTERVAL
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def close(self):
+        """Don't wait for the queues' feeder threads at exit: nothing is left to deliver once the crawl is done."""
+        for inbox in self.inboxes:
+            inbox.cancel_join_thread()
+        self.status_queue.cancel_join_thread()
+
+
+#Def wait_for_completion
+def wait_for_completion(status_queue, processes, count, logger=None):
+    """
+    Coordinator loop: return True once every shard is idle and no URL is in flight
+    between shards, False as soon as a shard process died.
+
+    A single round of reports is not enough (a shard may report idle just before a
+    URL sent to it arrives), so this is the four-counter method: all shards idle with
+    sent == received, then a second round of reports, all sent after the first
+    round was complete, with the same totals.
+    """
+    latest = {}
+    first_round = None   # (sent, received, time the round was complete)
+    while True:
+        try:
+            index, seq, sent_at, idle, sent, received = status_queue.get(timeout=REPORT_INTERVAL)
+            latest[index] = (sent_at, idle, sent, received)
+        except queue.Empty:
+            pass
+
+        dead = [p for p in processes if not p.is_alive()]
+        if dead:
+            if logger:
+                logger.error(f"Shard process {dead[0].name} exited with code {dead[0].exitcode}, stopping the crawl")
+            return False
+
+        if len(latest) < count or not all(idle for _, idle, _, _ in latest.values()):
+            first_round = None
+            continue
+        total_sent = sum(sent for _, _, sent, _ in latest.values())
+        total_received = sum(received for _, _, _, received in latest.values())
+        if total_sent != total_received:
+            first_round = None
+            continue
+
+        if first_round is None or first_round[:2] != (total_sent, total_received):
+            first_round = (total_sent, total_received, time.time())
+        elif all(sent_at > first_round[2] for sent_at, _, _, _ in latest.values()):
+            return True
+
+
+#Def merge_shard
+def merge_shard(conn, shard_path):
+    """
+    Merge one shard database into the main one in a single transaction. URL ids differ
+    between databases, so rows are re-keyed through the URL names. A URL known to several
+    shards (as a link target) keeps the non-null fields of the shard that fetched it.
+    Re-merging the same shard is harmless. Returns the number of URLs merged.
+    TermStats is not merged: it is recounted once every shard is in (search.rebuild_term_stats).
+    """
+    cur = conn.cursor()
+    cur.execute('ATTACH DATABASE ? AS shard', (shard_path,))
+    try:
+        cur.execute('BEGIN')
+        cur.execute('''
+            INSERT INTO main.Urls (name, date, content_hash, changer, etag, last_modified, change_interval, next_visit, simhash)
+            SELECT name, date, content_hash, changer, etag, last_modified, change_interval, next_visit, simhash
+            FROM shard.Urls WHERE true
+            ON CONFLICT (name) DO UPDATE SET
+                date = COALESCE(excluded.date, date),
+                content_hash = COALESCE(excluded.content_hash, content_hash),
+                changer = MAX(COALESCE(excluded.changer, 0), COALESCE(changer, 0)),
+                etag = COALESCE(excluded.etag, etag),
+                last_modified = COALESCE(excluded.last_modified, last_modified),
+                change_interval = COALESCE(excluded.change_interval, change_interval),
+                next_visit = COALESCE(excluded.next_visit, next_visit),
+                simhash = COALESCE(excluded.simhash, simhash)
+            ''')
+        merged = cur.rowcount
+
+        cur.execute('CREATE TEMP TABLE shard_ids (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)')
+        cur.execute('''
+            INSERT INTO shard_ids (old, new)
+            SELECT s.id, m.id FROM shard.Urls s JOIN main.Urls m ON m.name = s.name
+            ''')
+
+        cur.execute('''
+            INSERT OR IGNORE INTO main.Links (from_id, to_id)
+            SELECT f.new, t.new FROM shard.Links l
+            JOIN shard_ids f ON f.old = l.from_id
+            JOIN shard_ids t ON t.old = l.to_id
+            ''')
+        cur.execute('''
+            INSERT INTO main.Products (url_id, title, price, stock, rating, image_url)
+            SELECT i.new, p.title, p.price, p.stock, p.rating, p.image_url
+            FROM shard.Products p JOIN shard_ids i ON i.old = p.url_id WHERE true
+            ON CONFLICT (title, url_id) DO UPDATE SET
+                price = excluded.price, stock = excluded.stock,
+                rating = excluded.rating, image_url = excluded.image_url
+            ''')
+        cur.execute('''
+            INSERT OR IGNORE INTO main.Category (url_id, name)
+            SELECT i.new, c.name FROM shard.Category c JOIN shard_ids i ON i.old = c.url_id
+            ''')
+        cur.execute('''
+            INSERT OR REPLACE INTO main.PageKeywords (url_id, keyword, count, score)
+            SELECT i.new, k.keyword, k.count, k.score FROM shard.PageKeywords k JOIN shard_ids i ON i.old = k.url_id
+            ''')
+        cur.execute('''
+            INSERT OR REPLACE INTO main.PageText (rowid, text)
+            SELECT i.new, t.text FROM shard.PageText t JOIN shard_ids i ON i.old = t.rowid
+            ''')
+        cur.execute('''
+            INSERT OR REPLACE INTO main.Aliases (url_id, canonical_id)
+            SELECT u.new, c.new FROM shard.Aliases a
+            JOIN shard_ids u ON u.old = a.url_id
+            JOIN shard_ids c ON c.old = a.canonical_id
+            ''')
+        cur.execute('''
+            INSERT INTO main.RenderRoutes (host, prefix, static_ok, dynamic_needed)
+            SELECT host, prefix, static_ok, dynamic_needed FROM shard.RenderRoutes WHERE true
+            ON CONFLICT (host, prefix) DO UPDATE SET
+                static_ok = MAX(static_ok, excluded.static_ok),
+                dynamic_needed = MAX(dynamic_needed, excluded.dynamic_needed)
+            ''')
+        cur.execute('DROP TABLE temp.shard_ids')
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute('DETACH DATABASE shard')
+    return merged
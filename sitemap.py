@@ -0,0 +1,195 @@
+import asyncio
+import collections
+import time
+import zlib
+import xml.etree.ElementTree as ET
+
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from db import open_writer_connection, upsert_url_ids
+from parse import is_allowed_domain, normalize_url, url_allowed
+
+
+# Sitemap files (indexes included) read per crawl at most
+MAX_SITEMAPS = 1000
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+#Def local_name
+def local_name(tag):
+    """Tag name without its XML namespace ("{ns}loc" -> "loc")."""
+    return tag.rsplit("}", 1)[-1]
+
+#Def parse_lastmod
+def parse_lastmod(value):
+    """Return a W3C datetime (or plain date) from <lastmod> as a UTC timestamp, or None."""
+    if not value:
+        return None
+    value = value.strip().replace("Z", "+00:00")
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+#Def lastmod_priority
+def lastmod_priority(lastmod):
+    """Frontier priority hint from a lastmod timestamp: recently changed pages first, in (0, 1]."""
+    if lastmod is None:
+        return 0.0
+    age_days = max(0.0, (time.time() - lastmod) / 86400)
+    return 1.0 / (1.0 + age_days)
+
+
+class SitemapStream:
+    """
+    Incremental sitemap reader: feed it raw (optionally gzipped) bytes chunk by chunk and
+    collect <url> entries and nested <sitemap> locations as they complete. Parsed elements
+    are cleared right away, so memory stays flat whatever the file size.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+        self._inflater = None
+        self._started = False
+        self.urls = []          # (loc, lastmod timestamp or None)
+        self.sitemaps = []      # nested sitemap locations (sitemap index)
+
+    def feed(self, chunk):
+        if not self._started:
+            self._started = True
+            if chunk.startswith(GZIP_MAGIC):
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._inflater is not None:
+            chunk = self._inflater.decompress(chunk)
+        self._parser.feed(chunk)
+        self._collect()
+
+    def close(self):
+        if self._inflater is not None:
+            self._parser.feed(self._inflater.flush())
+        self._parser.close()
+        self._collect()
+
+    def _collect(self):
+        for _, elem in self._parser.read_events():
+            name = local_name(elem.tag)
+            if name not in ("url", "sitemap"):
+                continue
+            loc = lastmod = None
+            for child in elem:
+                child_name = local_name(child.tag)
+                if child_name == "loc":
+                    loc = (child.text or "").strip()
+                elif child_name == "lastmod":
+                    lastmod = parse_lastmod(child.text)
+            if loc:
+                if name == "url":
+                    self.urls.append((loc, lastmod))
+                else:
+                    self.sitemaps.append(loc)
+            elem.clear()
+
+    def drain(self):
+        """Return and forget the <url> entries parsed so far."""
+        urls, self.urls = self.urls, []
+        return urls
+
+
+#Def sitemap_sources
+async def sitemap_sources(ctx):
+    """Sitemap URLs listed in config plus those announced by the seed host's robots.txt."""
+    sources = list(ctx.rules.get("sitemap_urls", []))
+    if ctx.robots is not None:
+        rules = await ctx.robots.get(ctx.seed_url)
+        sources.extend(rules.sitemaps)
+    return list(dict.fromkeys(sources))
+
+#Def insert_seed_urls
+def insert_seed_urls(conn, urls):
+    """Insert sitemap URLs into Urls in one transaction. Runs in a thread."""
+    upsert_url_ids(conn.cursor(), urls)
+    conn.commit()
+
+#Def seed_from_sitemaps
+async def seed_from_sitemaps(ctx, session, url_queue):
+    """
+    Stream every sitemap (and the sitemaps nested in sitemap indexes) and bulk-add
+    its URLs to Urls and the frontier at depth 0, scored with their lastmod.
+    Runs next to the workers, so crawling starts while large sitemaps are still read.
+    Returns the number of URLs queued.
+    """
+    max_urls = ctx.rules.get("sitemap_max_urls", 100_000)
+    batch_size = ctx.rules["frontier_batch_size"]
+    file_types = ctx.rules.get("file_type_filters", ())
+
+    pending = collections.deque(await sitemap_sources(ctx))
+    visited = set()
+    queued = 0
+    conn = open_writer_connection(ctx.db["path"], ctx.db["wal"])
+
+    async def flush(entries):
+        nonlocal queued
+        batch = []
+        for loc, lastmod in entries:
+            url = normalize_url(loc)
+            if queued + len(batch) >= max_urls:
+                break
+            if not is_allowed_domain(url, ctx.rules["base_domain"]):
+                continue
+            if not url_allowed(url, ctx.rules["include_paths"], ctx.rules["exclude_regexes"]):
+                continue
+            if urlparse(url).path.lower().endswith(file_types):
+                continue
+            if not ctx.seen.add(url):
+                continue
+            priority = ctx.scorer.priority(url, 0, lastmod)
+            if ctx.shards is not None and not ctx.shards.owns(url):
+                ctx.shards.send(url, 0, priority)
+                queued += 1
+            else:
+                batch.append((url, priority))
+        if not batch:
+            return
+        await asyncio.to_thread(insert_seed_urls, conn, [url for url, _ in batch])
+        for url, priority in batch:
+            await url_queue.put((url, 0), priority=priority)
+        queued += len(batch)
+
+    try:
+        while pending and len(visited) < MAX_SITEMAPS and queued < max_urls:
+            sitemap_url = pending.popleft()
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+
+            stream = SitemapStream()
+            try:
+                async with session.get(sitemap_url) as response:
+                    if response.status != 200:
+                        ctx.logger.info(f"Sitemap {sitemap_url}: HTTP {response.status}")
+                        continue
+                    async for chunk in response.content.iter_chunked(65536):
+                        stream.feed(chunk)
+                        if len(stream.urls) >= batch_size:
+                            await flush(stream.drain())
+                        if queued >= max_urls:
+                            break
+                    else:
+                        stream.close()
+            except (ET.ParseError, zlib.error) as e:
+                ctx.error_logger.error(f"Malformed sitemap {sitemap_url}: {e}")
+            except Exception as e:
+                ctx.error_logger.error(f"Could not read sitemap {sitemap_url}: {e}")
+
+            await flush(stream.drain())
+            pending.extend(stream.sitemaps)
+            ctx.logger.info(f"Sitemap {sitemap_url}: {queued} URLs queued so far, {len(stream.sitemaps)} nested sitemaps")
+    finally:
+        conn.close()
+
+    return queued
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import db_initialization
+from frontier import Frontier
+
+
+URLS = [f"http://example.com/page/{i}" for i in range(200)]
+
+
+def make_db(tmp_path, urls):
+    """A crawl database whose frontier holds `urls`, all queued."""
+    db = db_initialization(str(tmp_path / "crawl.sqlite"))
+    db["conn"].executemany('INSERT INTO Frontier (url) VALUES (?)', [(url,) for url in urls])
+    db["conn"].commit()
+    return db
+
+
+def states(db):
+    return dict(db["conn"].execute('SELECT state, COUNT(*) FROM Frontier GROUP BY state').fetchall())
+
+
+async def consume(frontier, taken, limit=None):
+    """Take URLs and mark them done, like a worker; stop after `limit` URLs (then hold them, unfinished)."""
+    while limit is None or len(taken) < limit:
+        url, _ = await frontier.get()
+        taken.append((time.monotonic(), url))
+        if limit is None:
+            await asyncio.sleep(0.001)
+            frontier.task_done(url)
+
+
+async def crash(frontier):
+    """Stop an instance the way a killed process does: no heartbeat, no lease release."""
+    frontier._refill_task.cancel()
+    await asyncio.gather(frontier._refill_task, return_exceptions=True)
+    frontier.conn.close()
+
+
+async def finish(frontier, workers, timeout=10):
+    await asyncio.wait_for(frontier.join(), timeout)
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await frontier.close()
+
+
+def test_two_instances_never_claim_the_same_url(tmp_path):
+    db = make_db(tmp_path, URLS)
+
+    async def run():
+        instances = [Frontier(db, hot_size=20, batch_size=10, owner=f"instance-{i}") for i in range(2)]
+        taken = [[], []]
+        workers = []
+        for frontier, urls in zip(instances, taken):
+            frontier.open()
+            frontier.start()
+            workers += [asyncio.create_task(consume(frontier, urls)) for _ in range(3)]
+        await asyncio.wait_for(asyncio.gather(*(frontier.join() for frontier in instances)), 20)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for frontier in instances:
+            await frontier.close()
+        return [{url for _, url in urls} for urls in taken], [len(urls) for urls in taken]
+
+    (first, second), counts = asyncio.run(run())
+    assert not first & second
+    assert first | second == set(URLS)
+    assert counts == [len(first), len(second)]
+    assert all(counts)
+    assert states(db) == {2: len(URLS)}
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    db = make_db(tmp_path, URLS[:20])
+    lease = 0.5
+
+    async def run():
+        crashed = Frontier(db, hot_size=10, batch_size=10, owner="crashed", lease_seconds=lease)
+        crashed.open()
+        crashed.start()
+        held = []
+        await asyncio.wait_for(consume(crashed, held, limit=3), 5)
+        await crash(crashed)
+        crashed_at = time.monotonic()
+        claimed = {url for url, in db["conn"].execute("SELECT url FROM Frontier WHERE owner = 'crashed'")}
+
+        survivor = Frontier(db, hot_size=10, batch_size=10, owner="survivor", lease_seconds=lease)
+        survivor.open()
+        survivor.start()
+        taken = []
+        await finish(survivor, [asyncio.create_task(consume(survivor, taken))])
+        return crashed_at, claimed, taken
+
+    crashed_at, claimed, taken = asyncio.run(run())
+    assert len(claimed) == 10
+    assert {url for _, url in taken} == set(URLS[:20])
+    # The crashed instance's URLs only came back once its lease ran out
+    assert min(at for at, url in taken if url in claimed) >= crashed_at + lease * 0.9
+    assert states(db) == {2: 20}
+
+
+def test_restart_with_same_instance_id_reclaims_its_urls_at_once(tmp_path):
+    db = make_db(tmp_path, URLS[:20])
+
+    async def run():
+        first = Frontier(db, hot_size=10, batch_size=10, owner="node-1", lease_seconds=3600)
+        first.open()
+        first.start()
+        await asyncio.wait_for(consume(first, [], limit=3), 5)
+        await crash(first)
+
+        # Another instance leaves the live lease alone
+        other = Frontier(db, hot_size=10, batch_size=10, owner="node-2", lease_seconds=3600)
+        other.open()
+        held_by_node_1 = db["conn"].execute("SELECT COUNT(*) FROM Frontier WHERE owner = 'node-1'").fetchone()[0]
+        other.conn.close()
+
+        restarted = Frontier(db, hot_size=10, batch_size=10, owner="node-1", lease_seconds=3600)
+        unfinished = restarted.open()
+        restarted.start()
+        taken = []
+        started = time.monotonic()
+        await finish(restarted, [asyncio.create_task(consume(restarted, taken))])
+        return held_by_node_1, unfinished, taken, time.monotonic() - started
+
+    held_by_node_1, unfinished, taken, seconds = asyncio.run(run())
+    assert held_by_node_1 == 10
+    assert unfinished == 20
+    assert {url for _, url in taken} == set(URLS[:20])
+    assert seconds < 5
+    assert states(db) == {2: 20}
@@ -0,0 +1,27 @@
+import asyncio
+import logging
+import os
+import socket
+import sys
+
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics, start_metrics_server
+
+
+def test_port_in_use_leaves_the_crawl_without_endpoint(caplog):
+    taken = socket.socket()
+    taken.bind(("127.0.0.1", 0))
+    taken.listen()
+    port = taken.getsockname()[1]
+    ctx = SimpleNamespace(metrics=Metrics(), logger=logging.getLogger("test"), error_logger=logging.getLogger("test"))
+    try:
+        with caplog.at_level(logging.ERROR):
+            runner = asyncio.run(start_metrics_server(ctx, "127.0.0.1", port))
+    finally:
+        taken.close()
+
+    assert runner is None
+    assert f"127.0.0.1:{port} unavailable" in caplog.text
@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from neardup import MIN_WORDS, SimHashIndex, from_signed, page_fingerprint, simhash, to_signed
+
+
+def text(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(f"word{rng.randrange(2000)}" for _ in range(words))
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def flip(fingerprint, *bits):
+    for bit in bits:
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def test_identical_text_has_the_same_fingerprint():
+    page = text(1)
+    assert simhash(page) == simhash(page)
+    # Markup, scripts and case don't count, only the visible words
+    html = f"<html><script>var x = 1;</script><body><p>{page.upper()}</p><!-- note --></body></html>"
+    assert page_fingerprint(html)[0] == simhash(page)
+
+
+def test_small_edit_is_close_and_other_text_is_far():
+    words = text(1).split()
+    edited = words[:150] + ["changed"] + words[151:]
+    assert distance(simhash(" ".join(words)), simhash(" ".join(edited))) <= 3
+    assert distance(simhash(" ".join(words)), simhash(text(2))) > 10
+
+
+def test_short_text_has_no_fingerprint():
+    assert simhash(text(1, words=MIN_WORDS - 1)) is None
+    assert page_fingerprint("<p>Not found</p>") == (None, len("Not found"))
+
+
+def test_index_finds_pages_within_max_distance():
+    index = SimHashIndex(max_distance=3)
+    original = simhash(text(1))
+    index.add("a", original)
+
+    assert index.find("b", original) == "a"
+    # 3 flipped bits leave one of the 4 bands intact, a 4th is beyond max_distance
+    assert index.find("b", flip(original, 0, 20, 40)) == "a"
+    assert index.find("b", flip(original, 0, 20, 40, 60)) is None
+    assert index.find("b", flip(original, 0, 1, 2, 3)) is None
+    # A page is never its own duplicate
+    assert index.find("a", original) is None
+
+
+def test_index_returns_the_closest_page():
+    index = SimHashIndex(max_distance=3)
+    original = simhash(text(1))
+    index.add("far", flip(original, 1, 2, 3))
+    index.add("near", flip(original, 1))
+    assert index.find("b", original) == "near"
+
+
+def test_check_indexes_originals_only():
+    index = SimHashIndex(max_distance=3)
+    original = simhash(text(1))
+    assert index.check("a", original) is None
+    assert index.check("b", flip(original, 5)) == "a"
+    assert len(index) == 1
+
+    assert index.check("c", simhash(text(2)), index=False) is None
+    assert len(index) == 1
+
+
+def test_remove_and_replace():
+    index = SimHashIndex(max_distance=3)
+    original = simhash(text(1))
+    index.add("a", original)
+    index.add("a", simhash(text(2)))
+    assert len(index) == 1
+    assert index.find("b", original) is None
+
+    index.remove("a")
+    index.remove("missing")
+    assert len(index) == 0
+    assert all(not table for table in index._tables)
+
+
+def test_signed_round_trip():
+    for fingerprint in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1, simhash(text(1))):
+        value = to_signed(fingerprint)
+        assert -(1 << 63) <= value < 1 << 63
+        assert from_signed(value) == fingerprint
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fetch_utility
+
+from fetch_utility import FetchResult, fetch_url
+from render_router import RenderRouter
+
+
+URL = "http://example.com/shop/item-{}.html"
+
+
+class FakeSite:
+    """A site whose pages need the browser until `static_works` is set; counts the fetches of each kind."""
+
+    def __init__(self):
+        self.static_works = False
+        self.static_fetches = 0
+        self.renders = 0
+
+    async def fetch_static(self, ctx, session, url):
+        self.static_fetches += 1
+        return FetchResult(url, 200, "full" if self.static_works else "shell")
+
+    async def fetch_dynamic(self, ctx, url):
+        self.renders += 1
+        return "full"
+
+    async def analyze_html(self, ctx, url, html, redirected=False):
+        return SimpleNamespace(html_length=len(html), text_length=1000 if html == "full" else 0)
+
+
+def crawl(monkeypatch, site, router, count, start=0):
+    """fetch_url `count` URLs of one prefix with the site's fetchers patched in."""
+    monkeypatch.setattr(fetch_utility, "fetch_static", site.fetch_static)
+    monkeypatch.setattr(fetch_utility, "fetch_dynamic", site.fetch_dynamic)
+    monkeypatch.setattr(fetch_utility, "analyze_html", site.analyze_html)
+    ctx = SimpleNamespace(use_playwright=True, browser_pool=object(), render_router=router, revisits={})
+
+    async def run():
+        for i in range(start, start + count):
+            fetch, page = await fetch_url(ctx, None, URL.format(i))
+            assert page is not None
+
+    asyncio.run(run())
+
+
+def test_prefix_is_learned_as_dynamic(monkeypatch):
+    site, router = FakeSite(), RenderRouter(min_samples=3, probe_every=1000)
+    crawl(monkeypatch, site, router, 3)
+    assert router.decide(URL.format(99)) == RenderRouter.DYNAMIC
+
+    # Routed straight to the browser: no static round-trip
+    site.static_fetches = 0
+    crawl(monkeypatch, site, router, 9, start=3)
+    assert site.static_fetches == 0
+
+
+def test_routed_renders_do_not_count_as_needing_the_browser(monkeypatch):
+    site, router = FakeSite(), RenderRouter(min_samples=3, probe_every=1000)
+    crawl(monkeypatch, site, router, 3)
+    crawl(monkeypatch, site, router, 100, start=3)
+    assert router._stats[("example.com", "/shop")] == [0, 3]
+
+
+def test_prefix_turns_static_again(monkeypatch):
+    site, router = FakeSite(), RenderRouter(min_samples=3, probe_every=10)
+    crawl(monkeypatch, site, router, 20)
+    assert router.decide(URL.format(99)) == RenderRouter.DYNAMIC
+
+    # The site stops needing JavaScript: probes notice, and the prefix goes back to static
+    site.static_works = True
+    crawl(monkeypatch, site, router, 100, start=20)
+    assert router.decide(URL.format(99)) == RenderRouter.STATIC
+
+    site.renders = 0
+    crawl(monkeypatch, site, router, 20, start=120)
+    assert site.renders == 0
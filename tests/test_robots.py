@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from robots import MAX_ROBOTS_BYTES, RobotsCache, RobotsRules, parse_robots
+
+
+USER_AGENT = "TestCrawler/1.0"
+
+
+def rules(*lines):
+    """RobotsRules for USER_AGENT from robots.txt lines."""
+    return parse_robots("\n".join(lines), USER_AGENT)
+
+
+def serve_robots(text):
+    """Fetch `text` as the robots.txt of a local server through a RobotsCache; returns the RobotsRules."""
+    async def run():
+        async def robots(request):
+            return web.Response(text=text)
+
+        app = web.Application()
+        app.router.add_get("/robots.txt", robots)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await RobotsCache(session, USER_AGENT).get(f"http://127.0.0.1:{port}/")
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_rules_past_the_first_read_are_kept():
+    # Far more than one network read; the rule at the end must still apply
+    text = "User-agent: *\n" + "# padding line\n" * 12_000 + "Disallow: /private/\n"
+    assert 64 * 1024 < len(text) < MAX_ROBOTS_BYTES
+
+    rules = serve_robots(text)
+    assert not rules.can_fetch("http://example.com/private/x")
+    assert rules.can_fetch("http://example.com/public/x")
+
+
+def test_rules_past_the_cap_are_ignored():
+    text = "User-agent: *\nDisallow: /early/\n" + "#" * MAX_ROBOTS_BYTES + "\nDisallow: /late/\n"
+
+    rules = serve_robots(text)
+    assert not rules.can_fetch("http://example.com/early/x")
+    assert rules.can_fetch("http://example.com/late/x")
+
+
+def test_longest_match_wins():
+    robots = rules("User-agent: *", "Disallow: /shop", "Allow: /shop/public")
+    assert not robots.can_fetch("http://example.com/shop/cart")
+    assert robots.can_fetch("http://example.com/shop/public/item")
+    assert robots.can_fetch("http://example.com/about")
+
+
+def test_allow_wins_a_tie():
+    robots = rules("User-agent: *", "Disallow: /page", "Allow: /page")
+    assert robots.can_fetch("http://example.com/page")
+
+
+def test_wildcards_and_end_anchor():
+    robots = rules("User-agent: *", "Disallow: /*.pdf$", "Disallow: /*?sort=", "Allow: /docs/*/public")
+    assert not robots.can_fetch("http://example.com/docs/report.pdf")
+    assert robots.can_fetch("http://example.com/docs/report.pdf?page=2")
+    assert not robots.can_fetch("http://example.com/list?sort=price")
+    assert robots.can_fetch("http://example.com/list?page=2")
+    assert robots.can_fetch("http://example.com/docs/a/public/report.pdf")
+
+
+def test_wildcard_rule_loses_to_a_longer_prefix_rule():
+    robots = rules("User-agent: *", "Disallow: /*/private", "Allow: /team/private/shared")
+    assert not robots.can_fetch("http://example.com/team/private/notes")
+    assert robots.can_fetch("http://example.com/team/private/shared/notes")
+
+
+def test_percent_encoding_is_normalized():
+    robots = rules("User-agent: *", "Disallow: /caf%c3%a9")
+    assert not robots.can_fetch("http://example.com/caf\u00e9/menu")
+    assert not robots.can_fetch("http://example.com/caf%C3%A9/menu")
+
+
+def test_most_specific_user_agent_group_applies():
+    robots = rules(
+        "User-agent: *", "Disallow: /", "Crawl-delay: 10",
+        "", "User-agent: testcrawler", "Disallow: /private/", "Crawl-delay: 2",
+        "", "Sitemap: http://example.com/sitemap.xml",
+    )
+    assert robots.can_fetch("http://example.com/page")
+    assert not robots.can_fetch("http://example.com/private/page")
+    assert robots.crawl_delay == 2.0
+    assert robots.sitemaps == ["http://example.com/sitemap.xml"]
+
+
+def test_other_agents_groups_are_ignored():
+    robots = rules("User-agent: otherbot", "Disallow: /")
+    assert robots.can_fetch("http://example.com/page")
+    assert robots.crawl_delay is None
+
+
+def test_empty_disallow_and_robots_txt_itself_are_allowed():
+    assert rules("User-agent: *", "Disallow:").can_fetch("http://example.com/page")
+    assert RobotsRules.disallow_all().can_fetch("http://example.com/robots.txt")
+    assert not RobotsRules.disallow_all().can_fetch("http://example.com/page")
+
+
+def test_memoized_answers_match_fresh_ones():
+    robots = parse_robots("User-agent: *\nDisallow: /a\nAllow: /a/b", USER_AGENT, memo_size=2)
+    urls = ["http://example.com/a/x", "http://example.com/a/b", "http://example.com/c"] * 3
+    assert [robots.can_fetch(url) for url in urls] == [False, True, True] * 3
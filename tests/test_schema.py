@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import SCHEMA_VERSION, migrate
+from export_utilities import QUERY_EXPORT, SINCE_FILTER
+from recrawl import QUERY_DUE
+
+
+# The schema as the first release created it (user_version 0, ISO dates, rowid tables, no indexes)
+BASELINE_SCHEMA = '''
+CREATE TABLE Urls (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,
+    date TEXT,
+    content_hash TEXT,
+    changer INTEGER DEFAULT 0
+);
+CREATE TABLE Links (
+    from_id INTEGER,
+    to_id INTEGER,
+    PRIMARY KEY (from_id, to_id)
+);
+CREATE TABLE Category (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_id INTEGER,
+    name TEXT,
+    UNIQUE(name, url_id)
+);
+CREATE TABLE PageKeywords (
+    url_id INTEGER,
+    keyword TEXT,
+    count INTEGER,
+    PRIMARY KEY (url_id, keyword)
+);
+CREATE TABLE Products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_id INTEGER,
+    title TEXT,
+    price REAL,
+    stock INTEGER,
+    rating TEXT,
+    image_url TEXT,
+    UNIQUE(title, url_id)
+);
+'''
+
+
+@pytest.fixture
+def conn():
+    """A baseline-schema database with a few crawled pages, migrated to the current version."""
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO Urls (id, name, date) VALUES (?, ?, ?)', [
+        (1, 'https://example.com/', '2024-01-01T00:00:00'),
+        (2, 'https://example.com/a', '2024-01-02T00:00:00'),
+        (3, 'https://example.com/b', None),
+    ])
+    conn.executemany('INSERT INTO Links (from_id, to_id) VALUES (?, ?)', [(1, 2), (1, 3), (2, 3)])
+    conn.execute("INSERT INTO Products (url_id, title, price, stock, rating) VALUES (2, 'A', 1.0, 1, 'Three')")
+    conn.execute("INSERT INTO Category (url_id, name) VALUES (2, 'Books')")
+    conn.commit()
+
+    assert migrate(conn) == 0
+    yield conn
+    conn.close()
+
+
+def plan(conn, query, params=()):
+    """The EXPLAIN QUERY PLAN details of `query`, joined into one string."""
+    return '\n'.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params))
+
+
+def test_migrates_to_current_version(conn):
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute('SELECT date FROM Urls WHERE id = 1').fetchone()[0] == 1704067200
+
+
+def test_resume_uses_unfinished_index(conn):
+    assert 'idx_urls_unfinished' in plan(conn, 'SELECT name FROM Urls WHERE date IS NULL')
+
+
+def test_reverse_links_use_to_id_index(conn):
+    assert 'idx_links_to_id' in plan(conn, 'SELECT from_id FROM Links WHERE to_id = ?', (3,))
+
+
+def test_recrawl_uses_next_visit_index(conn):
+    detail = plan(conn, QUERY_DUE, (0,))
+    assert 'idx_urls_next_visit' in detail
+    assert 'SCAN Urls' not in detail
+
+
+@pytest.mark.parametrize('where, params', [('', ()), (SINCE_FILTER, (0,))])
+def test_export_uses_products_index(conn, where, params):
+    assert 'idx_products_url_id' in plan(conn, QUERY_EXPORT.format(where=where), params)
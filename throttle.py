@@ -0,0 +1,181 @@
+import asyncio
+import collections
+import email.utils
+import time
+
+
+# Responses that mean "slow down"
+THROTTLE_STATUSES = (429, 503)
+
+# A p95 rise must also exceed this many seconds to count: milliseconds of jitter on a fast host are not a slowdown
+MIN_LATENCY_GAP = 0.05
+
+# Measurement windows in a row the p95 must stay high before the limit is cut
+SLOW_WINDOWS = 3
+
+# Weight of a healthy window's p95 in the latency baseline (the baseline drops to a lower p95 at once)
+BASELINE_DECAY = 0.2
+
+
+#Def parse_retry_after
+def parse_retry_after(value):
+    """Return the seconds asked for by a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one host, used as `async with limiter:` like a semaphore.
+
+    Every `eval_every` responses the limit grows by one while p95 latency and the
+    error rate stay healthy. It is halved right away on 429/503 or a timeout, and
+    also when p95 latency stays above `latency_factor` times the baseline, and at
+    least `min_latency_gap` seconds above it, for `slow_windows` windows in a row.
+    The baseline follows the p95 of healthy windows (at once when it drops, slowly
+    when it rises), so one lucky window doesn't set the bar for the whole crawl.
+    """
+
+    def __init__(self, host, initial=2, min_limit=1, max_limit=16, latency_factor=2.0,
+                 min_latency_gap=MIN_LATENCY_GAP, slow_windows=SLOW_WINDOWS,
+                 max_error_rate=0.1, eval_every=20, logger=None):
+        self.host = host
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_factor = latency_factor
+        self.min_latency_gap = min_latency_gap
+        self.slow_windows = slow_windows
+        self.max_error_rate = max_error_rate
+        self.eval_every = eval_every
+        self.logger = logger
+
+        self.in_flight = 0
+        self.reason = "initial"
+        self.history = collections.deque(maxlen=20)
+        self._cond = asyncio.Condition()
+        self._latencies = []
+        self._errors = 0
+        self._baseline_p95 = None
+        self._slow_count = 0
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def p95(self):
+        """95th percentile latency of the responses since the last limit change."""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def record(self, latency=None, status=None, error=None):
+        """Feed one response (latency and status) or one failure (error) into the controller."""
+        if error is not None or status in THROTTLE_STATUSES:
+            self._errors += 1
+            if status in THROTTLE_STATUSES or isinstance(error, asyncio.TimeoutError):
+                self._decrease(f"HTTP {status}" if status else "timeout")
+                return
+
+        if latency is not None:
+            self._latencies.append(latency)
+
+        samples = len(self._latencies) + self._errors
+        if samples < self.eval_every:
+            return
+
+        p95 = self.p95()
+        error_rate = self._errors / samples
+        baseline = self._baseline_p95
+        slow = (p95 is not None and baseline is not None
+                and p95 > baseline * self.latency_factor and p95 - baseline > self.min_latency_gap)
+        if slow:
+            self._slow_count += 1
+            if self._slow_count >= self.slow_windows:
+                self._decrease(f"p95 latency {p95:.2f}s > {self.latency_factor}x baseline {baseline:.2f}s "
+                               f"for {self._slow_count} windows")
+            else:
+                self._new_window()
+        elif error_rate > self.max_error_rate:
+            self._decrease(f"error rate {error_rate:.0%}")
+        else:
+            if p95 is not None:
+                self._update_baseline(p95)
+            self._set_limit(self.limit + 1, f"healthy (p95 {p95:.2f}s, errors {error_rate:.0%})" if p95 is not None else "healthy")
+
+    def _update_baseline(self, p95):
+        """Drop to a lower p95 at once, drift towards a higher one (so the baseline recovers after a lucky window)."""
+        if self._baseline_p95 is None or p95 < self._baseline_p95:
+            self._baseline_p95 = p95
+        else:
+            self._baseline_p95 += BASELINE_DECAY * (p95 - self._baseline_p95)
+
+    def _decrease(self, reason):
+        self._set_limit(max(self.min_limit, self.limit // 2), reason)
+
+    def _new_window(self):
+        self._latencies = []
+        self._errors = 0
+
+    def _set_limit(self, limit, reason):
+        """Apply a new limit and start a fresh measurement window."""
+        self._new_window()
+        self._slow_count = 0
+        limit = max(self.min_limit, min(self.max_limit, limit))
+        if limit == self.limit:
+            return
+
+        if self.logger:
+            self.logger.info(f"Concurrency for {self.host}: {self.limit} -> {limit} ({reason})")
+        self.history.append((time.time(), self.limit, limit, reason))
+        self.limit = limit
+        self.reason = reason
+
+        # Wake waiters when the limit grew
+        asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Current state of the controller, for logs and metrics."""
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "p95": self.p95(),
+            "reason": self.reason,
+        }
+
+
+class HostLimiters(dict):
+    """Lazily created AdaptiveLimiter per host."""
+
+    def __init__(self, **limiter_options):
+        super().__init__()
+        self.limiter_options = limiter_options
+
+    def __missing__(self, host):
+        limiter = AdaptiveLimiter(host, **self.limiter_options)
+        self[host] = limiter
+        return limiter
+
+    def snapshot(self):
+        """Current limit, in-flight count, p95 and last change reason for every host."""
+        return {host: limiter.snapshot() for host, limiter in self.items()}